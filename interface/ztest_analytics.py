@@ -0,0 +1,135 @@
+import math
+import os
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from analytics import QUERIES, MetricAnalytics
+from backend import open_database
+
+# Runs each predefined query both in the database and with the NumPy analytics
+# engine, and reports whether the results match. Uses the database configured in
+# config.ini and first seeds a fixed set of metric, plan and value rows, so run
+# it against a copy. A query that returns no rows or cannot be run in the
+# database fails.
+
+SQL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sql", "predefined_queries.sql")
+
+def predefined_queries(path):
+
+    with open(path, encoding = "utf-8", errors = "replace") as sql_file:
+        text = sql_file.read()
+
+    # Each query follows a comment block whose first line is its title.
+
+    comments = list(re.finditer(r"/\*(.*?)\*/", text, re.S))
+
+    queries = {}
+
+    for comment, following in zip(comments, comments[1:] + [None]):
+        sql = text[comment.end():following.start() if following else len(text)].strip()
+
+        lines = [line.strip() for line in comment.group(1).splitlines() if line.strip()]
+
+        if sql and lines:
+            queries[lines[0]] = sql
+
+    return queries
+
+def normalize(value):
+
+    if value is None:
+        return ""
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return round(float(value), 4)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def same(left, right):
+
+    # SQLite averages in floating point, so its rounded averages can be a cent off.
+
+    if isinstance(left, float) and isinstance(right, float):
+        return math.isclose(left, right, rel_tol = 1e-6, abs_tol = 0.01 if db.dialect == "sqlite" else 1e-4)
+    return left == right
+
+def compare(sql_rows, numpy_rows):
+
+    expected = sorted((tuple(normalize(v) for v in row) for row in sql_rows), key = repr)
+
+    actual = sorted((tuple(normalize(v) for v in row) for row in numpy_rows), key = repr)
+
+    if len(expected) != len(actual):
+        return f"{len(expected)} SQL rows, {len(actual)} NumPy rows"
+
+    for left, right in zip(expected, actual):
+        if len(left) != len(right) or not all(same(a, b) for a, b in zip(left, right)):
+            return f"first difference: SQL {left} vs NumPy {right}"
+
+    return None
+
+def seed():
+
+    # Two metrics of weekly values, one with a spike for the z-score query,
+    # and a plan-level metric across four plans for the plan queries. Values
+    # carry cents: SQLite stores whole DECIMAL values as integers and divides
+    # them as integers, unlike MySQL.
+
+    initiative_id = db.insert('initiative', {'initiative_title': 'Analytics test', 'initiative_description': 'Seeded values', 'initiative_owner': 'Owner'})
+
+    metric_ids = [
+        db.insert('metric', {'initiative_id': initiative_id, 'metric_name': f'Analytics test metric {i}', 'metric_definition': 'Test', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+        for i in range(2)
+    ]
+
+    plan_metric_id = db.insert('metric', {'initiative_id': initiative_id, 'metric_name': 'Analytics test plan metric', 'metric_definition': 'Test', 'is_plan_level': 1, 'collection_frequency': 'Weekly'})
+
+    plan_ids = [db.insert('plan', {'plan_name': f'Analytics test plan {i}'}) for i in range(4)]
+
+    db.insert_many('global_metric_value', [
+        {'metric_id': metric_id, 'metric_date': date(2024, 1, 1) + timedelta(weeks = week), 'actual_value': Decimal('500.25') if (m, week) == (0, 20) else Decimal('10.25') + m * 5 + (week * 7) % 11}
+        for m, metric_id in enumerate(metric_ids)
+        for week in range(30)
+    ])
+
+    db.insert_many('plan_metric_value', [
+        {'metric_id': plan_metric_id, 'plan_id': plan_id, 'metric_date': date(2024, 1, 1) + timedelta(weeks = week), 'actual_value': Decimal('20.50') + p * 3 + (week * 5) % 7}
+        for p, plan_id in enumerate(plan_ids)
+        for week in range(8)
+    ])
+
+db = open_database()
+
+seed()
+
+engine = MetricAnalytics(db)
+
+sql_queries = predefined_queries(SQL_FILE)
+
+failed = []
+
+for title in QUERIES:
+    try:
+        sql_rows = db.execute_query(sql_queries[title])
+    except Exception as e:
+        print(f"FAIL  {title}: SQL version failed: {e}")
+        failed.append(title)
+        continue
+
+    numpy_rows = engine.run(title)
+
+    if sql_rows and numpy_rows and list(sql_rows[0].keys()) != list(numpy_rows[0].keys()):
+        print(f"FAIL  {title}: columns {list(sql_rows[0].keys())} vs {list(numpy_rows[0].keys())}")
+        failed.append(title)
+        continue
+
+    difference = compare(sql_rows, numpy_rows) if sql_rows else "no rows returned"
+
+    if difference:
+        failed.append(title)
+
+    print(f"{'FAIL' if difference else 'OK'}    {title} ({len(numpy_rows)} rows){': ' + difference if difference else ''}")
+
+db.close()
+
+assert not failed, f"{len(failed)} of {len(QUERIES)} queries failed"
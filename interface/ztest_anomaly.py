@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase(anomaly_settings = {'threshold': 2, 'min_count': 5})
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+values = [10, 11, 9, 10, 12, 10, 30, 11]
+
+db.insert_many('global_metric_value', [
+    {'metric_id': 1, 'metric_date': date(2024, 1, 1) + timedelta(weeks = i), 'actual_value': value}
+    for i, value in enumerate(values)
+])
+
+print(db.execute_query('SELECT * FROM metric_stats'))
+
+print(db.execute_query('SELECT metric_id, metric_date, actual_value, z_score FROM metric_anomaly'))
+
+db.delete('global_metric_value', {'metric_id': 1, 'actual_value': 30})
+
+print(db.execute_query('SELECT * FROM metric_stats'))
@@ -0,0 +1,38 @@
+from datetime import date
+from decimal import Decimal
+from columnar import ColumnarResult
+from sqlite_backend import SQLiteDatabase
+
+# A numeric column whose first values are integers must widen to float64 when
+# a later value is a float or DECIMAL, in the same chunk or a later one.
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 5, 13), 'actual_value': 12})
+
+db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 5, 20), 'actual_value': 12.5})
+
+for chunk_size in (10000, 1):
+    result = db.query_columnar("SELECT actual_value*1 AS v FROM global_metric_value ORDER BY metric_date", chunk_size = chunk_size)
+    print(chunk_size, result['v'], result['v'].dtype)
+    assert result['v'].tolist() == [12.0, 12.5]
+
+chunks = [[(1, 1)], [(2, 2.5)], [(None, Decimal('3.25'))]]
+
+result = ColumnarResult.from_chunks(['a', 'b'], chunks)
+print(result['a'], result['b'])
+assert result['b'].tolist() == [1.0, 2.5, 3.25]
+
+result = ColumnarResult.from_chunks(['v'], [[(1,)], [(Decimal('2.75'),)]], decimal_mode = 'scaled')
+print(result['v'])
+assert result['v'].tolist() == [100, 275]
+
+result = ColumnarResult.from_chunks(['v'], [[(Decimal('1.50'),)], [(2.25,)]], decimal_mode = 'scaled')
+print(result['v'])
+assert result['v'].tolist() == [1.5, 2.25]
+
+print("OK")
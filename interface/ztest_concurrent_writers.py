@@ -0,0 +1,78 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from backend import open_database
+
+# Several threads write values of the same metric at once, as the writers of
+# import_metrics.py do. The running statistics must match the stored values,
+# and every new key must be counted as inserted exactly once. Uses the database
+# configured in config.ini (MySQL with a connection pool); run it against a copy.
+
+THREADS = 8
+
+db = open_database()
+
+initiative_id = db.insert('initiative', {'initiative_title': 'Concurrency test', 'initiative_description': 'Concurrent writers', 'initiative_owner': 'Owner'})
+
+metric_id = db.insert('metric', {'initiative_id': initiative_id, 'metric_name': 'Concurrency test metric', 'metric_definition': 'Test', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+def write(thread):
+
+    # Each thread inserts its own dates, five rows per transaction.
+
+    for start in range(0, 50, 5):
+        db.insert_many('global_metric_value', [
+            {'metric_id': metric_id, 'metric_date': date(2020, 1, 1) + timedelta(days = thread * 50 + i), 'actual_value': thread * 50 + i}
+            for i in range(start, start + 5)
+        ], batch_size = 5)
+
+def upsert(thread):
+
+    # Every thread upserts the same new keys.
+
+    return db.upsert_many('global_metric_value', [
+        {'metric_id': metric_id, 'metric_date': date(2023, 1, 1) + timedelta(days = i), 'actual_value': 1000 + i}
+        for i in range(20)
+    ], ['metric_id', 'metric_date'], batch_size = 5)
+
+def check():
+
+    values = [float(row['actual_value']) for row in db.execute_query(f"SELECT actual_value FROM global_metric_value WHERE metric_id = {metric_id}")]
+
+    stats = db.execute_query(f"SELECT value_count, mean_value, m2 FROM metric_stats WHERE metric_id = {metric_id} AND plan_id = 0")[0]
+
+    mean = sum(values) / len(values)
+
+    m2 = sum((value - mean) ** 2 for value in values)
+
+    print(len(values), stats['value_count'], mean, stats['mean_value'], m2, stats['m2'])
+
+    assert stats['value_count'] == len(values)
+    assert math.isclose(float(stats['mean_value']), mean, rel_tol = 1e-6)
+    assert math.isclose(float(stats['m2']), m2, rel_tol = 1e-6)
+
+try:
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(write, range(THREADS)))
+
+    check()
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        reports = list(pool.map(upsert, range(THREADS)))
+
+    print([(report['inserted'], report['updated'], report['unchanged'], len(report['failed'])) for report in reports])
+
+    assert sum(report['inserted'] for report in reports) == 20
+    assert not any(report['failed'] for report in reports)
+
+    check()
+
+    print("OK")
+finally:
+    db.delete('metric_anomaly', {'metric_id': metric_id})
+    db.delete('global_metric_value', {'metric_id': metric_id})
+    db.delete('metric_stats', {'metric_id': metric_id})
+    db.delete('metric_rollup', {'metric_id': metric_id})
+    db.delete('metric', {'metric_id': metric_id})
+    db.delete('initiative', {'initiative_id': initiative_id})
+    db.close()
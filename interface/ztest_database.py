@@ -5,6 +5,8 @@ db = Database()
 
 print(db.get_columns('user_query'))
 
+print(db.get_primary_keys('event_plan'))
+
 print(db.fetch_all('user_query'))
 
 print(db.validate_query('SELECT * FROM initiative'))
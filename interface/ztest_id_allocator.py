@@ -0,0 +1,24 @@
+from sqlite_backend import SQLiteDatabase
+
+# Blocks of plan_id values are reserved past keys inserted explicitly, by
+# the importers or another client, above the id_block high-water mark.
+
+db = SQLiteDatabase()
+
+first = db.insert('plan', {'plan_name': 'Allocated'})
+
+print(first, db.execute_query("SELECT * FROM id_block"))
+
+db.insert('plan', {'plan_id': 500, 'plan_name': 'Explicit'})
+
+block = db.reserve_ids('plan', 10)
+
+print(block, db.execute_query("SELECT * FROM id_block"))
+
+assert block > 500
+
+db.insert_many('plan', [{'plan_name': f'Bulk {i}'} for i in range(5)])
+
+print(db.execute_query("SELECT plan_id, plan_name FROM plan ORDER BY plan_id"))
+
+print("OK")
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from import_metrics import MetricFileImporter, _init_parser, convert_row, load_lookup_maps, parse_file
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+metric_id = db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo plan metric', 'metric_definition': 'Demo', 'is_plan_level': 1, 'collection_frequency': 'Weekly'})
+
+plan_ids = [db.insert('plan', {'plan_name': f'Plan {i}'}) for i in range(3)]
+
+lookups = load_lookup_maps(db)
+
+# convert_row resolves names without regard to case and spacing, rounds values
+# to cents and rejects what cannot be loaded.
+
+header = {'metric_name': 0, 'plan_name': 1, 'metric_date': 2, 'actual_value': 3}
+
+print(convert_row([' demo  PLAN metric ', 'plan 0', '03/04/2024', '1,234.565'], header, lookups))
+
+assert convert_row([' demo  PLAN metric ', 'plan 0', '03/04/2024', '1,234.565'], header, lookups) == (
+    {'metric_id': metric_id, 'plan_id': plan_ids[0], 'metric_date': date(2024, 3, 4), 'actual_value': Decimal('1234.57')}, None)
+
+for record, reason in (
+    (['Other metric', 'Plan 0', '2024-03-04', '1'], "unknown metric_name 'Other metric'"),
+    (['Demo plan metric', 'Plan 9', '2024-03-04', '1'], "unknown plan_name 'Plan 9'"),
+    (['Demo plan metric', 'Plan 0', '2024-02-30', '1'], "invalid metric_date '2024-02-30'"),
+    (['Demo plan metric', 'Plan 0', '2024-03-04', '-1'], 'actual_value is negative')
+):
+    assert convert_row(record, header, lookups) == (None, reason), record
+
+# parse_file batches the valid rows and lists the rejected lines.
+
+work_dir = tempfile.mkdtemp()
+
+def write(name, lines):
+
+    path = os.path.join(work_dir, name)
+
+    with open(path, 'w') as csv_file:
+        csv_file.write('metric_name,plan_name,metric_date,actual_value\n' + ''.join(line + '\n' for line in lines))
+
+    return path
+
+def values(plan, weeks, value):
+
+    return [f'Demo plan metric,Plan {plan},{date(2024, 1, 1) + timedelta(weeks = week)},{value}' for week in weeks]
+
+_init_parser(lookups, ('%Y-%m-%d',))
+
+parsed = parse_file(write('parse.csv', values(0, range(5), 1) + ['Demo plan metric,Plan 0,2024-13-01,1']), batch_size = 2)
+
+print(parsed['rows'], [len(batch) for batch in parsed['batches']], parsed['rejects'])
+
+assert [len(batch) for batch in parsed['batches']] == [2, 2, 1] and parsed['rejects'] == [(7, "invalid metric_date '2024-13-01'")]
+
+assert parse_file(os.path.join(work_dir, 'missing.csv'))['error']
+
+# import_files writes files side by side, but a later file sharing keys with
+# an earlier one, such as a corrected re-send, is committed after it.
+
+paths = [
+    write('plan0.csv', values(0, range(200), 1)),
+    write('plan1.csv', values(1, range(200), 1)),
+    write('plan0_corrected.csv', values(0, range(0, 200, 50), 2)),
+    write('plan2.csv', values(2, range(10), 1) + ['Demo plan metric,Plan 2,not a date,1'])
+]
+
+importer = MetricFileImporter(db, workers = 2, writers = 3, batch_size = 10)
+
+reports = importer.import_files(paths)
+
+print([(os.path.basename(report['file']), report['inserted'], report['updated'], report['rejected']) for report in reports])
+
+assert [(report['inserted'], report['updated'], report['rejected']) for report in reports] == [(200, 0, 0), (200, 0, 0), (0, 4, 0), (10, 0, 1)]
+
+rows = db.execute_query(f'SELECT metric_date, actual_value FROM plan_metric_value WHERE plan_id = {plan_ids[0]} ORDER BY metric_date')
+
+assert [row['metric_date'] for row in rows if row['actual_value'] == 2] == [date(2024, 1, 1) + timedelta(weeks = week) for week in range(0, 200, 50)]
+
+shutil.rmtree(work_dir)
+
+print("OK")
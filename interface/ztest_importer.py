@@ -0,0 +1,23 @@
+import os
+import tempfile
+from importer import BulkImporter
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+with tempfile.NamedTemporaryFile('w', suffix = '.csv', delete = False) as csv_file:
+    csv_file.write('metric_id,metric_date,actual_value\n1,2024-05-13,12.50\n1,2024-02-30,4\n2,2024-05-20,3\n1,2024-05-27,-1\n')
+
+importer = BulkImporter(db)
+
+print(importer.import_file('global_metric_value', csv_file.name, validate_only = True))
+
+print(importer.import_file('global_metric_value', csv_file.name))
+
+print(db.fetch_all('global_metric_value'))
+
+os.remove(csv_file.name)
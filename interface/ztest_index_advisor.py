@@ -0,0 +1,22 @@
+from index_advisor import IndexAdvisor, access_patterns, report
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+advisor = IndexAdvisor(db)
+
+schema = advisor.schema()
+
+columns = {table: set(cols) for table, cols in schema['columns'].items()}
+
+print(access_patterns(
+    'SELECT m.metric_name, gmv.metric_date, AVG(gmv.actual_value) OVER (PARTITION BY gmv.metric_id ORDER BY gmv.metric_date) '
+    'FROM metric m JOIN global_metric_value gmv ON m.metric_id = gmv.metric_id WHERE gmv.metric_date >= \'2024-01-01\'',
+    columns
+))
+
+queries, proposals = advisor.advise()
+
+print(len(queries))
+
+print(report(proposals))
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from ingest_daemon import IngestDaemon
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+drop_dir = tempfile.mkdtemp()
+
+def drop(name, start, count):
+
+    with open(os.path.join(drop_dir, name), 'w') as csv_file:
+        csv_file.write('metric_name,metric_date,actual_value\n')
+
+        for i in range(count):
+            csv_file.write(f'Demo metric,{start + timedelta(days = i)},{i}\n')
+
+def loaded():
+
+    return db.execute_query('SELECT COUNT(*) AS n FROM global_metric_value')[0]['n']
+
+def ingested():
+
+    return db.execute_query('SELECT COUNT(*) AS n FROM ingested_file')[0]['n']
+
+# A file is read once its size and mtime hold still for a poll, and its rows
+# wait in the buffer until flush_size rows or flush_interval seconds.
+
+daemon = IngestDaemon(db, drop_dir, flush_size = 100, flush_interval = 3600)
+
+drop('a.csv', date(2024, 1, 1), 5)
+
+daemon.poll()
+
+assert daemon.buffered() == 0
+
+daemon.poll()
+
+assert daemon.buffered() == 5 and not daemon.due()
+
+daemon.flush_interval = 0
+
+assert daemon.due() and daemon.flush()
+
+print(loaded(), ingested())
+
+assert (loaded(), ingested()) == (5, 1)
+
+# The same content dropped under a new name is skipped by its hash.
+
+shutil.copy(os.path.join(drop_dir, 'a.csv'), os.path.join(drop_dir, 'b.csv'))
+
+daemon.poll()
+daemon.poll()
+
+assert daemon.buffered() == 0 and not daemon.checkpoints
+
+# A restarted service reads the hashes back from ingested_file.
+
+daemon = IngestDaemon(db, drop_dir, flush_size = 3, flush_interval = 3600)
+
+shutil.copy(os.path.join(drop_dir, 'a.csv'), os.path.join(drop_dir, 'c.csv'))
+
+daemon.poll()
+daemon.poll()
+
+assert daemon.buffered() == 0 and not daemon.checkpoints and ingested() == 1
+
+# A file larger than flush_size is flushed mid-file; its checkpoint follows its last rows.
+
+drop('d.csv', date(2024, 2, 1), 7)
+
+daemon.poll()
+daemon.poll()
+
+assert loaded() == 11 and daemon.buffered() == 1 and ingested() == 1
+
+assert daemon.flush() and (loaded(), ingested()) == (12, 2)
+
+# While flushes fail, reading stops at a full buffer and the file is read
+# again from the start once the database is back.
+
+attempts = []
+
+transaction = db.transaction
+
+@contextmanager
+def failing_transaction():
+
+    attempts.append(1)
+
+    raise RuntimeError('database unavailable')
+
+    yield
+
+db.transaction = failing_transaction
+
+daemon = IngestDaemon(db, drop_dir, flush_size = 10, flush_interval = 3600)
+
+drop('e.csv', date(2021, 1, 1), 199)
+
+daemon.poll()
+daemon.poll()
+
+print(len(attempts), daemon.buffered())
+
+assert len(attempts) == 1 and daemon.buffered() == 10 and not daemon.checkpoints
+
+daemon.poll()
+
+assert len(attempts) == 2 and daemon.buffered() == 10
+
+db.transaction = transaction
+
+daemon.poll()
+
+assert daemon.flush() and (loaded(), ingested()) == (211, 3)
+
+shutil.rmtree(drop_dir)
+
+print("OK")
@@ -0,0 +1,23 @@
+from database import Database
+from partitions import PartitionManager, add_months, date_bounds
+from datetime import date
+
+print(add_months(date(2024, 12, 15), 1))
+
+print(date_bounds([{'metric_date': date(2024, 1, 2)}, {'metric_date': date(2023, 5, 1)}]))
+
+# Needs a MySQL database converted with partition_metric_values.sql.
+
+db = Database()
+
+manager = PartitionManager(db, months_ahead = 3)
+
+print(manager.partitions('global_metric_value'))
+
+print(manager.extend('global_metric_value'))
+
+print(manager.expired('global_metric_value'))
+
+# The id alone stays the row identity, although metric_date joined the primary key.
+
+print(db.get_primary_keys('global_metric_value'), db.catalog.clustered_key('global_metric_value'))
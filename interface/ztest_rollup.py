@@ -0,0 +1,21 @@
+from datetime import date, timedelta
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+db.insert_many('global_metric_value', [
+    {'metric_id': 1, 'metric_date': date(2024, 1, 1) + timedelta(weeks = i), 'actual_value': 10 + i}
+    for i in range(10)
+])
+
+print(db.metric_rollup.series(1, 'month'))
+
+db.delete('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 1, 1)})
+
+print(db.metric_rollup.series(1, 'week', start = date(2024, 1, 1), end = date(2024, 1, 14)))
+
+print(db.metric_rollup.summary(1))
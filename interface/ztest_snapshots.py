@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+from snapshots import SnapshotManager
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+db.insert_many('global_metric_value', [
+    {'metric_id': 1, 'metric_date': date(2024, 1, 1) + timedelta(weeks = i), 'actual_value': 10 + i}
+    for i in range(5)
+])
+
+db.insert('user_query', {'query_title': 'Demo values', 'query_description': 'Demo', 'query_purpose': 'Demo',
+                         'query_string': 'SELECT metric_date, actual_value FROM global_metric_value ORDER BY metric_date'})
+
+snapshots = SnapshotManager(db)
+
+snapshots.load()
+
+print(snapshots.materialize('Demo values', 'incremental', ['metric_date']))
+
+print(snapshots.read('Demo values'))
+
+db.delete('global_metric_value', {'global_value_id': 1})
+
+snapshots.table_changed('global_metric_value')
+
+print(snapshots.due())
+
+print(snapshots.refresh_due())
+
+print(snapshots.read('Demo values'))
+
+# Writes reported to the backend reach the manager through change_listeners.
+
+db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 3, 1), 'actual_value': 20})
+
+db.table_changed('global_metric_value')
+
+assert snapshots.due() == ['Demo values']
+
+print(snapshots.refresh_due())
+
+# CRUD writes reach the manager too, inside transaction() once it ends.
+
+with db.transaction():
+    db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 3, 8), 'actual_value': 21})
+
+    assert snapshots.due() == []
+
+assert snapshots.due() == ['Demo values']
+
+print(snapshots.refresh_due())
@@ -0,0 +1,50 @@
+
+from datetime import date
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+print(db.get_columns('global_metric_value'))
+
+print(db.get_primary_keys('event_plan'))
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+db.insert('metric', {'initiative_id': 1, 'metric_name': 'Demo metric', 'metric_definition': 'Demo', 'is_plan_level': 0, 'collection_frequency': 'Weekly'})
+
+db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 5, 15), 'actual_value': 12.5})
+
+print(db.fetch_all('global_metric_value'))
+
+print(db.call_procedure('get_global_initiative_metrics', (1,)))
+
+with db.transaction():
+    event_id = db.insert('event', {'event_title': 'Demo event', 'event_description': 'Demo', 'event_date': date(2024, 5, 20)})
+    db.insert('initiative_event', {'initiative_id': 1, 'event_id': event_id})
+
+print(db.fetch_all('initiative_event'))
+
+# db.insert('global_metric_value', {'metric_id': 1, 'metric_date': date(2024, 5, 16), 'actual_value': -1})
+
+# A failed insert_many batch is reported by the positions of its rows in the input,
+# even when rows with different column sets are interleaved.
+
+report = db.insert_many('global_metric_value', [
+    {'metric_id': 1, 'metric_date': date(2024, 6, 3), 'actual_value': 1},
+    {'global_value_id': 100, 'metric_id': 1, 'metric_date': date(2024, 6, 10), 'actual_value': 2},
+    {'metric_id': 1, 'metric_date': date(2024, 6, 17), 'actual_value': -1},
+    {'global_value_id': 101, 'metric_id': 1, 'metric_date': date(2024, 6, 24), 'actual_value': 4}
+], batch_size = 1)
+
+print(report)
+
+assert [(failure['first_row'], failure['indexes']) for failure in report['failed']] == [(2, [2])]
+
+report = db.upsert_many('global_metric_value', [
+    {'metric_id': 1, 'metric_date': date(2024, 7, 1), 'actual_value': 1},
+    {'metric_id': 1, 'metric_date': date(2024, 7, 8), 'actual_value': -1}
+], ['metric_id', 'metric_date'], batch_size = 1)
+
+print(report)
+
+assert [failure['first_row'] for failure in report['failed']] == [1]
@@ -0,0 +1,86 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from catalog import SchemaCatalog
+from sqlite_backend import SQLiteDatabase
+
+# Nested transaction() blocks are savepoints: an inner failure rolls back only
+# the inner block, and an outer failure rolls back everything.
+
+db = SQLiteDatabase()
+
+db.insert('initiative', {'initiative_title': 'Demo', 'initiative_description': 'Demo initiative', 'initiative_owner': 'Owner'})
+
+with db.transaction():
+    db.insert('event', {'event_title': 'Kept', 'event_description': 'Demo', 'event_date': date(2024, 5, 20)})
+
+    try:
+        with db.transaction():
+            db.insert('event', {'event_title': 'Rolled back', 'event_description': 'Demo', 'event_date': date(2024, 5, 21)})
+            raise RuntimeError('inner failure')
+    except RuntimeError:
+        pass
+
+try:
+    with db.transaction():
+        db.insert('event', {'event_title': 'Also rolled back', 'event_description': 'Demo', 'event_date': date(2024, 5, 22)})
+        raise RuntimeError('outer failure')
+except RuntimeError:
+    pass
+
+titles = [row['event_title'] for row in db.fetch_all('event')]
+
+print(titles)
+
+assert titles == ['Kept']
+
+# A caller holding the database lock (as inside Database.transaction() in
+# single-connection mode) and another thread reloading an expired catalog
+# take the two locks in opposite orders; neither may wait on the other.
+
+class LockedDatabase:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            yield None, Cursor()
+
+class Cursor:
+
+    def execute(self, sql, params = ()):
+        pass
+
+    def fetchall(self):
+        return [{'table_name': 'plan', 'column_name': 'plan_id', 'data_type': 'int', 'column_type': 'int',
+                 'is_nullable': 'NO', 'extra': '', 'key_position': 1, 'table_type': 'BASE TABLE'}]
+
+fake = LockedDatabase()
+
+catalog = SchemaCatalog(fake, ttl = 0.001)
+
+def in_transaction():
+    for _ in range(200):
+        with fake._lock:
+            time.sleep(0.001)
+            catalog.primary_keys('plan')
+
+def reloading():
+    for _ in range(200):
+        catalog.invalidate()
+        catalog.columns('plan')
+
+threads = [threading.Thread(target = in_transaction, daemon = True), threading.Thread(target = reloading, daemon = True)]
+
+for thread in threads:
+    thread.start()
+
+for thread in threads:
+    thread.join(10)
+
+assert not any(thread.is_alive() for thread in threads), "catalog and database locks deadlocked"
+
+print("OK")
@@ -0,0 +1,37 @@
+import time
+import tkinter as tk
+from tkinter import ttk
+from worker import Worker
+
+"""
+A utility code for testing the Worker busy indicator and double-click protection.
+
+"""
+
+root = tk.Tk()
+
+root.title("Worker Demo")
+
+root.geometry("400x150")
+
+worker = Worker(root)
+
+worker.build_status_bar(root).pack(side = "bottom", fill = "x")
+
+result_label = ttk.Label(root, text = "Click the button; extra clicks are ignored while busy.")
+
+result_label.pack(padx = 10, pady = 10)
+
+def slow_task(seconds):
+    time.sleep(seconds)
+    return f"Finished after {seconds} seconds."
+
+def start():
+    submitted = worker.submit("slow", slow_task, 3,
+                              on_success = lambda result: result_label.config(text = result),
+                              on_error = lambda e: result_label.config(text = f"Error: {e}"))
+    print(f"Submitted: {submitted}")
+
+ttk.Button(root, text = "Run Slow Task", command = start).pack(padx = 10, pady = 10)
+
+root.mainloop()
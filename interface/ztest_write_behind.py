@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+from write_behind import WriteBehindQueue, is_transient
+from sqlite_backend import SQLiteDatabase
+
+db = SQLiteDatabase()
+
+queue_dir = tempfile.mkdtemp()
+
+path = os.path.join(queue_dir, 'write_queue.db')
+
+def plans():
+
+    return [(row['plan_id'], row['plan_name']) for row in db.execute_query('SELECT plan_id, plan_name FROM plan ORDER BY plan_id')]
+
+# Inserts are sent in order in one batch; successive updates of a record are
+# coalesced into one statement.
+
+queue = WriteBehindQueue(db, path)
+
+queue.enqueue_insert('plan', {'plan_name': 'Alpha'})
+queue.enqueue_insert('plan', {'plan_name': 'Beta'})
+
+assert queue.flush() == 2 and queue.pending_count() == 0
+
+updates = []
+
+update = db.update
+
+def counting_update(table, data, conditions):
+
+    updates.append(data)
+
+    return update(table, data, conditions)
+
+db.update = counting_update
+
+queue.enqueue_update('plan', {'plan_name': 'Alpha 2'}, {'plan_id': 1}, {'plan_name': 'Alpha'})
+queue.enqueue_update('plan', {'plan_name': 'Alpha 3'}, {'plan_id': 1}, {'plan_name': 'Alpha 2'})
+
+assert queue.flush() == 2
+
+db.update = update
+
+print(updates, plans())
+
+assert updates == [{'plan_name': 'Alpha 3'}] and plans() == [(1, 'Alpha 3'), (2, 'Beta')]
+
+assert queue.take_flushed_tables() == {'plan'}
+
+# An update of a record changed by another user, or of a deleted record, is
+# set aside as a conflict; the rest of the batch is applied.
+
+db.update('plan', {'plan_name': 'Beta (other user)'}, {'plan_id': 2})
+
+queue.enqueue_update('plan', {'plan_name': 'Beta 2'}, {'plan_id': 2}, {'plan_name': 'Beta'})
+queue.enqueue_update('plan', {'plan_name': 'Gone'}, {'plan_id': 99}, {'plan_name': 'Gone'})
+queue.enqueue_insert('plan', {'plan_name': 'Gamma'})
+
+assert queue.flush() == 3
+
+conflicts = queue.take_conflicts()
+
+print([conflict['reason'] for conflict in conflicts])
+
+assert [conflict['conditions'] for conflict in conflicts] == [{'plan_id': 2}, {'plan_id': 99}]
+
+assert plans() == [(1, 'Alpha 3'), (2, 'Beta (other user)'), (3, 'Gamma')]
+
+# A connection failure keeps the batch queued; a write that keeps failing is
+# set aside after max_attempts.
+
+class OperationalError(Exception):
+    pass
+
+assert is_transient(OperationalError('database is locked'))
+assert not is_transient(OperationalError('no such column: plan_title'))
+
+insert = db.insert
+
+def failing_insert(table, data):
+
+    raise OperationalError('database is locked')
+
+db.insert = failing_insert
+
+queue.max_attempts = 2
+
+queue.enqueue_insert('plan', {'plan_name': 'Delta'})
+
+for attempt in range(2):
+    try:
+        queue.flush()
+    except OperationalError:
+        pass
+    else:
+        raise AssertionError('a transient error must propagate')
+
+db.insert = insert
+
+assert queue.pending_count() == 0 and queue.take_conflicts()[0]['reason'].startswith('Gave up after 2 attempts')
+
+queue.close()
+
+# A crash between the server commit and the removal from the queue file sends
+# the batch again at the next start; the receipts stop a second insert.
+
+queue = WriteBehindQueue(db, path)
+
+queue.enqueue_insert('plan', {'plan_name': 'Epsilon'})
+
+queue.close()
+
+shutil.copy(path, path + '.crashed')
+
+queue = WriteBehindQueue(db, path)
+
+assert queue.flush() == 1
+
+queue.close()
+
+os.replace(path + '.crashed', path)
+
+queue = WriteBehindQueue(db, path)
+
+assert queue.pending_count() == 1 and queue.flush() == 1 and not queue.take_conflicts()
+
+queue.close()
+
+print(plans())
+
+assert [name for _, name in plans()].count('Epsilon') == 1
+
+# close() gives the background thread a chance to send what is queued.
+
+queue = WriteBehindQueue(db, path, flush_interval = 0.05)
+
+queue.start()
+
+queue.enqueue_insert('plan', {'plan_name': 'Zeta'})
+
+queue.close()
+
+assert plans()[-1][1] == 'Zeta'
+
+shutil.rmtree(queue_dir)
+
+print("OK")
@@ -0,0 +1,31 @@
+/*
+
+Name:		add_metric_rollup.sql
+
+Description:	Adds the metric_rollup table to a value database created before it
+		was part of create_value_database.sql. Fill it from the metric values
+		already stored by running "python rollup.py rebuild".
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+CREATE TABLE metric_rollup (
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    grain ENUM('week', 'month') NOT NULL,
+    bucket DATE NOT NULL,
+    value_count INT NOT NULL,
+    value_sum DECIMAL(20,2) NOT NULL,
+    value_squares DOUBLE NOT NULL,
+    min_value DECIMAL(10,2) NOT NULL,
+    max_value DECIMAL(10,2) NOT NULL,
+    first_date DATE NOT NULL,
+    first_value DECIMAL(10,2) NOT NULL,
+    last_date DATE NOT NULL,
+    last_value DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (metric_id, plan_id, grain, bucket),
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+CREATE INDEX idx_rollup_bucket ON metric_rollup(grain, bucket);
@@ -0,0 +1,46 @@
+/*
+
+Name:		add_metric_stats.sql
+
+Description:	Adds the metric_stats and metric_anomaly tables to a value database
+		created before they were part of create_value_database.sql, and
+		seeds metric_stats from the metric values already stored.
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+CREATE TABLE metric_stats (
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    value_count BIGINT NOT NULL,
+    mean_value DOUBLE NOT NULL,
+    m2 DOUBLE NOT NULL,
+    PRIMARY KEY (metric_id, plan_id),
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+CREATE TABLE metric_anomaly (
+    anomaly_id INT AUTO_INCREMENT PRIMARY KEY,
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    metric_date DATE,
+    actual_value DECIMAL(10,2) NOT NULL,
+    z_score DOUBLE NOT NULL,
+    detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+CREATE INDEX idx_anomaly_metric ON metric_anomaly(metric_id, plan_id, metric_date);
+
+INSERT INTO metric_stats (metric_id, plan_id, value_count, mean_value, m2)
+SELECT metric_id, 0, COUNT(*), AVG(actual_value), VAR_POP(actual_value) * COUNT(*)
+FROM global_metric_value
+WHERE metric_id IS NOT NULL
+GROUP BY metric_id;
+
+INSERT INTO metric_stats (metric_id, plan_id, value_count, mean_value, m2)
+SELECT metric_id, plan_id, COUNT(*), AVG(actual_value), VAR_POP(actual_value) * COUNT(*)
+FROM plan_metric_value
+WHERE metric_id IS NOT NULL AND plan_id IS NOT NULL
+GROUP BY metric_id, plan_id;
@@ -0,0 +1,33 @@
+/*
+
+Name:		add_metric_value_unique_keys.sql
+
+Description:	Adds the natural-key unique constraints of global_metric_value and
+		plan_metric_value to a value database created before they were part of
+		create_value_database.sql. Duplicate rows are removed first, keeping the
+		most recently inserted row for each key.
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+DELETE older
+FROM global_metric_value older
+JOIN global_metric_value newer
+    ON newer.metric_id = older.metric_id
+    AND newer.metric_date = older.metric_date
+    AND newer.global_value_id > older.global_value_id;
+
+ALTER TABLE global_metric_value
+    ADD CONSTRAINT uq_global_metric_date UNIQUE (metric_id, metric_date);
+
+DELETE older
+FROM plan_metric_value older
+JOIN plan_metric_value newer
+    ON newer.metric_id = older.metric_id
+    AND newer.plan_id = older.plan_id
+    AND newer.metric_date = older.metric_date
+    AND newer.plan_value_id > older.plan_value_id;
+
+ALTER TABLE plan_metric_value
+    ADD CONSTRAINT uq_plan_metric_date UNIQUE (metric_id, plan_id, metric_date);
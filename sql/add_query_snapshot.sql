@@ -0,0 +1,42 @@
+/*
+
+Name:		add_query_snapshot.sql
+
+Description:	Adds the query_snapshot and query_snapshot_row tables to a value
+		database created before they were part of create_value_database.sql.
+		Materialize saved queries with "python snapshots.py add <title>" or the
+		Materialize button.
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+-- Results of saved queries materialized as snapshots, served by the application
+-- instead of running the query, with their refresh settings and last refresh.
+
+CREATE TABLE query_snapshot (
+    query_id INT PRIMARY KEY,
+    refresh_mode ENUM('full', 'incremental') NOT NULL DEFAULT 'full',
+    key_columns VARCHAR(255),
+    refresh_interval INT,
+    refresh_on_change BOOLEAN DEFAULT 1,
+    column_names TEXT,
+    row_count INT,
+    refreshed_at DATETIME,
+    refresh_seconds DOUBLE,
+    FOREIGN KEY (query_id) REFERENCES user_query(query_id)
+);
+
+-- Snapshot rows as JSON arrays, keyed by a hash of their key columns so
+-- incremental refreshes write only the rows that changed.
+
+CREATE TABLE query_snapshot_row (
+    query_id INT NOT NULL,
+    row_key CHAR(40) NOT NULL,
+    row_no INT NOT NULL,
+    row_data TEXT NOT NULL,
+    PRIMARY KEY (query_id, row_key),
+    FOREIGN KEY (query_id) REFERENCES query_snapshot(query_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_snapshot_row_order ON query_snapshot_row(query_id, row_no);
@@ -0,0 +1,22 @@
+/*
+
+Name:		add_write_receipt.sql
+
+Description:	Adds the write_receipt table to a value database created before it
+		was part of create_value_database.sql. Required before enabling
+		write_behind in config.ini.
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+-- Queue sequence numbers of writes applied from each client's write-behind queue,
+-- recorded in the transaction that applies them, so a batch resent after a crash
+-- is not applied twice.
+
+CREATE TABLE write_receipt (
+    queue_id CHAR(36) NOT NULL,
+    seq BIGINT NOT NULL,
+    received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (queue_id, seq)
+);
@@ -26,6 +26,20 @@ Modifications:	2025-03-08 - Added and tested CREATE TABLE queries.
 		             and views.
 	        2025-04-02 - Added user_query table to Section 1 to store details of pre-defined and 
                              custom user queries.
+		2026-10-18 - Added id_block table to Section 1 to hand out blocks of primary key
+		             values for tables without AUTO_INCREMENT keys.
+		2026-10-18 - Added natural-key unique constraints to global_metric_value and
+		             plan_metric_value so metric feeds can be upserted.
+		2026-10-18 - Added ingested_file table to Section 1 to checkpoint files loaded
+		             by the ingestion daemon.
+		2026-10-18 - Added metric_stats and metric_anomaly tables to Section 1 for
+		             running metric statistics and z-score outliers flagged on insert.
+		2026-10-18 - Added metric_rollup table to Section 1 for weekly and monthly
+		             rollups of metric values; Section 5 reads from it.
+		2026-10-18 - Added query_snapshot and query_snapshot_row tables to
+		             Section 1 for materialized snapshots of saved queries.
+		2026-10-18 - Added write_receipt table to Section 1 so writes resent by a
+		             write-behind queue are not applied twice.
 
 */
 
@@ -99,6 +113,7 @@ CREATE TABLE global_metric_value (
     actual_value DECIMAL(10,2) NOT NULL,
     week_start DATE GENERATED ALWAYS AS (DATE_SUB(metric_date, INTERVAL WEEKDAY(metric_date) DAY)) STORED,
     month_start DATE GENERATED ALWAYS AS (DATE_FORMAT(metric_date, '%Y-%m-01')) STORED,
+    CONSTRAINT uq_global_metric_date UNIQUE (metric_id, metric_date),
     FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
 );
 
@@ -116,6 +131,7 @@ CREATE TABLE plan_metric_value (
     actual_value DECIMAL(10,2) NOT NULL,
     week_start DATE GENERATED ALWAYS AS (DATE_SUB(metric_date, INTERVAL WEEKDAY(metric_date) DAY)) STORED,
     month_start DATE GENERATED ALWAYS AS (DATE_FORMAT(metric_date, '%Y-%m-01')) STORED,
+    CONSTRAINT uq_plan_metric_date UNIQUE (metric_id, plan_id, metric_date),
     FOREIGN KEY (metric_id) REFERENCES metric(metric_id),
     FOREIGN KEY (plan_id) REFERENCES plan(plan_id)
 );
@@ -144,6 +160,121 @@ CREATE TABLE user_query (
     olap BOOLEAN DEFAULT 0
 );
 
+-- Next unassigned key value per table, reserved in blocks by the application's
+-- id allocator for tables whose keys are not AUTO_INCREMENT (e.g. plan).
+
+CREATE TABLE id_block (
+    table_name VARCHAR(64) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+
+-- Files loaded by the ingestion daemon, keyed by a SHA-256 hash of their content,
+-- so a file is not loaded again after a restart or under another name.
+
+CREATE TABLE ingested_file (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_name VARCHAR(255) NOT NULL,
+    target_table VARCHAR(64),
+    row_count INT NOT NULL,
+    rejected_count INT NOT NULL,
+    ingested_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Queue sequence numbers of writes applied from each client's write-behind queue,
+-- recorded in the transaction that applies them, so a batch resent after a crash
+-- is not applied twice.
+
+CREATE TABLE write_receipt (
+    queue_id CHAR(36) NOT NULL,
+    seq BIGINT NOT NULL,
+    received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (queue_id, seq)
+);
+
+-- Running count, mean and sum of squared deviations (M2) of each metric's values,
+-- per plan for plan metrics and under plan_id 0 for global metrics, kept up to
+-- date by the application as values are written.
+
+CREATE TABLE metric_stats (
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    value_count BIGINT NOT NULL,
+    mean_value DOUBLE NOT NULL,
+    m2 DOUBLE NOT NULL,
+    PRIMARY KEY (metric_id, plan_id),
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+-- Metric values flagged on insert as more than the configured number of standard
+-- deviations from the mean of the values before them.
+
+CREATE TABLE metric_anomaly (
+    anomaly_id INT AUTO_INCREMENT PRIMARY KEY,
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    metric_date DATE,
+    actual_value DECIMAL(10,2) NOT NULL,
+    z_score DOUBLE NOT NULL,
+    detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+CREATE INDEX idx_anomaly_metric ON metric_anomaly(metric_id, plan_id, metric_date);
+
+-- Weekly and monthly rollups of metric values, per plan for plan metrics and under
+-- plan_id 0 for global metrics, kept up to date by the application as values are
+-- written. Buckets start on the week_start or month_start of their values.
+
+CREATE TABLE metric_rollup (
+    metric_id INT NOT NULL,
+    plan_id INT NOT NULL DEFAULT 0,
+    grain ENUM('week', 'month') NOT NULL,
+    bucket DATE NOT NULL,
+    value_count INT NOT NULL,
+    value_sum DECIMAL(20,2) NOT NULL,
+    value_squares DOUBLE NOT NULL,
+    min_value DECIMAL(10,2) NOT NULL,
+    max_value DECIMAL(10,2) NOT NULL,
+    first_date DATE NOT NULL,
+    first_value DECIMAL(10,2) NOT NULL,
+    last_date DATE NOT NULL,
+    last_value DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (metric_id, plan_id, grain, bucket),
+    FOREIGN KEY (metric_id) REFERENCES metric(metric_id)
+);
+
+CREATE INDEX idx_rollup_bucket ON metric_rollup(grain, bucket);
+
+-- Results of saved queries materialized as snapshots, served by the application
+-- instead of running the query, with their refresh settings and last refresh.
+
+CREATE TABLE query_snapshot (
+    query_id INT PRIMARY KEY,
+    refresh_mode ENUM('full', 'incremental') NOT NULL DEFAULT 'full',
+    key_columns VARCHAR(255),
+    refresh_interval INT,
+    refresh_on_change BOOLEAN DEFAULT 1,
+    column_names TEXT,
+    row_count INT,
+    refreshed_at DATETIME,
+    refresh_seconds DOUBLE,
+    FOREIGN KEY (query_id) REFERENCES user_query(query_id)
+);
+
+-- Snapshot rows as JSON arrays, keyed by a hash of their key columns so
+-- incremental refreshes write only the rows that changed.
+
+CREATE TABLE query_snapshot_row (
+    query_id INT NOT NULL,
+    row_key CHAR(40) NOT NULL,
+    row_no INT NOT NULL,
+    row_data TEXT NOT NULL,
+    PRIMARY KEY (query_id, row_key),
+    FOREIGN KEY (query_id) REFERENCES query_snapshot(query_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_snapshot_row_order ON query_snapshot_row(query_id, row_no);
+
 /*
 
 Section 2 - Create triggers to ensure global_metric_value and plan_metric_value
@@ -274,7 +405,8 @@ Section 5 - Create temporary tables
 
 */
 
--- Create temporary table to store monthly average metrics
+-- Create temporary table to store monthly average metrics, read from the monthly
+-- rollups rather than re-aggregated from raw values.
 
 CREATE TEMPORARY TABLE temp_avg_metrics (
     metric_id INT,
@@ -284,11 +416,11 @@ CREATE TEMPORARY TABLE temp_avg_metrics (
 );
 
 INSERT INTO temp_avg_metrics
-SELECT m.metric_id, m.metric_name, DATE_FORMAT(g.metric_date, '%Y-%m-01') AS month_year, 
-       AVG(g.actual_value) AS avg_value
+SELECT m.metric_id, m.metric_name, r.bucket AS month_year, 
+       r.value_sum / r.value_count AS avg_value
 FROM metric m
-JOIN global_metric_value g ON m.metric_id = g.metric_id
-GROUP BY m.metric_id, month_year;
+JOIN metric_rollup r ON m.metric_id = r.metric_id
+WHERE r.plan_id = 0 AND r.grain = 'month';
 
 SELECT * FROM temp_avg_metrics;
 
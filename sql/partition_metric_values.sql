@@ -0,0 +1,50 @@
+/*
+
+Name:		partition_metric_values.sql
+
+Description:	Optionally converts global_metric_value and plan_metric_value to
+		RANGE COLUMNS partitioning on metric_date, one partition per month,
+		so date-bounded reads and retention touch only the months involved.
+		Run "python partitions.py maintain" afterwards, and then regularly
+		(e.g. daily from cron), to split pmax into monthly partitions, create
+		those of the coming months and archive or drop expired ones.
+
+		MySQL requires every unique key of a partitioned table, including
+		the primary key, to contain the partitioning column, so metric_date
+		joins the primary key. The application still identifies records
+		by their AUTO_INCREMENT id alone (see catalog.py). Partitioned
+		InnoDB tables cannot have foreign keys, so the references to
+		metric and plan are dropped; the bulk importers still check them
+		before loading. The foreign key names
+		below are the ones MySQL generates; check SHOW CREATE TABLE if the
+		tables were created with other names.
+
+		Converting rewrites each table once; run it outside busy hours.
+
+Modifications:	2026-10-18 - Created.
+
+*/
+
+ALTER TABLE global_metric_value DROP FOREIGN KEY global_metric_value_ibfk_1;
+
+ALTER TABLE global_metric_value
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (global_value_id, metric_date);
+
+ALTER TABLE global_metric_value
+PARTITION BY RANGE COLUMNS (metric_date) (
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE plan_metric_value DROP FOREIGN KEY plan_metric_value_ibfk_1;
+
+ALTER TABLE plan_metric_value DROP FOREIGN KEY plan_metric_value_ibfk_2;
+
+ALTER TABLE plan_metric_value
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (plan_value_id, metric_date);
+
+ALTER TABLE plan_metric_value
+PARTITION BY RANGE COLUMNS (metric_date) (
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
@@ -32,6 +32,9 @@ Contents:	1. Detecting Anomalous Metric Spikes (Z-Score Calculation)
 		26. Filter Events Where Actual Value Exceeds Some Value from a Subquery Using SOME
 		
 Modifications:	2025-05-01 - Final updates for submission.
+		2026-10-18 - Query 1 takes the mean per metric_id, like its standard deviation.
+		2026-10-18 - Queries 3, 4, 7, 17 and 18 read the monthly buckets of metric_rollup
+		             instead of aggregating raw metric values.
 
 */
 
@@ -50,7 +53,7 @@ WITH MetricStats AS (
         m.metric_name,
         gmv.metric_date,
         gmv.actual_value,
-        AVG(gmv.actual_value) OVER (PARTITION BY m.metric_name) AS mean_value,
+        AVG(gmv.actual_value) OVER (PARTITION BY m.metric_id) AS mean_value,
         STDDEV_SAMP(gmv.actual_value) OVER (PARTITION BY m.metric_id) AS std_dev
     FROM 
         metric m
@@ -127,12 +130,14 @@ Indicates reliability of given metrics in assessing performance
 
 SELECT 
   m.metric_name, 
-  ROUND(STDDEV(gmv.actual_value), 2) AS metric_stddev, 
-  RANK() OVER (ORDER BY STDDEV(gmv.actual_value) ASC) AS consistency_rank 
+  ROUND(SQRT(GREATEST(SUM(r.value_squares) / SUM(r.value_count) - POW(SUM(r.value_sum) / SUM(r.value_count), 2), 0)), 2) AS metric_stddev, 
+  RANK() OVER (ORDER BY SQRT(GREATEST(SUM(r.value_squares) / SUM(r.value_count) - POW(SUM(r.value_sum) / SUM(r.value_count), 2), 0)) ASC) AS consistency_rank 
 FROM 
   metric m
 JOIN 
-  global_metric_value gmv ON m.metric_id = gmv.metric_id
+  metric_rollup r ON m.metric_id = r.metric_id
+WHERE 
+  r.plan_id = 0 AND r.grain = 'month'
 GROUP BY 
   m.metric_id;
 
@@ -148,12 +153,14 @@ Metrics with greater fluctuation receive higher ranks.
 
 SELECT 
   m.metric_name,
-  ROUND(STDDEV(gmv.actual_value), 2) AS metric_stddev,
-  RANK() OVER (ORDER BY STDDEV(gmv.actual_value) DESC) AS volatility_rank
+  ROUND(SQRT(GREATEST(SUM(r.value_squares) / SUM(r.value_count) - POW(SUM(r.value_sum) / SUM(r.value_count), 2), 0)), 2) AS metric_stddev,
+  RANK() OVER (ORDER BY SQRT(GREATEST(SUM(r.value_squares) / SUM(r.value_count) - POW(SUM(r.value_sum) / SUM(r.value_count), 2), 0)) DESC) AS volatility_rank
 FROM 
   metric m
 JOIN 
-  global_metric_value gmv ON m.metric_id = gmv.metric_id
+  metric_rollup r ON m.metric_id = r.metric_id
+WHERE 
+  r.plan_id = 0 AND r.grain = 'month'
 GROUP BY 
   m.metric_id;
 
@@ -226,13 +233,15 @@ Compares metrics by frequency of measurement.
 SELECT
  m.metric_id,
  m.metric_name,
- COUNT(gmv.metric_date) AS tracking_frequency,
- RANK() OVER (ORDER BY COUNT(gmv.metric_date) DESC) AS tracking_rank,
- DENSE_RANK() OVER (ORDER BY COUNT(gmv.metric_date) DESC) AS dense_tracking_rank
+ SUM(r.value_count) AS tracking_frequency,
+ RANK() OVER (ORDER BY SUM(r.value_count) DESC) AS tracking_rank,
+ DENSE_RANK() OVER (ORDER BY SUM(r.value_count) DESC) AS dense_tracking_rank
 FROM
  metric m
 JOIN
- global_metric_value gmv ON m.metric_id = gmv.metric_id
+ metric_rollup r ON m.metric_id = r.metric_id
+WHERE
+ r.plan_id = 0 AND r.grain = 'month'
 GROUP BY
  m.metric_id;
 
@@ -474,16 +483,17 @@ Provides insights into total metric values at multiple levels.
 */
 
 SELECT 
-    pmv.plan_id,
+    r.plan_id,
     i.initiative_title,
-    AVG(pmv.actual_value) AS avg_metric_value
+    SUM(r.value_sum) / SUM(r.value_count) AS avg_metric_value
 FROM 
-    plan_metric_value pmv
+    metric_rollup r
 JOIN 
-    metric m ON pmv.metric_id = m.metric_id
+    metric m ON r.metric_id = m.metric_id
 JOIN 
   initiative i ON m.initiative_id = i.initiative_id
-GROUP BY i.initiative_title, pmv.plan_id WITH ROLLUP;
+WHERE r.plan_id <> 0 AND r.grain = 'month'
+GROUP BY i.initiative_title, r.plan_id WITH ROLLUP;
 
 /*
 
@@ -497,10 +507,10 @@ Provides per-initiative metric summary, calculating the average value of metrics
 
 SELECT 
     i.initiative_title,
-    (SELECT AVG(pmv.actual_value)
-     FROM plan_metric_value pmv
-     JOIN metric m ON pmv.metric_id = m.metric_id
-     WHERE m.initiative_id = i.initiative_id) AS avg_metric_value
+    (SELECT SUM(r.value_sum) / SUM(r.value_count)
+     FROM metric_rollup r
+     JOIN metric m ON r.metric_id = m.metric_id
+     WHERE m.initiative_id = i.initiative_id AND r.plan_id <> 0 AND r.grain = 'month') AS avg_metric_value
 FROM 
     initiative i;
 
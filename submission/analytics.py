@@ -0,0 +1,509 @@
+import configparser
+import threading
+import time
+from decimal import Decimal
+
+from backend import default_config_path
+from columnar import np
+from rows import row_class
+
+# Predefined queries (see predefined_queries.sql) computed here instead of on
+# the server, by title, with the method that computes each one.
+
+QUERIES = {
+    "Detecting Anomalous Metric Spikes (Z-Score Calculation)": "z_score_outliers",
+    "First and Last Recorded Value for Each Metric": "first_last_values",
+    "Rolling 90-day Average for Each Metric": "rolling_average",
+    "Assign Plan Groups to Quartiles": "quartiles",
+    "Cumulative Distribution of Metric Values": "cumulative_distribution",
+    "Percent Change Over Rolling 4-Week Window": "percent_change"
+}
+
+GLOBAL_SERIES_SQL = """
+SELECT gmv.metric_id, m.metric_name, gmv.metric_date, gmv.actual_value
+FROM global_metric_value gmv
+JOIN metric m ON m.metric_id = gmv.metric_id
+"""
+
+PLAN_SERIES_SQL = """
+SELECT pmv.plan_id, pmv.metric_id, m.metric_name, pmv.actual_value
+FROM plan_metric_value pmv
+JOIN metric m ON m.metric_id = pmv.metric_id
+"""
+
+def open_analytics(db, config_file_path = None):
+
+    """
+    Creates the analytics engine unless it is switched off in config.ini or NumPy is missing.
+
+    Parameters
+    ----------
+    db : StorageBackend
+        The database the metric values are read from.
+
+    config_file_path : str, optional
+        Path to the config file (default is backend.default_config_path()).
+
+    Returns
+    -------
+    MetricAnalytics or None
+        The engine, or None when analytics_engine is "sql" or NumPy is not installed.
+
+    """
+
+    config = configparser.ConfigParser()
+
+    config.read(config_file_path or default_config_path())
+
+    section = config["value"] if config.has_section("value") else config[config.default_section]
+
+    if np is None or section.get("analytics_engine", fallback = "numpy").strip().lower() != "numpy":
+        return None
+
+    return MetricAnalytics(db, ttl = section.getfloat("analytics_ttl", fallback = 600))
+
+class MetricAnalytics:
+
+    """
+    Computes the window-function predefined queries with vectorized NumPy operations.
+
+    The global and plan metric values are each read once as columns (see
+    query_columnar()), with actual_value held exactly as int64 cents, and
+    kept for ttl seconds. Each query then sorts and partitions the arrays
+    in memory, so running a query again or with other parameters costs no
+    server work. Results are lists of rows.Row objects with the same
+    columns as the SQL versions, ready for the Run Queries tab.
+    interface/ztest_analytics.py checks the results against the SQL.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database the metric values are read from.
+
+    ttl : float
+        Seconds the loaded values are reused before being read again.
+
+    Methods
+    -------
+    run(title):
+        Runs the predefined query with the given title.
+
+    invalidate():
+        Drops the loaded values so the next query reads them again.
+
+    z_score_outliers(threshold=2):
+        Global metric values more than threshold standard deviations from their metric's mean.
+
+    first_last_values():
+        The first and last recorded value of each metric.
+
+    rolling_average(window=90):
+        The average of each metric value and the window - 1 values before it.
+
+    percent_change(lag=4):
+        The change of each metric value against the value lag rows earlier, in percent.
+
+    quartiles(tiles=4):
+        The NTILE of each plan metric value within its plan and metric.
+
+    cumulative_distribution():
+        The CUME_DIST of each plan metric value within its plan.
+
+    """
+
+    def __init__(self, db, ttl = 600):
+
+        """
+        Initialize the engine; metric values are read on first use.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database the metric values are read from.
+
+        ttl : float, optional
+            Seconds loaded values are reused (default is 600).
+
+        Raises
+        ------
+        ImportError
+            If NumPy is not installed.
+
+        """
+
+        if np is None:
+            raise ImportError("NumPy is required for the analytics engine.")
+
+        self.db = db
+
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+
+        self._series = {}
+
+    def invalidate(self):
+
+        """
+        Drops the loaded values, e.g. after metric values were saved.
+
+        """
+
+        with self._lock:
+            self._series.clear()
+
+    def run(self, title):
+
+        """
+        Runs a predefined query by title with its default parameters.
+
+        Parameters
+        ----------
+        title : str
+            A title from QUERIES.
+
+        Returns
+        -------
+        list of Row
+            The query result.
+
+        """
+
+        return getattr(self, QUERIES[title])()
+
+    def _load(self, name, sql, sort_keys):
+
+        # Returns the columns of a series sorted by sort_keys (most significant
+        # first), reading them again once they are older than ttl.
+
+        with self._lock:
+            loaded = self._series.get(name)
+
+            if loaded is not None and time.monotonic() - loaded[0] < self.ttl:
+                return loaded[1]
+
+            result = self.db.query_columnar(sql, decimal_mode = "scaled")
+
+            columns = {column: result[column] for column in result.columns}
+
+            if len(result):
+                columns["metric_name"] = columns["metric_name"].astype(str)
+
+                order = np.lexsort([columns[key] for key in reversed(sort_keys)])
+
+                columns = {column: array[order] for column, array in columns.items()}
+
+            self._series[name] = (time.monotonic(), columns)
+
+            return columns
+
+    def _global_series(self):
+
+        return self._load("global", GLOBAL_SERIES_SQL, ["metric_id", "metric_date"])
+
+    def _plan_series(self):
+
+        return self._load("plan", PLAN_SERIES_SQL, ["plan_id", "metric_name", "actual_value"])
+
+    def z_score_outliers(self, threshold = 2):
+
+        """
+        Global metric values whose z-score within their metric exceeds threshold in absolute value.
+
+        The z-score uses the sample standard deviation; metrics with a single
+        value or no variation have none. Rows are ordered by absolute z-score,
+        largest first. Means and deviations are computed per metric_id.
+
+        Returns
+        -------
+        list of Row
+            metric_name, metric_date, actual_value and z_score.
+
+        """
+
+        series = self._global_series()
+
+        columns = ("metric_name", "metric_date", "actual_value", "z_score")
+
+        if not len(series["metric_id"]):
+            return []
+
+        values = series["actual_value"] / 100
+
+        starts, group = _partitions(series["metric_id"])
+
+        counts = np.bincount(group)
+
+        means = np.bincount(group, weights = values) / counts
+
+        deviations = values - means[group]
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            std = np.sqrt(np.bincount(group, weights = deviations ** 2) / (counts - 1))
+
+            z = deviations / std[group]
+
+        z[~np.isfinite(z) | (std[group] == 0)] = np.nan
+
+        keep = np.flatnonzero(np.abs(z) > threshold)
+
+        keep = keep[np.argsort(-np.abs(z[keep]), kind = "stable")]
+
+        return _rows(columns, [
+            series["metric_name"][keep].tolist(),
+            series["metric_date"][keep].tolist(),
+            _decimals(series["actual_value"][keep]),
+            z[keep].tolist()
+        ])
+
+    def first_last_values(self):
+
+        """
+        The first and last recorded value of each metric, by metric_date.
+
+        Returns
+        -------
+        list of Row
+            metric_name, f_value and l_value.
+
+        """
+
+        series = self._global_series()
+
+        if not len(series["metric_id"]):
+            return []
+
+        starts, group = _partitions(series["metric_id"])
+
+        ends = np.append(starts[1:], len(group)) - 1
+
+        return _rows(("metric_name", "f_value", "l_value"), [
+            series["metric_name"][starts].tolist(),
+            _decimals(series["actual_value"][starts]),
+            _decimals(series["actual_value"][ends])
+        ])
+
+    def rolling_average(self, window = 90):
+
+        """
+        The average of each global metric value and the window - 1 values before it, per metric.
+
+        Like the SQL version (ROWS BETWEEN 89 PRECEDING AND CURRENT ROW), the
+        window counts rows, not days. Averages are computed exactly from
+        cumulative sums of cents and rounded as MySQL rounds AVG() of a
+        DECIMAL(10,2) column: to six places, then to two, halves away from zero.
+
+        Returns
+        -------
+        list of Row
+            metric_id, metric_name, metric_date and rolling_90_day_avg.
+
+        """
+
+        series = self._global_series()
+
+        if not len(series["metric_id"]):
+            return []
+
+        cents = series["actual_value"]
+
+        starts, group = _partitions(series["metric_id"])
+
+        index = np.arange(len(cents))
+
+        low = np.maximum(starts[group], index - (window - 1))
+
+        totals = np.concatenate(([0], np.cumsum(cents)))
+
+        sums = totals[index + 1] - totals[low]
+
+        counts = index + 1 - low
+
+        micro = _round_half_away(sums * 10000, counts)
+
+        averages = _round_half_away(micro, 10000)
+
+        return _rows(("metric_id", "metric_name", "metric_date", "rolling_90_day_avg"), [
+            series["metric_id"].tolist(),
+            series["metric_name"].tolist(),
+            series["metric_date"].tolist(),
+            _decimals(averages)
+        ])
+
+    def percent_change(self, lag = 4):
+
+        """
+        The percent change of each global metric value against the value lag rows earlier for its metric.
+
+        Returns
+        -------
+        list of Row
+            metric_id, metric_date, actual_value, previous_4_weeks (None for
+            the first lag values of a metric) and percent_change (None when
+            there is no earlier value or it is zero).
+
+        """
+
+        series = self._global_series()
+
+        if not len(series["metric_id"]):
+            return []
+
+        cents = series["actual_value"]
+
+        starts, group = _partitions(series["metric_id"])
+
+        index = np.arange(len(cents))
+
+        previous_index = index - lag
+
+        has_previous = previous_index >= starts[group]
+
+        previous = np.where(has_previous, cents[np.maximum(previous_index, 0)], 0)
+
+        valid = has_previous & (previous != 0)
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            change = (cents - previous) / previous * 100
+
+        previous_values = _decimals(previous)
+
+        return _rows(("metric_id", "metric_date", "actual_value", "previous_4_weeks", "percent_change"), [
+            series["metric_id"].tolist(),
+            series["metric_date"].tolist(),
+            _decimals(cents),
+            [value if present else None for value, present in zip(previous_values, has_previous.tolist())],
+            [value if ok else None for value, ok in zip(change.tolist(), valid.tolist())]
+        ])
+
+    def quartiles(self, tiles = 4):
+
+        """
+        The NTILE(tiles) of each plan metric value within its plan and metric, largest values first.
+
+        Returns
+        -------
+        list of Row
+            plan_id, metric_name, actual_value and quartile.
+
+        """
+
+        series = self._plan_series()
+
+        if not len(series["plan_id"]):
+            return []
+
+        # Within each partition values are sorted ascending; NTILE ranks them descending.
+
+        starts, group = _partitions(series["plan_id"], series["metric_name"])
+
+        counts = np.bincount(group)
+
+        ends = starts + counts
+
+        position = ends[group] - 1 - np.arange(len(group))
+
+        size, extra = np.divmod(counts[group], tiles)
+
+        large = extra * (size + 1)
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            tile = np.where(
+                position < large,
+                position // (size + 1),
+                extra + (position - large) // np.maximum(size, 1)
+            ) + 1
+
+        return _rows(("plan_id", "metric_name", "actual_value", "quartile"), [
+            series["plan_id"].tolist(),
+            series["metric_name"].tolist(),
+            _decimals(series["actual_value"]),
+            tile.tolist()
+        ])
+
+    def cumulative_distribution(self):
+
+        """
+        The CUME_DIST of each plan metric value within its plan, largest values first.
+
+        This is the share of the plan's values that are greater than or equal to the value.
+
+        Returns
+        -------
+        list of Row
+            plan_id, metric_name, actual_value and cumulative_distribution.
+
+        """
+
+        series = self._plan_series()
+
+        if not len(series["plan_id"]):
+            return []
+
+        plan_order = np.lexsort((series["actual_value"], series["plan_id"]))
+
+        plan_ids = series["plan_id"][plan_order]
+
+        cents = series["actual_value"][plan_order]
+
+        starts, group = _partitions(plan_ids)
+
+        ends = starts + np.bincount(group)
+
+        # Rows with a value >= v are those from v's first peer to the partition end.
+
+        first_peer = _first_peer(group, cents)
+
+        distribution = (ends[group] - first_peer) / (ends - starts)[group]
+
+        return _rows(("plan_id", "metric_name", "actual_value", "cumulative_distribution"), [
+            plan_ids.tolist(),
+            series["metric_name"][plan_order].tolist(),
+            _decimals(cents),
+            distribution.tolist()
+        ])
+
+def _partitions(*keys):
+
+    # For arrays sorted by keys, returns the start index of each partition
+    # and the partition number of each row.
+
+    boundary = np.zeros(len(keys[0]), dtype = bool)
+
+    boundary[0] = True
+
+    for key in keys:
+        boundary[1:] |= key[1:] != key[:-1]
+
+    starts = np.flatnonzero(boundary)
+
+    return starts, np.cumsum(boundary) - 1
+
+def _first_peer(group, values):
+
+    # For rows sorted by group and value, the index of the first row of each
+    # row's run of equal values.
+
+    boundary = np.ones(len(values), dtype = bool)
+
+    boundary[1:] = (group[1:] != group[:-1]) | (values[1:] != values[:-1])
+
+    return np.maximum.accumulate(np.where(boundary, np.arange(len(values)), 0))
+
+def _round_half_away(numerator, denominator):
+
+    # Integer division rounded half away from zero.
+
+    magnitude = (2 * np.abs(numerator) + denominator) // (2 * denominator)
+
+    return np.where(numerator < 0, -magnitude, magnitude)
+
+def _decimals(cents):
+
+    return [Decimal(value).scaleb(-2) for value in cents.tolist()]
+
+def _rows(columns, values):
+
+    cls = row_class(columns)
+
+    return [cls(row) for row in zip(*values)]
@@ -0,0 +1,434 @@
+import math
+import sys
+from decimal import Decimal
+
+# Metric value tables with running statistics, and whether their values are per plan.
+
+PLAN_LEVEL = {
+    "global_metric_value": False,
+    "plan_metric_value": True
+}
+
+# Statistics upsert clause, the prefix of a row-value IN list (SQLite needs a
+# VALUES list), and the insert that creates missing statistics rows so they can
+# be locked before they are read (None where writes are already serialized).
+
+DIALECTS = {
+    "mysql": {
+        "upsert": "ON DUPLICATE KEY UPDATE value_count = VALUES(value_count), mean_value = VALUES(mean_value), m2 = VALUES(m2)",
+        "rows": "",
+        "seed": "INSERT IGNORE",
+        "lock": " FOR UPDATE"
+    },
+    "sqlite": {
+        "upsert": "ON CONFLICT (metric_id, plan_id) DO UPDATE SET value_count = excluded.value_count, mean_value = excluded.mean_value, m2 = excluded.m2",
+        "rows": "VALUES ",
+        "seed": None,
+        "lock": ""
+    }
+}
+
+# Keys per statement when reading or refreshing statistics.
+
+KEY_BATCH = 500
+
+class MetricStats:
+
+    """
+    Running per-metric and per-(metric, plan) statistics, updated as metric values are written.
+
+    The metric_stats table holds the count, mean and sum of squared
+    deviations (M2) of the values of each metric, with plan_id 0 for global
+    metric values. The backends call record() with the rows of each insert
+    or upsert batch, on the cursor that writes them, so the statistics are
+    updated with Welford's method and committed in the same transaction.
+
+    Before a value is added, its z-score is taken against the statistics of
+    the values before it. Values more than threshold sample standard
+    deviations from the mean, once at least min_count earlier values exist,
+    are recorded in the metric_anomaly table. Checking a new value therefore
+    costs O(1) instead of a scan of the metric's history.
+
+    The statistics rows are read with a locking read (SELECT ... FOR UPDATE
+    on MySQL, after creating any that are missing), so concurrent
+    transactions updating the same metric queue on its row instead of each
+    writing back totals computed from the same snapshot. SQLite writes are
+    already serialized.
+
+    Upserts that replace a value remove the old value first. Updates and
+    deletes through the CRUD helpers, and bulk loads by importer.py,
+    recompute the statistics of the metrics they touch with refresh().
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The backend whose dialect and placeholder the statements use.
+
+    threshold : float
+        Absolute z-score above which a new value is flagged.
+
+    min_count : int
+        Earlier values a metric needs before its new values are checked.
+
+    Methods
+    -------
+    tracks(table, row):
+        Returns whether rows shaped like row can update the statistics directly.
+
+    keys(table, rows):
+        Returns the statistics keys of rows.
+
+    record(cursor, table, added, removed=()):
+        Applies Welford updates for rows written to a metric value table and flags outliers.
+
+    affected(cursor, table, conditions):
+        Returns the statistics keys of the rows matching conditions.
+
+    refresh(cursor, table, keys=None):
+        Recomputes statistics from the stored values.
+
+    """
+
+    def __init__(self, db, threshold = 2.0, min_count = 10):
+
+        """
+        Initialize the statistics.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The backend that owns the metric_stats and metric_anomaly tables.
+
+        threshold : float, optional
+            Absolute z-score above which a value is flagged (default is 2).
+
+        min_count : int, optional
+            Earlier values needed before a metric's values are checked (default is 10).
+
+        """
+
+        self.db = db
+
+        self.threshold = threshold
+
+        self.min_count = max(2, min_count)
+
+        ph = db.placeholder
+
+        self.upsert_sql = (
+            f"INSERT INTO metric_stats (metric_id, plan_id, value_count, mean_value, m2) "
+            f"VALUES ({ph}, {ph}, {ph}, {ph}, {ph}) {DIALECTS[db.dialect]['upsert']}"
+        )
+
+        seed = DIALECTS[db.dialect]["seed"]
+
+        self.seed_sql = seed and (
+            f"{seed} INTO metric_stats (metric_id, plan_id, value_count, mean_value, m2) "
+            f"VALUES ({ph}, {ph}, 0, 0, 0)"
+        )
+
+        self.anomaly_sql = (
+            f"INSERT INTO metric_anomaly (metric_id, plan_id, metric_date, actual_value, z_score) "
+            f"VALUES ({ph}, {ph}, {ph}, {ph}, {ph})"
+        )
+
+    def _key(self, table, row):
+
+        return (row["metric_id"], row["plan_id"] if PLAN_LEVEL[table] else 0)
+
+    def tracks(self, table, row):
+
+        """
+        Returns whether rows shaped like row can update the statistics directly.
+
+        Rows must carry actual_value and the statistics key columns; other
+        writes leave the statistics to refresh() or "python anomaly.py rebuild".
+
+        """
+
+        if table not in PLAN_LEVEL:
+            return False
+
+        return all(col in row for col in ("metric_id", "actual_value") + (("plan_id",) if PLAN_LEVEL[table] else ()))
+
+    def keys(self, table, rows):
+
+        """
+        Returns the statistics keys of rows of a metric value table.
+
+        Parameters
+        ----------
+        table : str
+            The metric value table.
+
+        rows : iterable of dict
+            Rows with metric_id and, for plan values, plan_id.
+
+        Returns
+        -------
+        set of tuple
+            (metric_id, plan_id) keys, without rows lacking a metric or plan.
+
+        """
+
+        keys = {self._key(table, row) for row in rows}
+
+        return {key for key in keys if None not in key}
+
+    def record(self, cursor, table, added, removed = ()):
+
+        """
+        Applies Welford updates for rows added to, or replaced in, a metric value table.
+
+        Parameters
+        ----------
+        cursor : cursor
+            The dictionary cursor that wrote the rows, inside their transaction.
+
+        table : str
+            The table written; other tables are ignored.
+
+        added : list of dict
+            The rows written, with metric_id, plan_id (plan values only),
+            metric_date and actual_value.
+
+        removed : list of dict, optional
+            The stored rows that added rows replaced, for upserts.
+
+        Returns
+        -------
+        list of dict
+            The flagged rows, with metric_id, plan_id, metric_date, actual_value and z_score.
+
+        """
+
+        if not added or not self.tracks(table, added[0]):
+            return []
+
+        # Values without a metric (or plan) have no statistics.
+
+        added = [row for row in added if None not in self._key(table, row)]
+
+        removed = [row for row in removed if None not in self._key(table, row)]
+
+        if not added:
+            return []
+
+        stats = self._read(cursor, {self._key(table, row) for row in added + removed})
+
+        for row in removed:
+            _remove(stats[self._key(table, row)], float(row["actual_value"]))
+
+        anomalies = []
+
+        for row in added:
+            key = self._key(table, row)
+
+            value = float(row["actual_value"])
+
+            count, mean, m2 = stats[key]
+
+            if count >= self.min_count and m2 > 0:
+                z_score = (value - mean) / math.sqrt(m2 / (count - 1))
+
+                if abs(z_score) > self.threshold:
+                    anomalies.append({
+                        "metric_id": key[0],
+                        "plan_id": key[1],
+                        "metric_date": row.get("metric_date"),
+                        "actual_value": row["actual_value"],
+                        "z_score": z_score
+                    })
+
+            _add(stats[key], value)
+
+        cursor.executemany(self.upsert_sql, [key + tuple(values) for key, values in stats.items()])
+
+        if anomalies:
+            cursor.executemany(self.anomaly_sql, [tuple(anomaly.values()) for anomaly in anomalies])
+
+        return anomalies
+
+    def _read(self, cursor, keys):
+
+        stats = {key: [0, 0.0, 0.0] for key in keys}
+
+        # Sorted so that transactions lock shared keys in the same order.
+
+        keys = sorted(keys)
+
+        if self.seed_sql:
+            cursor.executemany(self.seed_sql, keys)
+
+        for start in range(0, len(keys), KEY_BATCH):
+            batch = keys[start:start + KEY_BATCH]
+
+            cursor.execute(
+                f"SELECT metric_id, plan_id, value_count, mean_value, m2 FROM metric_stats WHERE (metric_id, plan_id) IN ({self._pairs(batch)})"
+                f"{DIALECTS[self.db.dialect]['lock']}",
+                tuple(value for key in batch for value in key)
+            )
+
+            for row in cursor.fetchall():
+                stats[(row["metric_id"], row["plan_id"])] = [row["value_count"], float(row["mean_value"]), float(row["m2"])]
+
+        return stats
+
+    def _pairs(self, keys):
+
+        ph = self.db.placeholder
+
+        return DIALECTS[self.db.dialect]["rows"] + ", ".join([f"({ph}, {ph})"] * len(keys))
+
+    def affected(self, cursor, table, conditions):
+
+        """
+        Returns the statistics keys of the rows of a metric value table matching conditions.
+
+        Parameters
+        ----------
+        cursor : cursor
+            A dictionary cursor.
+
+        table : str
+            The table about to be updated or deleted from.
+
+        conditions : dict
+            Column names and values selecting the rows.
+
+        Returns
+        -------
+        set of tuple
+            (metric_id, plan_id) keys; empty for other tables.
+
+        """
+
+        if table not in PLAN_LEVEL:
+            return set()
+
+        plan_column = "plan_id" if PLAN_LEVEL[table] else "0 AS plan_id"
+
+        where = " AND ".join(f"{col} = {self.db.placeholder}" for col in conditions)
+
+        cursor.execute(f"SELECT metric_id, {plan_column} FROM {table} WHERE {where}", tuple(conditions.values()))
+
+        return self.keys(table, cursor.fetchall())
+
+    def refresh(self, cursor, table, keys = None):
+
+        """
+        Recomputes the statistics of a metric value table from its stored values.
+
+        Parameters
+        ----------
+        cursor : cursor
+            A dictionary cursor, inside the transaction that changed the values.
+
+        table : str
+            The metric value table.
+
+        keys : iterable of tuple, optional
+            (metric_id, plan_id) keys to recompute (default is None, every metric).
+
+        """
+
+        if table not in PLAN_LEVEL or keys is not None and not keys:
+            return
+
+        plan_level = PLAN_LEVEL[table]
+
+        group = "metric_id, plan_id" if plan_level else "metric_id"
+
+        select = (
+            f"SELECT metric_id, {'plan_id' if plan_level else '0 AS plan_id'}, COUNT(*) AS value_count, "
+            f"SUM(actual_value) AS total, SUM(actual_value * actual_value) AS squares FROM {table}"
+        )
+
+        ph = self.db.placeholder
+
+        if keys is None:
+            cursor.execute(f"{select} GROUP BY {group}")
+            found = cursor.fetchall()
+            keys = []
+        else:
+            keys = list(keys)
+            found = []
+
+            for start in range(0, len(keys), KEY_BATCH):
+                batch = keys[start:start + KEY_BATCH]
+
+                if plan_level:
+                    where = f"(metric_id, plan_id) IN ({self._pairs(batch)})"
+                    params = tuple(value for key in batch for value in key)
+                else:
+                    where = f"metric_id IN ({', '.join([ph] * len(batch))})"
+                    params = tuple(key[0] for key in batch)
+
+                cursor.execute(f"{select} WHERE {where} GROUP BY {group}", params)
+
+                found.extend(cursor.fetchall())
+
+        # Keys without values left keep a row with a zero count.
+
+        stats = {key: (0, 0.0, 0.0) for key in keys}
+
+        for row in found:
+            if row["metric_id"] is None or row["plan_id"] is None:
+                continue
+
+            count = row["value_count"]
+
+            total = Decimal(str(row["total"]))
+
+            squares = Decimal(str(row["squares"]))
+
+            stats[(row["metric_id"], row["plan_id"])] = (count, float(total / count), float(max(squares - total * total / count, 0)))
+
+        if stats:
+            cursor.executemany(self.upsert_sql, [key + values for key, values in stats.items()])
+
+def _add(stats, value):
+
+    stats[0] += 1
+
+    delta = value - stats[1]
+
+    stats[1] += delta / stats[0]
+
+    stats[2] += delta * (value - stats[1])
+
+def _remove(stats, value):
+
+    if stats[0] <= 1:
+        stats[:] = [0, 0.0, 0.0]
+        return
+
+    mean = (stats[0] * stats[1] - value) / (stats[0] - 1)
+
+    stats[2] = max(stats[2] - (value - stats[1]) * (value - mean), 0.0)
+
+    stats[1] = mean
+
+    stats[0] -= 1
+
+if __name__ == "__main__":
+
+    # Usage: python anomaly.py rebuild
+    # Recomputes metric_stats from all stored metric values, e.g. after upgrading a database.
+
+    from backend import open_database
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python anomaly.py rebuild")
+
+    db = open_database()
+
+    try:
+        with db.transaction():
+            with db.connection() as (conn, cursor):
+                for table in PLAN_LEVEL:
+                    db.metric_stats.refresh(cursor, table)
+    finally:
+        db.close()
+
+    print("metric_stats rebuilt")
@@ -3,12 +3,30 @@ from downloader import Downloader
 from messenger import Messenger
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
-from database import Database
+from analytics import QUERIES as ANALYTICS_QUERIES, open_analytics
+from backend import QueryInterruptedError, open_database
+from query_cost import QueryCostError
+from rows import row_class
+from snapshots import open_snapshots
 from tkcalendar import DateEntry
 from widget_binder import WidgetBinder
+from worker import Worker
+from write_behind import open_write_queue
 import tkinter.font as tkfont
 
-db = Database()
+db = open_database()
+
+# Durable local queue for form edits, or None when write_behind is off in config.ini.
+
+write_queue = open_write_queue(db)
+
+# NumPy engine for the window-function predefined queries, or None to run them in the database.
+
+analytics = open_analytics(db)
+
+# Materialized snapshots of saved queries, or None when the database has no snapshot tables.
+
+snapshots = open_snapshots(db)
 
 msg_handler = Messenger()
 
@@ -21,6 +39,10 @@ class App:
 
     """
 
+    # Number of records shown per page in each table tab.
+
+    PAGE_SIZE = 200
+
     def __init__(self, root):
         
         """
@@ -55,6 +77,30 @@ class App:
 
         self.root.geometry("1200x800")
 
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Run database and export work off the Tk thread, with a busy indicator
+        # in a status bar along the bottom of the window.
+
+        self.worker = Worker(root)
+
+        status_bar = self.worker.build_status_bar(root)
+
+        status_bar.pack(side = "bottom", fill = "x")
+
+        # With the write-behind queue enabled, show how many saved edits are
+        # still waiting to reach the server.
+
+        self.sync_label = ttk.Label(status_bar, text = "")
+
+        self.sync_label.pack(side = "right", padx = 10, pady = 2)
+
+        if write_queue is not None:
+            self.root.after(1000, self.check_write_queue)
+
+        if snapshots is not None:
+            self.root.after(snapshots.check_interval * 1000, self.check_snapshots)
+
         # ------------------------------------------
         # Create notebook for tabbed user interface.
         # ------------------------------------------
@@ -75,6 +121,17 @@ class App:
 
         self.trees = {}
 
+        # Keyset pagination state per table: a stack of page start keys, the
+        # rows shown on the current page and the page status labels.
+
+        self.page_keys = {}
+
+        self.page_rows = {}
+
+        self.page_labels = {}
+
+        self.refresh_pending = set()
+
         # Create combo dictionaries for initiatives, events, plans and metrics.
 
         self.init_list = db.execute_query("SELECT initiative_title, initiative_id FROM initiative;")
@@ -181,6 +238,8 @@ class App:
         
         init_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(init_button_frame, "initiative", 4)
+
         init_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -351,6 +410,8 @@ class App:
         
         metr_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(metr_button_frame, "metric", 4)
+
         metr_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -521,6 +582,8 @@ class App:
         
         evnt_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(evnt_button_frame, "event", 4)
+
         evnt_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -641,6 +704,8 @@ class App:
         
         plan_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(plan_button_frame, "plan", 4)
+
         plan_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -759,6 +824,8 @@ class App:
         
         ep_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(ep_button_frame, "event_plan", 4)
+
         ep_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -893,6 +960,8 @@ class App:
         
         gmv_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(gmv_button_frame, "global_metric_value", 4)
+
         gmv_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -1045,6 +1114,8 @@ class App:
         
         pmv_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(pmv_button_frame, "plan_metric_value", 4)
+
         pmv_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -1329,6 +1400,8 @@ class App:
         
         uq_refresh_btn.grid(row = 0, column = 3, padx = 5)
 
+        self.add_pager(uq_button_frame, "user_query", 4)
+
         uq_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create treeview frame.
@@ -1475,6 +1548,24 @@ class App:
         
         download_btn.grid(row = 0, column = 1, padx = 5)
 
+        cancel_query_btn = ttk.Button(query_button_frame,
+                                      command = self.cancel_query,
+                                      text = "Cancel Query")
+
+        cancel_query_btn.grid(row = 0, column = 2, padx = 5)
+
+        materialize_btn = ttk.Button(query_button_frame,
+                                     command = self.materialize_selected_query,
+                                     text = "Materialize")
+
+        materialize_btn.grid(row = 0, column = 3, padx = 5)
+
+        drop_snapshot_btn = ttk.Button(query_button_frame,
+                                       command = self.drop_selected_snapshot,
+                                       text = "Drop Snapshot")
+
+        drop_snapshot_btn.grid(row = 0, column = 4, padx = 5)
+
         query_button_frame.pack(fill = "x", padx = 10, pady = 10)
 
         # Create query output frame.
@@ -1487,6 +1578,12 @@ class App:
 
         lbl_query_output = ttk.Label(query_output_frame, width = 20, text = "Query Result:").grid(row = 0, column = 0, padx = 5, pady = 2, sticky = "w")
 
+        # Shows when a result served from a snapshot was refreshed, and whether it is stale.
+
+        self.snapshot_label = ttk.Label(query_output_frame, text = "")
+
+        self.snapshot_label.grid(row = 0, column = 0, padx = 5, pady = 2, sticky = "e")
+
         self.query_output_table = ttk.Treeview(query_output_frame)
 
         self.query_output_table.grid(row = 1, column = 0, padx = 5, pady = 2, sticky = "nsew")
@@ -1507,15 +1604,21 @@ class App:
 
         column = self.query_type_filters[selected_type]
 
+        flags = [c for c in self.query_type_filters.values() if c]
+
         if column:
-            sql = f"SELECT query_title, query_string FROM user_query WHERE {column} = 1 ORDER BY query_title;"
+            sql = f"SELECT query_title, query_string, {', '.join(flags)} FROM user_query WHERE {column} = 1 ORDER BY query_title;"
         else:
-            sql = "SELECT query_title, query_string FROM user_query ORDER BY query_title;"
+            sql = f"SELECT query_title, query_string, {', '.join(flags)} FROM user_query ORDER BY query_title;"
 
         filtered_queries = db.execute_query(sql)
 
         self.title_to_query_map = {q['query_title']: q['query_string'] for q in filtered_queries}
 
+        # Query categories pick the execution time limit used by run_selected_query.
+
+        self.title_to_category_map = {q['query_title']: [c for c in flags if q[c]] for q in filtered_queries}
+
         titles = list(self.title_to_query_map.keys())
 
         self.query_dropdown['values'] = titles
@@ -1585,9 +1688,12 @@ class App:
             - Uses `collect_form_data()` to gather values from the input widgets.
             - For the 'metric' table, retrieves the `initiative_id` from a bound entry via 
             `self.binder.get_id_entry_value()`. (This value is currently unused.)
-            - Attempts to insert the collected data using `db.insert()`.
+            - Inserts the collected data using `db.insert()` on the background worker; 
+            a second click while the insert is running is ignored.
             - On success, clears the form and refreshes the record display.
             - On failure, displays an error dialog with exception details.
+            - With the write-behind queue enabled, the record is saved to the local queue 
+            instead and the form is cleared at once; it appears once the queue reaches the server.
 
         Notes:
             - Handles exceptions gracefully with user-facing error messages.
@@ -1611,11 +1717,23 @@ class App:
 
             # print(f"Resolved initiative_id: {initiative_id}")
 
-            db.insert(table, data)
-            self.clear_fields(table)
-            self.refresh_records(table)
         except Exception as e:
             msg_handler.show_error("Error", {e})
+            return
+
+        if write_queue is not None:
+            try:
+                write_queue.enqueue_insert(table, data)
+            except Exception as e:
+                msg_handler.show_error("Error", {e})
+                return
+
+            self.record_queued(table)
+            return
+
+        self.worker.submit(f"add:{table}", db.insert, table, data,
+                           on_success = lambda result: self.record_saved(table),
+                           on_error = lambda e: msg_handler.show_error("Error", {e}))
 
     def validate_and_add(self, table_name):
 
@@ -1668,10 +1786,14 @@ class App:
             - If no record is selected, a warning is displayed and the operation is aborted.
             - Only fields with non-empty values are included in the update payload.
             - Primary key fields are excluded from updates.
-            - After updating, the form is cleared and the treeview is refreshed.
+            - The update runs on the background worker; after it succeeds, the form is cleared 
+            and the treeview is refreshed.
+            - With the write-behind queue enabled, the update is saved to the local queue with 
+            the values shown in the treeview, so a change made meanwhile by another user is 
+            reported as a conflict instead of being overwritten.
 
         Notes:
-            - Assumes the first column (or first two for 'event_plan') form the primary key(s).
+            - Primary key columns, including composite keys, come from the database metadata catalog.
             - Relies on `self.binder.get_widget_value()` to retrieve widget values.
             - Relies on `db.update()` to persist changes to the database.
         """
@@ -1684,11 +1806,11 @@ class App:
 
         selected_values = self.trees[table].item(selected_item)["values"]
 
-        columns = db.get_columns(table)
+        tree_columns = list(self.trees[table]["columns"])
 
-        primary_keys = [columns[0]] if table != "event_plan" else ["event_id", "plan_id"]
+        primary_keys = db.get_primary_keys(table)
 
-        conditions = {key: selected_values[i] for i, key in enumerate(primary_keys) if selected_values[i] is not None}
+        conditions = {key: selected_values[tree_columns.index(key)] for key in primary_keys}
 
         updated_data = {}
 
@@ -1706,11 +1828,21 @@ class App:
             msg_handler.show_warning("Warning", "No fields to update.")
             return
 
-        db.update(table, updated_data, conditions)
+        if write_queue is not None:
+            original = {col: selected_values[tree_columns.index(col)] for col in updated_data if col in tree_columns}
 
-        self.clear_fields(table)
+            try:
+                write_queue.enqueue_update(table, updated_data, conditions, original)
+            except Exception as e:
+                msg_handler.show_error("Error", {e})
+                return
 
-        self.refresh_records(table)
+            self.record_queued(table)
+            return
+
+        self.worker.submit(f"update:{table}", db.update, table, updated_data, conditions,
+                           on_success = lambda result: self.record_saved(table),
+                           on_error = lambda e: msg_handler.show_error("Database Error", {e}))
 
     def validate_and_update(self, table_name):
 
@@ -1760,7 +1892,7 @@ class App:
 
         Behavior:
             - If no record is selected, a warning message is shown and the operation is canceled.
-            - Assumes the first column returned by `db.get_columns(table)` is the primary key.
+            - Identifies the record by the primary key columns from `db.get_primary_keys(table)`.
             - Prompts the user for confirmation before performing the deletion.
 
         Notes:
@@ -1776,44 +1908,337 @@ class App:
         
         selected_values = self.trees[table].item(selected_item)["values"]
 
-        columns = db.get_columns(table)
+        tree_columns = list(self.trees[table]["columns"])
 
-        primary_key = columns[0]
+        primary_keys = db.get_primary_keys(table)
 
-        conditions = {primary_key: selected_values[0]}
+        conditions = {key: selected_values[tree_columns.index(key)] for key in primary_keys}
 
         confirm = messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this record?")
 
         if confirm:
-            db.delete(table, conditions)
-            self.clear_fields(table)
-            self.refresh_records(table)
+            self.worker.submit(f"delete:{table}", db.delete, table, conditions,
+                               on_success = lambda result: self.record_saved(table),
+                               on_error = lambda e: msg_handler.show_error("Database Error", {e}))
+
+    def add_pager(self, parent, table, column):
+
+        """
+        Adds Previous/Next page buttons and a page status label to a tab's button frame.
+
+        Parameters:
+            parent (ttk.Frame): The button frame of the tab.
+            table (str): The name of the table displayed by the tab.
+            column (int): The grid column of the first pager widget.
+        """
+
+        prev_btn = ttk.Button(parent,
+                              command = lambda: self.previous_page(table),
+                              text = "< Previous")
+
+        prev_btn.grid(row = 0, column = column, padx = 5)
+
+        next_btn = ttk.Button(parent,
+                              command = lambda: self.next_page(table),
+                              text = "Next >")
+
+        next_btn.grid(row = 0, column = column + 1, padx = 5)
+
+        page_label = ttk.Label(parent, text = "")
+
+        page_label.grid(row = 0, column = column + 2, padx = 5, sticky = "w")
+
+        self.page_labels[table] = page_label
+
+        self.page_keys[table] = [None]
 
     def refresh_records(self, table):
 
         """
-        Refreshes the treeview display by fetching and loading all records from the specified table.
+        Refreshes the treeview display by fetching and loading the current page of the specified table.
 
-        This method clears any existing rows in the treeview and repopulates it with fresh data 
-        retrieved from the database. It ensures that NULL values from the database are converted 
-        to empty strings for a cleaner display in the UI.
+        This method clears any existing rows in the treeview and repopulates it with one page of 
+        fresh data retrieved from the database, newest records first. It ensures that NULL values 
+        from the database are converted to empty strings for a cleaner display in the UI.
 
         Parameters:
             table (str): The name of the table whose records should be fetched and displayed.
 
         Notes:
             - Assumes `self.trees[table]` refers to the treeview widget associated with the table.
-            - Uses `db.fetch_all(table)` to retrieve data as dictionaries.
-            - Record values are inserted in the order returned by `record.values()`.
+            - Uses `db.fetch_page()` with keyset pagination on the primary key; one extra row is 
+            requested to tell whether a next page exists.
+            - The fetch runs on the background worker and the treeview is filled by `show_page()`.
+            - Records are `rows.Row` tuples, so their values are inserted in column order without 
+            building a dictionary per row.
+        """
+
+        page_keys = self.page_keys.setdefault(table, [None])
+
+        key = f"refresh:{table}"
+
+        if self.worker.is_busy(key):
+            self.refresh_pending.add(table)
+            return
+
+        self.worker.submit(key, self.load_page, table, page_keys[-1], table in self.page_labels,
+                           on_success = lambda page: self.show_page(table, page),
+                           on_error = lambda e: msg_handler.show_error("Database Error", {e}))
+
+    def load_page(self, table, after_key, with_estimate):
+
+        """
+        Fetches one page of records and, optionally, the table's row-count estimate.
+
+        Runs on the background worker and touches no widgets.
+
+        Parameters:
+            table (str): The name of the table to fetch.
+            after_key (tuple or None): Key of the last row of the previous page.
+            with_estimate (bool): Whether to look up the row-count estimate.
+
+        Returns:
+            tuple: The page records (including one look-ahead row) and the estimate or None.
         """
 
+        records = db.fetch_page(table, after_key = after_key, limit = self.PAGE_SIZE + 1, descending = True)
+
+        estimate = db.estimate_row_count(table) if with_estimate else None
+
+        return records, estimate
+
+    def show_page(self, table, page):
+
+        """
+        Loads a fetched page of records into the table's treeview.
+
+        Parameters:
+            table (str): The name of the table being displayed.
+            page (tuple): The records and row-count estimate returned by `load_page()`.
+        """
+
+        records, estimate = page
+
+        has_next = len(records) > self.PAGE_SIZE
+
+        records = records[:self.PAGE_SIZE]
+
+        self.page_rows[table] = (records, has_next)
+
         for row in self.trees[table].get_children():
             self.trees[table].delete(row)
 
-        for record in db.fetch_all(table):
-            cleaned_record = tuple("" if v is None else v for v in record.values())
+        for record in records:
+            cleaned_record = tuple("" if v is None else v for v in record)
             self.trees[table].insert("", "end", values = cleaned_record)
 
+        if estimate is not None:
+            pages = max(1, -(-estimate // self.PAGE_SIZE))
+            self.page_labels[table].config(text = f"Page {len(self.page_keys[table])} of ~{pages} ({estimate:,} rows est.)")
+
+        # A refresh requested while this one was running (e.g. after a save) runs now.
+
+        if table in self.refresh_pending:
+            self.refresh_pending.discard(table)
+            self.refresh_records(table)
+
+    def record_saved(self, table):
+
+        """
+        Clears the form and refreshes the treeview after a successful add, update or delete.
+
+        Parameters:
+            table (str): The name of the table that was changed.
+        """
+
+        self.clear_fields(table)
+
+        self.refresh_records(table)
+
+        self.metric_values_changed(table)
+
+        self.snapshot_sources_changed(table)
+
+    def metric_values_changed(self, table):
+
+        """
+        Makes the analytics engine read metric values again after a table it uses was changed.
+
+        Parameters:
+            table (str): The name of the table that was changed.
+        """
+
+        if analytics is not None and table in ("metric", "plan", "global_metric_value", "plan_metric_value"):
+            analytics.invalidate()
+
+    def snapshot_sources_changed(self, table):
+
+        """
+        Reloads the snapshot definitions after a saved query was edited or removed.
+
+        The snapshot manager is told of the table writes themselves by the database
+        (see SnapshotManager.table_changed), so nothing is marked stale here.
+
+        Parameters:
+            table (str): The name of the table that was changed.
+        """
+
+        if snapshots is None or table != "user_query":
+            return
+
+        self.worker.submit("snapshot_load", snapshots.load,
+                           on_error = lambda e: msg_handler.show_error("Snapshot Error", {e}))
+
+    def record_queued(self, table):
+
+        """
+        Clears the form after an add or update is saved to the write-behind queue.
+
+        Parameters:
+            table (str): The name of the table that was changed.
+        """
+
+        self.clear_fields(table)
+
+        self.show_sync_status()
+
+    def show_sync_status(self):
+
+        """
+        Shows the number of queued edits not yet sent to the server in the status bar.
+
+        """
+
+        pending = write_queue.pending_count()
+
+        self.sync_label.config(text = f"{pending} edit{'s' if pending != 1 else ''} waiting to sync" if pending else "All edits synced")
+
+    def check_write_queue(self):
+
+        """
+        Polls the write-behind queue on the Tkinter thread.
+
+        Behavior:
+            - Refreshes the tabs of tables the queue has written to.
+            - Shows a warning listing edits the server refused or that conflicted 
+            with another user's change.
+            - Updates the sync status and schedules the next check.
+        """
+
+        for table in write_queue.take_flushed_tables():
+            if table in self.trees:
+                self.refresh_records(table)
+
+            self.metric_values_changed(table)
+
+            self.snapshot_sources_changed(table)
+
+        conflicts = write_queue.take_conflicts()
+
+        if conflicts:
+            details = "\n".join(f"{c['operation'].title()} of {c['table']}: {c['reason']}" for c in conflicts)
+            msg_handler.show_warning("Edits Not Saved", f"These edits could not be saved and were set aside:\n\n{details}")
+
+        self.show_sync_status()
+
+        self.root.after(1000, self.check_write_queue)
+
+    def check_snapshots(self):
+
+        """
+        Refreshes due snapshots on the background worker and schedules the next check.
+
+        Behavior:
+            - Snapshots are due when their refresh interval has passed or a table their 
+            query reads was changed from this application.
+            - A check is skipped while a refresh is still running.
+        """
+
+        if not self.worker.is_busy("snapshot_refresh") and snapshots.due():
+            self.worker.submit("snapshot_refresh", snapshots.refresh_due)
+
+        self.root.after(snapshots.check_interval * 1000, self.check_snapshots)
+
+    def materialize_selected_query(self):
+
+        """
+        Materializes the selected saved query into a snapshot, which Run Query then serves.
+
+        Behavior:
+            - The snapshot is filled on the background worker with a full refresh, and is 
+            refreshed every `snapshot_interval` seconds and when the tables it reads change.
+            - Incremental refreshes and other intervals are set with `python snapshots.py add`.
+        """
+
+        title = self.selected_query_title.get()
+
+        if not title:
+            msg_handler.show_warning("User Error", "Must select a query to materialize.")
+            return
+
+        if snapshots is None:
+            msg_handler.show_warning("Snapshots Unavailable", "The database has no query_snapshot table; run add_query_snapshot.sql first.")
+            return
+
+        self.worker.submit("snapshot_refresh", snapshots.materialize, title,
+                           on_success = lambda count: msg_handler.show_info("Snapshot Created", f"{title} is materialized with {count} rows."),
+                           on_error = lambda e: msg_handler.show_error("Snapshot Error", {e}))
+
+    def drop_selected_snapshot(self):
+
+        """
+        Drops the snapshot of the selected saved query, which then runs live again.
+
+        """
+
+        title = self.selected_query_title.get()
+
+        if not title or snapshots is None or not snapshots.is_materialized(title):
+            msg_handler.show_warning("User Error", "Must select a materialized query.")
+            return
+
+        self.worker.submit("snapshot_drop", snapshots.drop, title,
+                           on_success = lambda _: self.snapshot_label.config(text = ""),
+                           on_error = lambda e: msg_handler.show_error("Snapshot Error", {e}))
+
+    def next_page(self, table):
+
+        """
+        Shows the next page of records for the specified table, if there is one.
+
+        Parameters:
+            table (str): The name of the table being paged.
+        """
+
+        records, has_next = self.page_rows.get(table, ([], False))
+
+        if not has_next or self.worker.is_busy(f"refresh:{table}"):
+            return
+
+        order_columns = db.page_order(table)
+
+        last = records[-1]
+
+        self.page_keys[table].append(tuple(last[col] for col in order_columns))
+
+        self.refresh_records(table)
+
+    def previous_page(self, table):
+
+        """
+        Shows the previous page of records for the specified table, if there is one.
+
+        Parameters:
+            table (str): The name of the table being paged.
+        """
+
+        if len(self.page_keys.get(table, [None])) <= 1 or self.worker.is_busy(f"refresh:{table}"):
+            return
+
+        self.page_keys[table].pop()
+
+        self.refresh_records(table)
+
     def select_record(self, table):
 
         """
@@ -1871,7 +2296,8 @@ class App:
 
         This method retrieves the title of the selected query from the UI and looks up
         the corresponding SQL query from a map. It then executes the query using the 
-        `db.execute_query()` function and populates the result into the Treeview widget 
+        `db.execute_query()` function, which serves unchanged results from the query 
+        cache, and populates the result into the Treeview widget 
         via `populate_table()`. If the query title is empty or not found, the user is 
         notified with a warning.
 
@@ -1882,12 +2308,20 @@ class App:
         Raises
         ------
         - User Error: If no query is selected, a warning is shown.
+        - Cost Guard: If the EXPLAIN estimate is over the configured row budget, the reasons 
+        are shown and the user may confirm to run the query anyway (or it is rejected).
+        - Time Limit: The query runs with the time limit for its categories; it can also be 
+        stopped with the Cancel Query button.
         - Database Error: If an error occurs during query execution or table population,
         an error message is displayed.
 
         Side Effects
         ------------
-        - Executes a database query.
+        - Executes a database query on the background worker; clicking again while it runs has no effect.
+        - Materialized queries are served from their snapshot, with when it was refreshed 
+        shown above the result; stale snapshots are refreshed in the background and shown again.
+        - Queries titled as in `analytics.QUERIES` are computed by the NumPy analytics engine 
+        instead, unless `analytics_engine = sql` is set in config.ini.
         - Populates the Treeview with the query result.
         - Updates `last_query_result` with the latest query result.
 
@@ -1901,14 +2335,183 @@ class App:
 
         query = self.title_to_query_map.get(title)
 
+        self.snapshot_label.config(text = "")
+
+        if query and snapshots is not None and snapshots.is_materialized(title):
+            self.serve_snapshot(title)
+            return
+
+        # Window-function queries with a predefined title are computed locally
+        # from metric values read once, instead of on the server.
+
+        if query and analytics is not None and title in ANALYTICS_QUERIES:
+            self.worker.submit("run_query", analytics.run, title,
+                               on_success = self.query_finished,
+                               on_error = lambda e: msg_handler.show_error("Analytics Error", {e}))
+            return
+
         if query:
-            try:
-                result = db.execute_query(query)
-                # print(f"Query returned {len(result)} rows")
-                self.populate_table(result)
-                self.last_query_result = result
-            except Exception as e:
-                msg_handler.show_error("Database Error", {e})
+            timeout = db.query_timeout(self.title_to_category_map.get(title, []))
+            self.start_query(query, check_cost = True, timeout = timeout)
+
+    def serve_snapshot(self, title):
+
+        """
+        Reads the stored result of a materialized query on the background worker.
+
+        Parameters
+        ----------
+        title : str
+            The title of the materialized query.
+
+        """
+
+        self.worker.submit("run_query", snapshots.read, title,
+                           on_success = lambda result: self.snapshot_finished(title, result),
+                           on_error = lambda e: msg_handler.show_error("Snapshot Error", {e}))
+
+    def snapshot_finished(self, title, result):
+
+        """
+        Displays a snapshot and its freshness, and refreshes it in the background if it is stale.
+
+        Parameters
+        ----------
+        title : str
+            The title of the materialized query.
+
+        result : tuple
+            The rows and status returned by `snapshots.read()`.
+
+        """
+
+        rows, status = result
+
+        self.query_finished(rows)
+
+        if status["refreshed_at"] is None:
+            text = "Snapshot not refreshed yet"
+        else:
+            text = f"Snapshot from {status['refreshed_at']:%Y-%m-%d %H:%M:%S}"
+
+        # A stale snapshot is shown at once and refreshed in the background.
+
+        if status["stale"]:
+            text += " (stale, refreshing)"
+
+            if not self.worker.is_busy("snapshot_refresh"):
+                self.worker.submit("snapshot_refresh", snapshots.refresh, title,
+                                   on_success = lambda _: self.snapshot_refreshed(title),
+                                   on_error = lambda e: msg_handler.show_error("Snapshot Error", {e}))
+
+        self.snapshot_label.config(text = text)
+
+    def snapshot_refreshed(self, title):
+
+        """
+        Shows a refreshed snapshot again if its query is still selected.
+
+        Parameters
+        ----------
+        title : str
+            The title of the materialized query.
+
+        """
+
+        if self.selected_query_title.get() == title:
+            self.serve_snapshot(title)
+
+    def start_query(self, query, check_cost, timeout = None):
+
+        """
+        Submits a query to the background worker, optionally behind the EXPLAIN cost guard.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query to execute.
+
+        check_cost : bool
+            Whether `db.execute_query()` should check the query against the row budget first.
+
+        timeout : float, optional
+            Server-side execution time limit in seconds.
+
+        """
+
+        self.worker.submit("run_query", lambda: db.execute_query(query, use_cache = True, check_cost = check_cost, timeout = timeout, cancel_key = "run_query"),
+                           on_success = self.query_finished,
+                           on_error = lambda e: self.query_failed(query, e, timeout))
+
+    def cancel_query(self):
+
+        """
+        Cancels the query started from the Run Queries tab, if one is running.
+
+        The KILL QUERY is issued from a separate control connection on the background 
+        worker; the running query then fails and `query_failed()` reports the cancellation.
+
+        """
+
+        if not self.worker.is_busy("run_query"):
+            return
+
+        self.worker.submit("cancel_query", lambda: db.cancel_query("run_query"),
+                           on_error = lambda e: msg_handler.show_error("Database Error", {e}))
+
+    def query_failed(self, query, error, timeout = None):
+
+        """
+        Reports a failed query; queries stopped by the cost guard may be confirmed and rerun.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query that failed.
+
+        error : Exception
+            The error raised by `db.execute_query()`.
+
+        timeout : float, optional
+            The time limit the query ran with, reused if it is confirmed and rerun.
+
+        """
+
+        if isinstance(error, QueryInterruptedError):
+            if error.timed_out:
+                msg_handler.show_warning("Query Timed Out", str(error))
+            else:
+                msg_handler.show_info("Query Cancelled", str(error))
+            return
+
+        if not isinstance(error, QueryCostError):
+            msg_handler.show_error("Database Error", {error})
+            return
+
+        if not error.confirmable:
+            msg_handler.show_error("Query Rejected", str(error))
+            return
+
+        if msg_handler.confirm_action("Expensive Query", f"{error}\n\nRun the query anyway?"):
+            self.start_query(query, check_cost = False, timeout = timeout)
+
+    def query_finished(self, result):
+
+        """
+        Displays the result of a query run by `run_selected_query()` on the background worker.
+
+        Parameters
+        ----------
+        result : list of Row
+            The rows returned by the query.
+
+        """
+
+        # print(f"Query returned {len(result)} rows")
+
+        self.populate_table(result)
+
+        self.last_query_result = result
 
     def populate_table(self, data):
 
@@ -1916,16 +2519,16 @@ class App:
         Populates the Treeview widget with tabular data.
 
         This method clears any existing data in the Treeview and repopulates it with
-        new rows based on the provided list of dictionaries. Each dictionary is assumed
-        to represent a row, with keys corresponding to column names.
+        new rows based on the provided list of rows. Each row is a `rows.Row` (or a
+        dictionary) whose keys correspond to column names.
 
         If `data` is empty or `None`, the method shows a user warning and exits early.
 
         Parameters
         ----------
-        data : List[Dict[str, Any]]
-            A list of dictionaries containing the data to display. Each dictionary
-            must have the same keys (column names).
+        data : List[Row]
+            A list of rows containing the data to display. Each row must have the
+            same keys (column names).
 
         Raises
         ------
@@ -1957,8 +2560,7 @@ class App:
                 self.query_output_table.column(col, anchor = "w")
 
             for row in data:
-                values = [row[col] for col in columns]
-                self.query_output_table.insert("", "end", values = values)
+                self.query_output_table.insert("", "end", values = tuple(row.values()))
 
         except Exception as e:
                 msg_handler.show_error("Database Error", {e})
@@ -1970,32 +2572,25 @@ class App:
 
         This method reads the visible contents of the Treeview (used to display query results),
         capturing both the column headers and the row data. It returns the data as a list of
-        dictionaries, where each dictionary represents a row and maps column names to values.
+        `rows.Row` objects sharing one column header, which can be read by name like dictionaries.
 
         Steps
         -----
             1. Retrieves column headers from the Treeview widget.
             2. Iterates over each row in the Treeview.
-            3. For each row, creates a dictionary pairing column names with cell values.
-            4. Collects all row dictionaries into a list.
+            3. For each row, wraps the cell values in the shared row type.
+            4. Collects all rows into a list.
 
         Returns
         -------
-        List[Dict[str, Any]]
-            A list of dictionaries, one per row in the Treeview.
+        List[Row]
+            A list of rows, one per row in the Treeview.
 
         """
 
-        columns = self.query_output_table["columns"]
-
-        data = []
-
-        for row_id in self.query_output_table.get_children():
-            row = self.query_output_table.item(row_id)["values"]
-            row_dict = dict(zip(columns, row))
-            data.append(row_dict)
+        row_type = row_class(tuple(self.query_output_table["columns"]))
 
-        return data
+        return [row_type(self.query_output_table.item(row_id)["values"]) for row_id in self.query_output_table.get_children()]
 
     def download_query_result(self):
 
@@ -2010,13 +2605,14 @@ class App:
         -----
             1. Extracts data from the treeview widget via `get_treeview_data()`.
             2. Retrieves the title of the selected query from the UI.
-            3. Calls the `downloader.download()` function with the data and title.
+            3. Prompts for a file path via `downloader.ask_file_path()`.
+            4. Writes the file with `downloader.save()` on the background worker.
 
         Assumes
         -------
             - `get_treeview_data()` returns a list or table-like structure.
             - `selected_query_title` is a `tk.StringVar` or similar, holding a string.
-            - `downloader.download()` is defined in a class file and handles the export.
+            - `downloader.save()` is defined in a class file and handles the export.
 
         Returns
         -------
@@ -2027,7 +2623,18 @@ class App:
 
         title = self.selected_query_title.get()
 
-        downloader.download(data, title)
+        if not data:
+            msg_handler.show_warning("Error", "No query result to download.")
+            return
+
+        file_path = downloader.ask_file_path(title)
+
+        if not file_path:
+            return
+
+        self.worker.submit("download", downloader.save, data, file_path,
+                           on_success = lambda result: msg_handler.show_info("Result Saved", f"Result saved to the following location: \n\n {file_path}"),
+                           on_error = lambda e: msg_handler.show_error("Download Error", f"Error saving file: \n\n {e}"))
 
     def goto_tab(self, table_name):
 
@@ -2045,6 +2652,22 @@ class App:
             tab_index = self.notebook.index(frame)
             self.notebook.select(tab_index)
 
+    def on_close(self):
+
+        """
+        Stops the background worker and closes the application window.
+
+        Edits still in the write-behind queue are kept in the queue file and sent at the next start.
+
+        """
+
+        self.worker.shutdown()
+
+        if write_queue is not None:
+            write_queue.close()
+
+        self.root.destroy()
+
 if __name__ == "__main__":
 
     root = tk.Tk()
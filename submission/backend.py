@@ -0,0 +1,557 @@
+from abc import ABC, abstractmethod
+import configparser
+from datetime import date
+from decimal import Decimal, InvalidOperation
+import os
+import re
+
+# Default execution time limits, in seconds, by user_query category. A saved
+# query uses the longest limit among the categories it is flagged with.
+
+DEFAULT_QUERY_TIMEOUTS = {
+    "default": 30,
+    "set_operation": 30,
+    "set_membership": 30,
+    "set_comparison": 30,
+    "subquery": 60,
+    "cte": 60,
+    "aggregate_function": 60,
+    "window_function": 120,
+    "olap": 120
+}
+
+def default_config_path():
+
+    """
+    Returns the path of the application config file.
+
+    The VALUE_DB_CONFIG environment variable takes precedence; otherwise
+    config.ini next to this module is used.
+
+    Returns
+    -------
+    str
+        Path to the config.ini file.
+
+    """
+
+    return os.environ.get(
+        "VALUE_DB_CONFIG",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+    )
+
+def load_query_timeouts(section):
+
+    """
+    Reads query time limits from a config section.
+
+    Parameters
+    ----------
+    section : configparser.SectionProxy
+        The [value] section; query_timeout sets the default limit and
+        query_timeout_<category> keys set per-category limits.
+
+    Returns
+    -------
+    dict
+        Seconds by category, including "default".
+
+    """
+
+    query_timeouts = {}
+
+    for category, seconds in DEFAULT_QUERY_TIMEOUTS.items():
+        key = "query_timeout" if category == "default" else f"query_timeout_{category}"
+        query_timeouts[category] = section.getfloat(key, fallback = seconds)
+
+    return query_timeouts
+
+def load_anomaly_settings(section):
+
+    """
+    Reads the anomaly detection settings from a config section.
+
+    Parameters
+    ----------
+    section : configparser.SectionProxy
+        The [value] section; anomaly_threshold is the absolute z-score above
+        which a new metric value is flagged and anomaly_min_count the number
+        of earlier values a metric needs before its values are checked.
+
+    Returns
+    -------
+    dict
+        threshold and min_count, as accepted by anomaly.MetricStats.
+
+    Raises
+    ------
+    ValueError
+        If the threshold is not positive or min_count is below 2.
+
+    """
+
+    anomaly_settings = {
+        "threshold": section.getfloat("anomaly_threshold", fallback = 2.0),
+        "min_count": section.getint("anomaly_min_count", fallback = 10)
+    }
+
+    if anomaly_settings["threshold"] <= 0:
+        raise ValueError("anomaly_threshold must be positive.")
+
+    if anomaly_settings["min_count"] < 2:
+        raise ValueError("anomaly_min_count must be at least 2.")
+
+    return anomaly_settings
+
+def open_database(config_file_path = None):
+
+    """
+    Opens the storage backend named by the backend key of the [value] config section.
+
+    Supported backends are "mysql" (the default, see database.Database) and
+    "sqlite" (see sqlite_backend.SQLiteDatabase), which reads sqlite_path
+    (":memory:" by default). Backend modules are imported on demand, so the
+    SQLite backend runs without mysql-connector installed.
+
+    Parameters
+    ----------
+    config_file_path : str, optional
+        Path to the config file (default is default_config_path()).
+
+    Returns
+    -------
+    StorageBackend
+        The opened database.
+
+    Raises
+    ------
+    ValueError
+        If the backend name is not supported.
+
+    """
+
+    path = config_file_path or default_config_path()
+
+    config = configparser.ConfigParser()
+
+    config.read(path)
+
+    if "value" not in config:
+        config["value"] = {}
+
+    section = config["value"]
+
+    backend = section.get("backend", fallback = "mysql").strip().lower()
+
+    if backend == "sqlite":
+        from sqlite_backend import SQLiteDatabase
+        return SQLiteDatabase(
+            section.get("sqlite_path", fallback = ":memory:"),
+            query_timeouts = load_query_timeouts(section),
+            anomaly_settings = load_anomaly_settings(section)
+        )
+
+    if backend == "mysql":
+        from database import Database
+        return Database(path)
+
+    raise ValueError(f"Unsupported database backend: {backend}")
+
+def key_text(row, key_columns):
+
+    """
+    Returns a comparable natural key for a row, so "2024-05-01" and date(2024, 5, 1) match.
+
+    """
+
+    return tuple(
+        row[col].isoformat() if isinstance(row[col], date) else str(row[col])
+        for col in key_columns
+    )
+
+def same_value(current, new):
+
+    """
+    Checks whether a stored value equals an incoming one after type coercion.
+
+    DECIMAL values are compared at the stored scale, so 1.5, "1.50" and
+    Decimal("1.500") all match a stored 1.50; dates match their ISO text.
+
+    """
+
+    if current is None or new is None:
+        return current is None and new is None
+
+    if isinstance(current, Decimal):
+        try:
+            return Decimal(str(new)).quantize(current) == current
+        except InvalidOperation:
+            return False
+
+    if isinstance(current, date) and not isinstance(new, date):
+        return current.isoformat() == str(new)
+
+    return current == new or str(current) == str(new)
+
+def classify_upserts(rows, existing, key_columns):
+
+    """
+    Splits a batch of upsert rows into new, changed and unchanged rows.
+
+    Parameters
+    ----------
+    rows : list of dict
+        Incoming rows, unique by natural key.
+
+    existing : list of Row
+        The stored rows with the same natural keys, read by a key probe.
+
+    key_columns : list of str
+        The natural key columns.
+
+    Returns
+    -------
+    tuple
+        The new rows, the changed rows and the number of unchanged rows.
+
+    """
+
+    current = {key_text(row, key_columns): row for row in existing}
+
+    new = []
+
+    changed = []
+
+    unchanged = 0
+
+    for row in rows:
+        match = current.get(key_text(row, key_columns))
+
+        if match is None:
+            new.append(row)
+        elif all(same_value(match[col], value) for col, value in row.items()):
+            unchanged += 1
+        else:
+            changed.append(row)
+
+    return new, changed, unchanged
+
+def group_upserts(rows, key_columns):
+
+    """
+    Groups upsert rows by column set, keeping the last row for each natural key.
+
+    Returns
+    -------
+    dict
+        (position in rows, row) pairs by column tuple.
+
+    Raises
+    ------
+    ValueError
+        If a row lacks a key column.
+
+    """
+
+    groups = {}
+
+    for i, row in enumerate(rows):
+        missing = [col for col in key_columns if col not in row]
+
+        if missing:
+            raise ValueError(f"Upsert row is missing key columns: {', '.join(missing)}")
+
+        groups.setdefault(tuple(row.keys()), {})[key_text(row, key_columns)] = (i, row)
+
+    return {columns: list(group.values()) for columns, group in groups.items()}
+
+class QueryInterruptedError(Exception):
+
+    """
+    Raised when a running query is stopped by its time limit or cancelled by the user.
+
+    Attributes
+    ----------
+    timed_out : bool
+        True if the execution time limit stopped the query; False if it was
+        cancelled.
+
+    """
+
+    def __init__(self, message, timed_out):
+
+        self.timed_out = timed_out
+
+        super().__init__(message)
+
+class StorageBackend(ABC):
+
+    """
+    The interface shared by the value measurement database backends.
+
+    Implementations are database.Database (MySQL) and
+    sqlite_backend.SQLiteDatabase (embedded SQLite, in memory or file backed).
+    fetch_all, fetch_page and execute_query return rows.Row objects, which
+    support both index and column-name access; other reads yield dictionaries
+    keyed by column name. Both provide transaction() and in_transaction(),
+    which the CRUD helpers honor when deciding whether to commit.
+    Implementations define dialect ("mysql" or "sqlite") and placeholder
+    ("%s" or "?"), set query_timeouts, a dictionary of seconds by
+    user_query category, id_allocator, metric_stats (an
+    anomaly.MetricStats) and metric_rollup (a rollup.MetricRollup), each None
+    when the schema lacks its table, and change_listeners, a list of
+    callables passed the name of each table written by the CRUD helpers or
+    reported to table_changed() (e.g. snapshots.SnapshotManager.table_changed),
+    and provide key_columns(table) and reserve_ids(table, count) for
+    generated keys.
+
+    Methods
+    -------
+    get_columns(table):
+        Returns the column names of a table.
+
+    insert(table, data):
+        Inserts a new record into the specified table.
+
+    fetch_all(table):
+        Fetches all records from the specified table.
+
+    update(table, data, conditions):
+        Updates records in the specified table based on given conditions.
+
+    delete(table, conditions):
+        Deletes records from the specified table based on given conditions.
+
+    transaction():
+        Context manager that defers CRUD commits to one commit at the end of the block.
+
+    call_procedure(procedure_name, params=()):
+        Calls a stored procedure with optional parameters.
+
+    validate_query(query_str):
+        Validates a user-input SQL to ensure it is a safe statement.
+
+    execute_query(query_str):
+        Executes a pre-defined or user-input SQL query after validation.
+
+    fill_block_keys(table, rows):
+        Fills missing block-allocated keys of rows for a bulk insert.
+
+    table_changed(table):
+        Notifies the backend of a write made outside the CRUD helpers.
+
+    reconnect():
+        Re-establishes a connection dropped by the server.
+
+    query_timeout(categories=()):
+        Returns the time limit for a query flagged with the given categories.
+
+    close():
+        Closes the database connection.
+
+    """
+
+    @abstractmethod
+    def get_columns(self, table):
+
+        """
+        Returns the column names of a table in ordinal order.
+
+        """
+
+    @abstractmethod
+    def insert(self, table, data):
+
+        """
+        Inserts a new record into the specified table.
+
+        """
+
+    @abstractmethod
+    def fetch_all(self, table):
+
+        """
+        Fetches all records from the specified table as a list of rows.Row objects.
+
+        """
+
+    @abstractmethod
+    def update(self, table, data, conditions):
+
+        """
+        Updates the record identified by the primary key values in conditions.
+
+        """
+
+    @abstractmethod
+    def delete(self, table, conditions):
+
+        """
+        Deletes records matching every column and value in conditions.
+
+        """
+
+    @abstractmethod
+    def call_procedure(self, procedure_name, params = ()):
+
+        """
+        Calls a stored procedure and returns its rows as a list of dictionaries.
+
+        """
+
+    @abstractmethod
+    def execute_query(self, query_str):
+
+        """
+        Executes a validated query and returns its rows as a list of rows.Row objects.
+
+        """
+
+    @abstractmethod
+    def close(self):
+
+        """
+        Closes the database connection.
+
+        """
+
+    def fill_block_keys(self, table, rows):
+
+        """
+        Fills missing block-allocated key values of rows headed for a bulk insert.
+
+        All missing values are reserved with one id allocator round trip.
+
+        Parameters
+        ----------
+        table : str
+            The table being loaded.
+
+        rows : iterable of dict
+            The rows to insert.
+
+        Returns
+        -------
+        list
+            The rows, with copies carrying a new key where it was missing.
+
+        """
+
+        rows = list(rows)
+
+        _, key = self.key_columns(table)
+
+        if key is None:
+            return rows
+
+        missing = [i for i, row in enumerate(rows) if row.get(key) in (None, "")]
+
+        for i, value in zip(missing, self.id_allocator.reserve(table, len(missing))):
+            rows[i] = {**rows[i], key: value}
+
+        return rows
+
+    @property
+    def value_trackers(self):
+
+        """
+        Returns the summaries kept up to date as metric values are written.
+
+        The CRUD helpers pass the metric value rows they write to each
+        tracker's record() and refresh() on their own cursor, so the
+        summaries commit with the values. Trackers are metric_stats
+        (anomaly.MetricStats) and metric_rollup (rollup.MetricRollup), when
+        the schema has their tables.
+
+        """
+
+        return [tracker for tracker in (getattr(self, "metric_stats", None), getattr(self, "metric_rollup", None)) if tracker]
+
+    def table_changed(self, table):
+
+        """
+        Tells the backend that a table was written outside the CRUD helpers.
+
+        Each of change_listeners is called with the table name. Backends with
+        result caches extend this to invalidate them.
+
+        """
+
+        for listener in self.change_listeners:
+            listener(table)
+
+    def reconnect(self):
+
+        """
+        Re-establishes a connection dropped by the server, e.g. after a network outage.
+
+        Backends without a persistent network connection have nothing to do.
+
+        """
+
+    def query_timeout(self, categories = ()):
+
+        """
+        Returns the execution time limit for a query flagged with the given categories.
+
+        Parameters
+        ----------
+        categories : iterable of str, optional
+            user_query flag columns set for the query, e.g. "window_function".
+
+        Returns
+        -------
+        float
+            The longest configured limit among the categories, or the default
+            limit if none of them has one.
+
+        """
+
+        limits = [self.query_timeouts[c] for c in categories if c in self.query_timeouts]
+
+        return max(limits) if limits else self.query_timeouts["default"]
+
+    def validate_query(self, query_str):
+
+        """
+        Validates a user-input SQL to ensure it is a safe statement.
+
+        Parameters
+        ----------
+        query_str : str
+            The query string to be validated.
+
+        bool
+            True if the query is safe, False otherwise.
+
+        Raises
+        ------
+        TypeError
+            If the input is not a string.
+
+        ValueError
+            If the query is empty.
+
+        Exception
+            If an error occurs while calling the stored procedure.
+
+        """
+
+        if not isinstance(query_str, str):
+            raise TypeError("Query must be a string.")
+
+        query_str = query_str.strip().lower()
+
+        if not query_str:
+            raise ValueError("Query cannot be empty.")
+
+        forbidden = ["drop", "delete", "alter", "truncate"]
+
+        # Use regex to match forbidden words as whole words.
+
+        pattern = r'\b(' + '|'.join(forbidden) + r')\b'
+
+        if re.search(pattern, query_str):
+            raise ValueError("Query contains forbidden SQL keywords.")
+
+        return True
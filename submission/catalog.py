@@ -0,0 +1,356 @@
+import threading
+import time
+
+class SchemaCatalog:
+
+    """
+    A cache of table metadata for the value measurement database.
+
+    The catalog loads column names, data types, nullability and primary keys
+    for every table in the current schema with a single information_schema
+    query, so CRUD helpers no longer need a SHOW COLUMNS round trip per call.
+    Entries are refreshed when they are older than the configured time to live
+    or after an explicit call to invalidate().
+
+    Attributes
+    ----------
+    db : Database
+        The database object used to run the metadata query.
+
+    ttl : float
+        Number of seconds a loaded catalog stays valid; 0 or less disables expiry.
+
+    tables : dict
+        Mapping of table name to a dictionary with "columns" (list of column
+        dictionaries in ordinal order), "primary_keys" (the columns that
+        identify a row, see primary_keys()), "clustered_key" (the primary key
+        columns as defined, in key order) and "view" (True for views).
+
+    Methods
+    -------
+    load(table=None):
+        Loads metadata for all tables, or for a single table.
+
+    invalidate(table=None):
+        Discards cached metadata for one table or for the whole schema.
+
+    columns(table):
+        Returns the column names of a table.
+
+    column_info(table):
+        Returns the column dictionaries of a table.
+
+    primary_keys(table):
+        Returns the columns that identify a row of a table.
+
+    clustered_key(table):
+        Returns the primary key columns of a table as defined.
+
+    table_names():
+        Returns the names of all known tables and views.
+
+    is_view(table):
+        Checks whether a name refers to a view.
+
+    """
+
+    CATALOG_SQL = """
+        SELECT
+            c.TABLE_NAME AS table_name,
+            c.COLUMN_NAME AS column_name,
+            c.DATA_TYPE AS data_type,
+            c.COLUMN_TYPE AS column_type,
+            c.IS_NULLABLE AS is_nullable,
+            c.EXTRA AS extra,
+            k.ORDINAL_POSITION AS key_position,
+            t.TABLE_TYPE AS table_type
+        FROM
+            information_schema.COLUMNS c
+        JOIN
+            information_schema.TABLES t
+                ON t.TABLE_SCHEMA = c.TABLE_SCHEMA
+                AND t.TABLE_NAME = c.TABLE_NAME
+        LEFT JOIN
+            information_schema.KEY_COLUMN_USAGE k
+                ON k.TABLE_SCHEMA = c.TABLE_SCHEMA
+                AND k.TABLE_NAME = c.TABLE_NAME
+                AND k.COLUMN_NAME = c.COLUMN_NAME
+                AND k.CONSTRAINT_NAME = 'PRIMARY'
+        WHERE
+            c.TABLE_SCHEMA = DATABASE()
+            {table_filter}
+        ORDER BY
+            c.TABLE_NAME,
+            c.ORDINAL_POSITION
+    """
+
+    def __init__(self, db, ttl = 300):
+
+        """
+        Initialize the catalog without loading it.
+
+        Parameters
+        ----------
+        db : Database
+            Database object exposing a connection() context manager.
+
+        ttl : float, optional
+            Seconds before the catalog is reloaded (default is 300).
+
+        """
+
+        self.db = db
+
+        self.ttl = ttl
+
+        self.tables = {}
+
+        self.loaded_at = None
+
+        self._lock = threading.RLock()
+
+    def load(self, table = None):
+
+        """
+        Loads metadata from information_schema in one query.
+
+        Parameters
+        ----------
+        table : str, optional
+            Restrict the reload to a single table (default reloads every table).
+
+        """
+
+        if table is None:
+            sql = self.CATALOG_SQL.format(table_filter = "")
+            params = ()
+        else:
+            sql = self.CATALOG_SQL.format(table_filter = "AND c.TABLE_NAME = %s")
+            params = (table,)
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        tables = {}
+
+        keys = {}
+
+        for row in rows:
+            name = row["table_name"]
+
+            info = tables.setdefault(name, {"columns": [], "primary_keys": [], "clustered_key": [], "view": row["table_type"] == "VIEW"})
+
+            info["columns"].append({
+                "name": row["column_name"],
+                "data_type": row["data_type"],
+                "column_type": row["column_type"],
+                "nullable": row["is_nullable"] == "YES",
+                "auto_increment": "auto_increment" in (row["extra"] or "").lower(),
+                "generated": "generated" in (row["extra"] or "").lower()
+            })
+
+            if row["key_position"] is not None:
+                keys.setdefault(name, []).append((row["key_position"], row["column_name"]))
+
+        for name, positions in keys.items():
+            key = [col for _, col in sorted(positions)]
+
+            tables[name]["clustered_key"] = key
+
+            # A partitioned table's primary key must contain its partitioning
+            # column, so partition_metric_values.sql adds metric_date to the
+            # metric value tables' keys. Their AUTO_INCREMENT id still
+            # identifies a row on its own, and stays the row identity, so
+            # metric_date can be edited and is not part of update conditions.
+
+            auto = [col["name"] for col in tables[name]["columns"] if col["auto_increment"] and col["name"] in key]
+
+            tables[name]["primary_keys"] = auto if len(key) > 1 and len(auto) == 1 else key
+
+        with self._lock:
+            if table is None:
+                self.tables = tables
+                self.loaded_at = time.monotonic()
+            else:
+                self.tables.update(tables)
+
+    def invalidate(self, table = None):
+
+        """
+        Discards cached metadata so it is reloaded on next use.
+
+        Parameters
+        ----------
+        table : str, optional
+            Table to invalidate (default invalidates the whole catalog).
+
+        """
+
+        with self._lock:
+            if table is None:
+                self.tables = {}
+                self.loaded_at = None
+            else:
+                self.tables.pop(table, None)
+
+    def is_expired(self):
+
+        """
+        Checks whether the catalog has never been loaded or has outlived its ttl.
+
+        Returns
+        -------
+        bool
+            True if the catalog should be reloaded.
+
+        """
+
+        if self.loaded_at is None:
+            return True
+
+        return self.ttl > 0 and time.monotonic() - self.loaded_at > self.ttl
+
+    def _table(self, table):
+
+        # The catalog lock is not held while loading: load() needs a database
+        # connection, and a caller inside Database.transaction() already holds
+        # the database lock, so holding both in the opposite order could deadlock.
+
+        with self._lock:
+            expired = self.is_expired()
+            known = table in self.tables
+
+        if expired:
+            self.load()
+        elif not known:
+            self.load(table)
+
+        with self._lock:
+            if table not in self.tables:
+                raise Exception(f"value_catalog: unknown table: {table}")
+
+            return self.tables[table]
+
+    def columns(self, table):
+
+        """
+        Returns the column names of a table in ordinal order.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            A list of column names.
+
+        """
+
+        return [col["name"] for col in self._table(table)["columns"]]
+
+    def column_info(self, table):
+
+        """
+        Returns the column dictionaries of a table in ordinal order.
+
+        Each dictionary has the keys name, data_type, column_type, nullable,
+        auto_increment and generated.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            A list of column dictionaries.
+
+        """
+
+        return list(self._table(table)["columns"])
+
+    def primary_keys(self, table):
+
+        """
+        Returns the columns that identify a row of a table, including composite keys.
+
+        These are the primary key columns, except that an AUTO_INCREMENT column
+        in a composite primary key (as in a partitioned metric value table)
+        identifies the row on its own.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            The key column names in key order.
+
+        """
+
+        return list(self._table(table)["primary_keys"])
+
+    def clustered_key(self, table):
+
+        """
+        Returns the primary key columns of a table as defined, in key order.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            The primary key column names in key order.
+
+        """
+
+        return list(self._table(table)["clustered_key"])
+
+    def table_names(self):
+
+        """
+        Returns the names of all tables and views in the schema.
+
+        Returns
+        -------
+        list
+            A sorted list of table names.
+
+        """
+
+        with self._lock:
+            expired = self.is_expired()
+
+        if expired:
+            self.load()
+
+        with self._lock:
+            return sorted(self.tables)
+
+    def is_view(self, table):
+
+        """
+        Checks whether a name refers to a view rather than a base table.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table or view.
+
+        Returns
+        -------
+        bool
+            True for views.
+
+        """
+
+        return self._table(table)["view"]
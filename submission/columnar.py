@@ -0,0 +1,270 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ColumnarResult:
+
+    """
+    A query result held as one typed NumPy array per column.
+
+    Column types are inferred from every non-NULL value of each column, and
+    widened when a later value needs it (an integer column holding a float
+    becomes float64, never truncated):
+
+    - DATE values become datetime64[D] and DATETIME values datetime64[s],
+      with NULL as NaT.
+    - DECIMAL values become float64, or int64 scaled by 10 ** decimal_scale
+      when decimal_mode is "scaled" (e.g. 12.34 is stored as 1234).
+    - Integers become int64, or float64 with NULL as NaN if the column has NULLs.
+    - Floats, and columns mixing floats with integers or DECIMAL values, become
+      float64 with NULL as NaN; integers mixed with DECIMAL values are treated as DECIMAL.
+    - Anything else (text, columns that are entirely NULL) is kept as an object array.
+
+    Attributes
+    ----------
+    columns : list of str
+        The shared column header, in select-list order.
+
+    arrays : dict
+        Mapping of column name to its array; every array has the same length.
+
+    decimal_scale : int or None
+        Power of ten applied to DECIMAL columns in "scaled" mode, else None.
+
+    Methods
+    -------
+    from_chunks(columns, chunks, decimal_mode="float", decimal_scale=2):
+        Builds a result from an iterable of tuple row chunks.
+
+    nbytes():
+        Returns the memory held by the arrays' buffers.
+
+    """
+
+    def __init__(self, columns, arrays, decimal_scale = None):
+
+        self.columns = list(columns)
+
+        self.arrays = arrays
+
+        self.decimal_scale = decimal_scale
+
+    def __getitem__(self, column):
+
+        return self.arrays[column]
+
+    def __contains__(self, column):
+
+        return column in self.arrays
+
+    def __len__(self):
+
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    def nbytes(self):
+
+        """
+        Returns the memory held by the arrays' buffers, in bytes.
+
+        Object arrays count only their pointers, not the Python objects they hold.
+
+        """
+
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @classmethod
+    def from_chunks(cls, columns, chunks, decimal_mode = "float", decimal_scale = 2):
+
+        """
+        Builds a columnar result from chunks of tuple rows.
+
+        Each chunk is transposed and converted to arrays straight away, so the
+        full result is never held as Python row objects.
+
+        Parameters
+        ----------
+        columns : list of str
+            Column names, in the order of the tuple values.
+
+        chunks : iterable of list of tuple
+            Row chunks, e.g. successive cursor.fetchmany() results.
+
+        decimal_mode : str, optional
+            "float" (default) stores DECIMAL columns as float64; "scaled" stores
+            them as int64 multiplied by 10 ** decimal_scale, which is exact.
+
+        decimal_scale : int, optional
+            Number of decimal places kept in "scaled" mode (default is 2, for DECIMAL(10,2)).
+
+        Returns
+        -------
+        ColumnarResult
+            The converted result.
+
+        Raises
+        ------
+        ImportError
+            If NumPy is not installed.
+
+        ValueError
+            If decimal_mode is unknown, or a scaled DECIMAL column holds NULL.
+
+        """
+
+        if np is None:
+            raise ImportError("NumPy is required for columnar query results.")
+
+        if decimal_mode not in ("float", "scaled"):
+            raise ValueError("decimal_mode must be 'float' or 'scaled'.")
+
+        kinds = [None] * len(columns)
+
+        # Each converted chunk is kept with the kind it was converted as, so
+        # it can be recast when a later chunk widens the column's kind.
+
+        parts = [[] for _ in columns]
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+
+            for i, values in enumerate(zip(*chunk)):
+                kinds[i] = _merge_kinds(kinds[i], _infer_kind(values))
+
+                parts[i].append((kinds[i], _convert(values, kinds[i], decimal_mode, decimal_scale, columns[i])))
+
+        arrays = {}
+
+        for i, name in enumerate(columns):
+            pieces = []
+
+            for kind, piece in parts[i]:
+                # Chunks read before the column's kind was known are all NULL.
+
+                if isinstance(piece, tuple) and kinds[i] is not None:
+                    piece = _convert(piece, kinds[i], decimal_mode, decimal_scale, name)
+                elif kind != kinds[i]:
+                    piece = _recast(piece, kind, kinds[i], decimal_mode, decimal_scale, name)
+
+                pieces.append(_as_array(piece))
+
+            arrays[name] = np.concatenate(pieces) if pieces else np.empty(0, dtype = object)
+
+        return cls(columns, arrays, decimal_scale if decimal_mode == "scaled" else None)
+
+def _value_kind(value):
+
+    if isinstance(value, bool):
+        return "int"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, Decimal):
+        return "decimal"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "object"
+
+def _merge_kinds(left, right):
+
+    # The narrowest kind that holds the values of both: integers widen to
+    # DECIMAL or float, DECIMAL mixed with float becomes float, and dates
+    # widen to datetimes. Anything else mixed is kept as objects.
+
+    if left is None or left == right:
+        return right
+    if right is None:
+        return left
+
+    pair = {left, right}
+
+    if pair == {"int", "decimal"}:
+        return "decimal"
+    if pair <= {"int", "float", "decimal"}:
+        return "float"
+    if pair == {"date", "datetime"}:
+        return "datetime"
+
+    return "object"
+
+def _infer_kind(values):
+
+    kind = None
+
+    for value in values:
+        if value is not None:
+            kind = _merge_kinds(kind, _value_kind(value))
+
+            if kind == "object":
+                break
+
+    return kind
+
+def _convert(values, kind, decimal_mode, decimal_scale, name):
+
+    # An all-NULL chunk of a column whose kind is still unknown is kept as
+    # the raw tuple and converted once a later chunk fixes the kind.
+
+    if kind is None:
+        return values
+
+    count = len(values)
+
+    if kind == "date":
+        return np.array(values, dtype = "datetime64[D]")
+
+    if kind == "datetime":
+        return np.array(values, dtype = "datetime64[s]")
+
+    if kind == "decimal" and decimal_mode == "scaled":
+        if None in values:
+            raise ValueError(f"Column {name} has NULL values, which scaled integers cannot hold; use decimal_mode='float'.")
+        return np.fromiter((int(Decimal(value).scaleb(decimal_scale)) for value in values), dtype = np.int64, count = count)
+
+    if kind == "int" and None not in values:
+        return np.fromiter(values, dtype = np.int64, count = count)
+
+    if kind in ("int", "float", "decimal"):
+        return np.fromiter((np.nan if value is None else float(value) for value in values), dtype = np.float64, count = count)
+
+    array = np.empty(count, dtype = object)
+
+    array[:] = values
+
+    return array
+
+def _recast(array, kind, final_kind, decimal_mode, decimal_scale, name):
+
+    # Converts a chunk already converted as kind to the wider final_kind.
+
+    if final_kind == "object":
+        return array.astype(object)
+
+    if final_kind == "datetime":
+        return array.astype("datetime64[s]")
+
+    if final_kind == "decimal" and decimal_mode == "scaled":
+        if array.dtype != np.int64:
+            raise ValueError(f"Column {name} has NULL values, which scaled integers cannot hold; use decimal_mode='float'.")
+        return array * 10 ** decimal_scale
+
+    if kind == "decimal" and decimal_mode == "scaled":
+        return array / 10 ** decimal_scale
+
+    return array.astype(np.float64)
+
+def _as_array(piece):
+
+    if isinstance(piece, tuple):
+        array = np.empty(len(piece), dtype = object)
+        array[:] = piece
+        return array
+
+    return piece
@@ -1,9 +1,30 @@
 
+from anomaly import MetricStats
+from backend import QueryInterruptedError, StorageBackend, classify_upserts, default_config_path, group_upserts, key_text, load_anomaly_settings, load_query_timeouts
+from catalog import SchemaCatalog
+from columnar import ColumnarResult
+from id_allocator import IdAllocator
+from partitions import date_bounds
+from query_cache import QueryCache
+from query_cost import QueryCostError, summarize_plan
+from rollup import MetricRollup
+from rows import fetch_rows
 import configparser
+import json
 import mysql.connector
+from mysql.connector import pooling
 import os
-import uuid
 import re
+import threading
+import time
+from contextlib import contextmanager
+
+# MySQL error raised when InnoDB rolls back a deadlock victim, and how many
+# times upsert_many retries a batch that lost one.
+
+ER_LOCK_DEADLOCK = 1213
+
+DEADLOCK_RETRIES = 3
 
 def load_db_config(path):
 
@@ -20,7 +41,16 @@ def load_db_config(path):
     -------
     dict
         A dictionary containing rersolved database connection parameters
-        (host, user, password, database).
+        (host, user, password, database) and connection pool settings
+        (pool_size, pool_timeout, pool_ping), whether LOAD DATA LOCAL INFILE
+        is allowed (allow_local_infile), plus the metadata catalog
+        time to live (catalog_ttl), query result cache limits
+        (query_cache_size, query_cache_ttl) and the user query cost guard
+        (query_row_budget, query_cost_action) and the number of key values
+        reserved per id_block round trip (id_block_size). Query time limits are returned
+        under query_timeouts, read from query_timeout (the default) and
+        query_timeout_<category> keys, and the metric anomaly settings under
+        anomaly_settings (see backend.load_anomaly_settings).
 
     Raises
     ------
@@ -51,37 +81,145 @@ def load_db_config(path):
 
     if not user or not password:
         raise EnvironmentError("Environment variables are not set.")
+
+    # Optional connection pool settings; a pool_size of 0 keeps the single
+    # shared connection.
+
+    pool_size = db_cfg.getint("pool_size", fallback = 0)
+
+    pool_timeout = db_cfg.getfloat("pool_timeout", fallback = 10.0)
+
+    pool_ping = db_cfg.getboolean("pool_ping", fallback = True)
+
+    # LOAD DATA LOCAL INFILE for the bulk importer; the server must also have
+    # local_infile enabled.
+
+    allow_local_infile = db_cfg.getboolean("allow_local_infile", fallback = False)
+
+    catalog_ttl = db_cfg.getfloat("catalog_ttl", fallback = 300.0)
+
+    query_cache_size = db_cfg.getint("query_cache_size", fallback = 64)
+
+    query_cache_ttl = db_cfg.getfloat("query_cache_ttl", fallback = 600.0)
+
+    query_row_budget = db_cfg.getint("query_row_budget", fallback = 1000000)
+
+    query_cost_action = db_cfg.get("query_cost_action", fallback = "confirm").lower()
+
+    if query_cost_action not in ("confirm", "reject"):
+        raise ValueError("query_cost_action must be 'confirm' or 'reject'.")
+
+    query_timeouts = load_query_timeouts(db_cfg)
+
+    anomaly_settings = load_anomaly_settings(db_cfg)
+
+    id_block_size = db_cfg.getint("id_block_size", fallback = 100)
+
+    if id_block_size < 1:
+        raise ValueError("id_block_size must be a positive integer.")
+
+    if pool_size < 0 or pool_size > pooling.CNX_POOL_MAXSIZE:
+        raise ValueError(f"pool_size must be between 0 and {pooling.CNX_POOL_MAXSIZE}.")
     
     resolved_config = {
         "host": host,
         "user": user,
         "password": password,
-        "database": database
+        "database": database,
+        "pool_size": pool_size,
+        "pool_timeout": pool_timeout,
+        "pool_ping": pool_ping,
+        "allow_local_infile": allow_local_infile,
+        "catalog_ttl": catalog_ttl,
+        "query_cache_size": query_cache_size,
+        "query_cache_ttl": query_cache_ttl,
+        "query_row_budget": query_row_budget,
+        "query_cost_action": query_cost_action,
+        "id_block_size": id_block_size,
+        "query_timeouts": query_timeouts,
+        "anomaly_settings": anomaly_settings
     }
 
     return resolved_config
 
-class Database:
+class Database(StorageBackend):
 
     """
     A class for interfacing with the value measurement MySQL database.
 
+    This is the MySQL implementation of backend.StorageBackend; use
+    backend.open_database() to pick a backend from the config file.
+
+    The class runs in one of two modes. By default it opens a single connection
+    and dictionary cursor shared by every call. When pool_size is set in the
+    [value] section of the config file, it instead keeps a connection pool and
+    each operation checks out its own connection and cursor, so calls can be
+    made safely from several threads.
+
     Attributes
     ----------
     conn : mysql.connector.connection.MySQLConnection
-        Connection object to the MySQL database.
+        Connection object to the MySQL database; None in pooled mode.
 
     cursor : mysql.connector.cursor.MySQLCursorDict
-        Cursor object to execute SQL queries.
+        Cursor object to execute SQL queries; None in pooled mode.
+
+    pool : mysql.connector.pooling.MySQLConnectionPool
+        Connection pool used in pooled mode; None otherwise.
+
+    catalog : SchemaCatalog
+        Cached column and primary key metadata for every table.
+
+    query_cache : QueryCache
+        Cached results of SELECT queries, invalidated by writes to the tables they read.
     
     Methods
     -------
+    connection():
+        Context manager yielding a connection and cursor for one operation.
+
+    transaction():
+        Context manager grouping CRUD calls into one commit, with savepoints when nested.
+
+    in_transaction():
+        Checks whether the calling thread is inside transaction().
+
+    get_columns(table):
+        Returns the column names of a table from the metadata catalog.
+
+    get_primary_keys(table):
+        Returns the primary key columns of a table from the metadata catalog.
+
     insert(table, data):
         Inserts a new record into the specified table.
 
+    insert_many(table, rows, batch_size=1000):
+        Inserts many records in multi-row batches with one commit per batch.
+
+    upsert_many(table, rows, key_columns, batch_size=1000):
+        Inserts or updates many records by natural key, reporting what changed.
+
+    key_columns(table):
+        Returns the AUTO_INCREMENT and block-allocated key columns of a table.
+
+    reserve_ids(table, count):
+        Reserves a block of key values from the id_block table.
+
     fetch_all(table):
         Fetches all records from the specified table.
 
+    iter_table(table, chunk_size=1000):
+        Streams all records from the specified table without buffering them.
+
+    fetch_page(table, after_key=None, limit=200, order_by=None, descending=False):
+        Fetches one page of records using keyset pagination.
+
+    page_order(table, order_by=None):
+        Returns the columns used to order and key pages of a table.
+
+    estimate_row_count(table):
+        Returns the server's estimate of the number of rows in a table.
+
     update(table, data, conditions):
         Updates records in the specified table based on given conditions.
 
@@ -94,18 +232,54 @@ class Database:
     validate_query(query_str):
         Validates a user-input SQL to ensure it is a safe SELECT statement.
 
-    execute_query(query_str):
+    explain_query(query_str):
+        Summarizes the EXPLAIN FORMAT=JSON plan of a query.
+
+    check_query_cost(query_str):
+        Raises QueryCostError if a query's estimate is over the row budget.
+
+    execute_query(query_str, use_cache=False, check_cost=False, timeout=None, cancel_key=None):
         Executes a pre-defined or user-input SQL query after validation.
 
+    query_timeout(categories=()):
+        Returns the time limit for a query flagged with the given categories.
+
+    cancel_query(cancel_key):
+        Stops the query registered under cancel_key with KILL QUERY.
+
+    iter_query(query_str, chunk_size=1000, params=()):
+        Streams the rows of a validated query without buffering them.
+
+    query_columnar(query_str, params=(), decimal_mode="float", chunk_size=10000):
+        Runs a validated query and returns one NumPy array per column.
+
+    table_changed(table):
+        Invalidates cached results after a write outside the CRUD helpers.
+
+    reconnect():
+        Re-establishes the shared connection if the server dropped it.
+
     close():
         Closes the database connection.
 
     """
 
-    def __init__(self):
+    # SQL dialect and parameter placeholder, for modules that build their own statements.
+
+    dialect = "mysql"
+
+    placeholder = "%s"
+
+    def __init__(self, config_file_path = None):
         
         """
-        Initializes the database connection using the config.ini file.
+        Initializes the database connection, or connection pool, using the config.ini file.
+
+        Parameters
+        ----------
+        config_file_path : str, optional
+            Path to the config file (default is backend.default_config_path(),
+            which honors the VALUE_DB_CONFIG environment variable).
 
         Raises
         ------
@@ -114,278 +288,1281 @@ class Database:
 
         """
 
-        config_file_path = "G:/My Drive/Projects/value/interface/config.ini"
+        config_file_path = config_file_path or default_config_path()
 
         db_config = load_db_config(config_file_path)
 
+        self.conn = None
+
+        self.cursor = None
+
+        self.pool = None
+
+        self.pool_timeout = db_config["pool_timeout"]
+
+        self.pool_ping = db_config["pool_ping"]
+
+        # Serializes use of the shared cursor when not running in pooled mode.
+
+        self._lock = threading.RLock()
+
+        self.query_timeouts = db_config["query_timeouts"]
+
+        # Server connection ids of cancellable queries running in execute_query,
+        # by cancel key, so cancel_query() can stop them from a separate control
+        # connection. The lock keeps an id from being killed once its query ends.
+
+        self.running_queries = {}
+
+        self._cancel_lock = threading.Lock()
+
+        # Per-thread transaction state; see transaction().
+
+        self._local = threading.local()
+
+        connect_args = {
+            "host": db_config["host"],
+            "user": db_config["user"],
+            "password": db_config["password"],
+            "database": db_config["database"]
+        }
+
+        if db_config["allow_local_infile"]:
+            connect_args["allow_local_infile"] = True
+
+        self.connect_args = connect_args
+
+        self.allow_local_infile = db_config["allow_local_infile"]
+
         try:
-            self.conn = mysql.connector.connect(
-                host = db_config["host"],
-                user = db_config["user"],
-                password = db_config["password"],
-                database = db_config["database"]
-            )
+            if db_config["pool_size"] > 0:
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name = "value_pool",
+                    pool_size = db_config["pool_size"],
+                    **connect_args
+                )
+            else:
+                self.conn = mysql.connector.connect(**connect_args)
 
-            self.cursor = self.conn.cursor(dictionary = True)
+                self.cursor = self.conn.cursor(dictionary = True)
 
         except mysql.connector.Error as e:
             raise Exception(f"Database connection attempt failed: {e}")
             return []
-        
-    def get_columns(self, table):
+
+        # Load table metadata once at startup instead of per CRUD call.
+
+        self.catalog = SchemaCatalog(self, ttl = db_config["catalog_ttl"])
+
+        try:
+            self.catalog.load()
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: catalog: error: {e}")
+
+        self.query_cache = QueryCache(
+            max_entries = db_config["query_cache_size"],
+            ttl = db_config["query_cache_ttl"]
+        )
+
+        self.query_row_budget = db_config["query_row_budget"]
+
+        self.query_cost_action = db_config["query_cost_action"]
+
+        # Keys of tables without AUTO_INCREMENT are handed out in blocks.
+
+        self.id_allocator = IdAllocator(self, db_config["id_block_size"])
+
+        self.seeded_id_blocks = set()
+
+        # Running metric statistics and rollups, when the schema has their tables.
+
+        tables = self.catalog.table_names()
+
+        self.metric_stats = MetricStats(self, **db_config["anomaly_settings"]) if "metric_stats" in tables else None
+
+        self.metric_rollup = MetricRollup(self) if "metric_rollup" in tables else None
+
+        # Callables told about every written table (see _invalidate), e.g. the snapshot manager.
+
+        self.change_listeners = []
+
+    def checkout(self):
 
         """
-        Retrieves the column names of a given table.
+        Checks out a connection from the pool, waiting up to pool_timeout seconds.
 
-        Parameters
-        ----------
-        table : str
-            The name of the table.
+        When pool_ping is enabled, the connection is pinged and reconnected if the
+        server dropped it while it sat idle in the pool.
 
         Returns
         -------
-        list
-            A list of column names.
+        mysql.connector.pooling.PooledMySQLConnection
+            A live pooled connection; closing it returns it to the pool.
 
         Raises
         ------
         Exception
-            If an error occurs while calling the stored procedure.
-        
+            If no connection becomes available before the timeout or the ping fails.
+
         """
 
-        sql = f"SHOW COLUMNS FROM {table}"
+        deadline = time.monotonic() + self.pool_timeout
 
-        try:
-            self.cursor.execute(sql)
-            return [row["Field"] for row in self.cursor.fetchall()]
-        except mysql.connector.Error as e:
-            raise Exception(f"value_db: get_columns: error: {e}")
-            return []
+        while True:
+            try:
+                conn = self.pool.get_connection()
+                break
+            except mysql.connector.errors.PoolError:
+                if time.monotonic() >= deadline:
+                    raise Exception(f"value_db: checkout: error: no connection available after {self.pool_timeout} seconds")
+                time.sleep(0.05)
 
-    def insert(self, table, data):
+        if self.pool_ping:
+            try:
+                conn.ping(reconnect = True, attempts = 1, delay = 0)
+            except mysql.connector.Error as e:
+                conn.close()
+                raise Exception(f"value_db: checkout: error: {e}")
 
-        """
-        Inserts a new record into the specified table, excluding auto-generated primary key.
+        return conn
 
-        Parameters
-        ----------
-        table : str
-            The table name where data should be inserted.
+    @contextmanager
+    def connection(self):
 
-        data : dict
-            A dictionary containing column names as keys and corresponding values.
+        """
+        Provides a connection and dictionary cursor for the duration of one operation.
 
-        Raises
+        In pooled mode a connection is checked out, given its own cursor and returned
+        to the pool on exit. Otherwise the shared connection and cursor are yielded
+        while holding a lock, so concurrent callers take turns. Inside transaction()
+        the connection pinned to the calling thread is yielded instead.
+
+        Yields
         ------
-        Exception
-            If an error occurs while calling the stored procedure.
-        
-        """
+        tuple
+            A (connection, cursor) pair.
 
-        composite_keys = {"event_plan": ["event_id", "plan_id"]}
+        """
 
-        primary_keys = composite_keys.get(table, [self.get_columns(table)[0]])
+        tx = getattr(self._local, "tx", None)
 
-        for key in primary_keys:
-            if key not in data or not data[key]:
-                data[key] = str(uuid.uuid4())[:8]  # Generate a short unique id.
+        if tx is not None:
+            yield tx["conn"], tx["cursor"]
+            return
 
-        columns = ", ".join(data.keys())
+        if self.pool is None:
+            with self._lock:
+                yield self.conn, self.cursor
+            return
 
-        placeholders = ", ".join(["%s"] * len(data))
+        conn = self.checkout()
 
-        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        cursor = conn.cursor(dictionary = True)
 
         try:
-            self.cursor.execute(sql, tuple(data.values()))
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            raise Exception(f"value_db: insert: error: {e}")
+            yield conn, cursor
+        finally:
+            cursor.close()
+            conn.close()
         
-    def fetch_all(self, table):
+    @contextmanager
+    def independent_connection(self):
 
         """
-        Fetches all records from the specified table.
+        Provides a connection outside any transaction open on the calling thread.
 
-        Parameters
-        ----------
-        table : str
-            The table name to fetch data from.
-
-        Returns
-        -------
-        list
-            A list of dictionaries representing the rows.
+        Outside a transaction this is connection(). Inside one, a pooled
+        connection is checked out, or a short-lived connection is opened in
+        single-connection mode, so work committed here is not tied to the
+        caller's unit of work.
 
-        Raises
+        Yields
         ------
-        Exception
-            If an error occurs during the fetch.
-        
+        tuple
+            A (connection, cursor) pair.
+
         """
 
-        sql = f"SELECT * FROM {table}"
+        if not self.in_transaction():
+            with self.connection() as pair:
+                yield pair
+            return
+
+        conn = self.checkout() if self.pool is not None else mysql.connector.connect(**self.connect_args)
+
+        cursor = conn.cursor(dictionary = True)
 
         try:
-            self.cursor.execute(sql)
-            return self.cursor.fetchall()
-        except mysql.connector.Error as e:
-            raise Exception(f"Error on attempted fetch from {table}: {e}")
-            return[]
-        
-    def update(self, table, data, conditions):
+            yield conn, cursor
+        finally:
+            cursor.close()
+            conn.close()
 
-        """
-        Updates records in the specified table based on given conditions.
+    @contextmanager
+    def transaction(self):
 
-        Parameters
-        ----------
-        table : str
-            The table name where the update should occur.
+        """
+        Runs the enclosed CRUD calls as one unit of work.
 
-        data : dict
-            A dictionary of column names and values to update.
+        The calling thread is pinned to one connection (checked out from the pool,
+        or the shared connection held under its lock) and insert, insert_many,
+        update, delete and call_procedure skip their per-statement commits. The
+        work is committed once when the block exits normally and rolled back if
+        it raises. A nested transaction() becomes a savepoint, so an exception
+        inside it undoes only the nested work before propagating.
 
-        conditions : dict
-            A dictionary of column names and values to specify which rows to update.
+        Yields
+        ------
+        Database
+            This database, for use as "with db.transaction() as tx:".
 
         Raises
         ------
         Exception
-            If an error occurs while calling the stored procedure.
-        
+            Whatever the enclosed block raises, after rolling back.
+
         """
 
-        composite_keys = {"event_plan": ["event_id", "plan_id"]}
+        tx = getattr(self._local, "tx", None)
 
-        primary_keys = composite_keys.get(table, [self.get_columns(table)[0]])
-        
-        updates = ", ".join([f"{col} = %s" for col in data.keys() if col not in primary_keys])
+        if tx is not None:
+            tx["depth"] += 1
+
+            savepoint = f"value_sp_{tx['depth']}"
+
+            tx["cursor"].execute(f"SAVEPOINT {savepoint}")
+
+            try:
+                yield self
+            except BaseException:
+                tx["cursor"].execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                raise
+            else:
+                tx["cursor"].execute(f"RELEASE SAVEPOINT {savepoint}")
+            finally:
+                tx["depth"] -= 1
 
-        condition_str = " AND ".join([f"{col} = %s" for col in primary_keys])
-        
-        if not updates:
-            raise Exception(f"Database Insert Error: {e}")
             return
-        
-        sql = f"UPDATE {table} SET {updates} WHERE {condition_str}"
-        
+
+        if self.pool is None:
+            self._lock.acquire()
+            conn, cursor = self.conn, self.cursor
+        else:
+            conn = self.checkout()
+            cursor = conn.cursor(dictionary = True)
+
+        tx = self._local.tx = {"conn": conn, "cursor": cursor, "depth": 0, "tables": set()}
+
         try:
-            values = tuple(data[col] for col in data.keys() if col not in primary_keys) + tuple(conditions[col] for col in primary_keys)
-            self.cursor.execute(sql, values)
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            raise Exception(f"value_db: update: error: {e}")
-        
-    def delete(self, table, conditions):
+            if not conn.in_transaction:
+                conn.start_transaction()
+
+            yield self
+
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.tx = None
+
+            # Readers may have cached old rows while the work was uncommitted.
+
+            for table in tx["tables"]:
+                self._drop_cached(table)
+
+            if self.pool is None:
+                self._lock.release()
+            else:
+                cursor.close()
+                conn.close()
+
+    def in_transaction(self):
 
         """
-        Deletes records from the specified table based on given conditions.
+        Checks whether the calling thread is inside transaction().
+
+        Returns
+        -------
+        bool
+            True inside a transaction block.
+
+        """
+
+        return getattr(self._local, "tx", None) is not None
+
+    def _commit(self, conn):
+
+        # Commits a CRUD statement unless a transaction() defers it.
+
+        if not self.in_transaction():
+            conn.commit()
+
+    def _rollback(self, conn):
+
+        if not self.in_transaction():
+            conn.rollback()
+
+    def table_changed(self, table):
+
+        """
+        Tells the database that a table was written outside the CRUD helpers, e.g. by the bulk importer.
 
         Parameters
         ----------
         table : str
-            The table name where deletion should occur.
-
-        conditions : dict
-            A dictionary of column names and values specifying which rows to delete.
+            The table that was written.
 
-        Raises
-        ------
-        Exception
-            If an error occurs while calling the stored procedure.
-        
         """
 
-        condition_str = " AND ".join([f"{col} = %s" for col in conditions.keys()])
+        self._invalidate(table)
 
-        sql = f"DELETE FROM {table} WHERE {condition_str}"
+    def _invalidate(self, table = None):
 
-        try:
-            self.cursor.execute(sql, tuple(conditions.values()))
-            self.conn.commit()
-        except mysql.connector.Error as e:
-            raise Exception(f"value_db: delete: error: {e}")
-        
-    def call_procedure(self, procedure_name, params = ()):
+        # None stands for every table, e.g. after a stored procedure.
+
+        self._drop_cached(table)
+
+        tx = getattr(self._local, "tx", None)
+
+        if tx is not None:
+            tx["tables"].add(table)
+
+    def _drop_cached(self, table):
+
+        # Called when a table is written and again when its transaction ends.
+
+        if table is None:
+            self.query_cache.clear()
+        else:
+            self.query_cache.invalidate_table(table)
+
+        for listener in self.change_listeners:
+            listener(table)
+
+    def get_columns(self, table):
 
         """
-        Calls a stored procedure with optional parameters.
+        Retrieves the column names of a given table from the metadata catalog.
 
         Parameters
         ----------
-        procedure_name : str
-            The name of the stored procedure to call.
-
-        params : tuple, optional
-            The paramaters to pass to the stored procedures (default is an empty tuple).
+        table : str
+            The name of the table.
 
         Returns
         -------
         list
-            A list of dictionaries representing the procedure's output.
+            A list of column names.
 
         Raises
         ------
         Exception
-            If an error occurs while calling the stored procedure.
+            If the table is unknown or the catalog cannot be loaded.
         
         """
 
         try:
-            self.cursor.callproc(procedure_name, params)
-            return []
+            return self.catalog.columns(table)
         except mysql.connector.Error as e:
-            raise Exception(f"Error calling procedure {procedure_name}: {e}")
+            raise Exception(f"value_db: get_columns: error: {e}")
             return []
-        
-    def validate_query(self, query_str):
+
+    def get_primary_keys(self, table):
 
         """
-        Validates a user-input SQL to ensure it is a safe statement.
+        Retrieves the primary key columns of a given table from the metadata catalog.
 
         Parameters
         ----------
-        query_str : str
-            The query string to be validated.
+        table : str
+            The name of the table.
 
-        bool
-            True if the query is safe, False otherwise.
+        Returns
+        -------
+        list
+            The primary key column names; composite keys are returned in key order.
 
         Raises
         ------
-        TypeError
-            If the input is not a string.
+        Exception
+            If the table is unknown or the catalog cannot be loaded.
 
-        ValueError
-            If the query is empty.
+        """
+
+        try:
+            return self.catalog.primary_keys(table)
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: get_primary_keys: error: {e}")
+            return []
+
+    def insert(self, table, data):
+
+        """
+        Inserts a new record into the specified table.
+
+        Empty AUTO_INCREMENT key values are left out so the server assigns them.
+        An empty single-column integer key without AUTO_INCREMENT, such as
+        plan_id, is taken from the id allocator. Other key columns, e.g. the
+        composite keys of event_plan, must be supplied.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be inserted.
+
+        data : dict
+            A dictionary containing column names as keys and corresponding values.
+
+        Returns
+        -------
+        int or None
+            The new record's generated key: the server's lastrowid for
+            AUTO_INCREMENT tables or the allocated value for block-allocated
+            keys; None if every key value was supplied.
+
+        Raises
+        ------
+        Exception
+            If a required key value is missing or the insert fails.
+        
+        """
+
+        data = dict(data)
+
+        auto_keys, block_key = self.key_columns(table)
+
+        generated = None
+
+        for key in self.get_primary_keys(table):
+            if data.get(key) not in (None, ""):
+                continue
+
+            if key in auto_keys:
+                data.pop(key, None)
+            elif key == block_key:
+                generated = data[key] = self.id_allocator.next_id(table)
+            else:
+                raise Exception(f"value_db: insert: error: missing primary key value for {table}.{key}")
+
+        columns = ", ".join(data.keys())
+
+        placeholders = ", ".join(["%s"] * len(data))
+
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    cursor.execute(sql, tuple(data.values()))
+
+                    if auto_keys and generated is None:
+                        generated = cursor.lastrowid
+
+                    for tracker in self.value_trackers:
+                        tracker.record(cursor, table, [data])
+
+                    self._commit(conn)
+                except mysql.connector.Error:
+                    self._rollback(conn)
+                    raise
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: insert: error: {e}")
+        finally:
+            self._invalidate(table)
+
+        return generated
+
+    def key_columns(self, table):
+
+        """
+        Describes how missing primary key values of a table are generated.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        tuple
+            The set of AUTO_INCREMENT key columns, and the key column filled by
+            the id allocator (a single integer key without AUTO_INCREMENT) or None.
+
+        """
+
+        info = {col["name"]: col for col in self.catalog.column_info(table)}
+
+        keys = self.get_primary_keys(table)
+
+        auto_keys = {key for key in keys if info[key]["auto_increment"]}
+
+        block_key = None
+
+        if len(keys) == 1 and not auto_keys and info[keys[0]]["data_type"] in ("tinyint", "smallint", "mediumint", "int", "bigint"):
+            block_key = keys[0]
+
+        return auto_keys, block_key
+
+    def reserve_ids(self, table, count):
+
+        """
+        Reserves count consecutive key values for a table from the id_block table.
+
+        The block is claimed with a single UPDATE that stores the new high-water
+        mark through LAST_INSERT_ID(expr), so the value comes back in the same
+        round trip and concurrent clients never receive overlapping blocks.
+        The first reservation for a table in a session seeds id_block from the
+        table's current maximum key. Every reservation also starts past the
+        table's current maximum key, read from the end of the primary key
+        index, so rows inserted with explicit keys above the high-water mark
+        (by the importers, upsert_many or older clients) are skipped rather
+        than handed out again. The reservation is committed on its own
+        connection, so rolling back a transaction never hands a block out twice.
+
+        Parameters
+        ----------
+        table : str
+            A table whose key is filled by the id allocator.
+
+        count : int
+            Number of key values to reserve.
+
+        Returns
+        -------
+        int
+            The first reserved value; the block is [first, first + count).
+
+        Raises
+        ------
+        Exception
+            If the table has no block-allocated key or the reservation fails.
+
+        """
+
+        _, key = self.key_columns(table)
+
+        if key is None:
+            raise Exception(f"value_db: reserve_ids: error: {table} has no block-allocated key")
+
+        try:
+            with self.independent_connection() as (conn, cursor):
+                try:
+                    if table not in self.seeded_id_blocks:
+                        cursor.execute(
+                            f"INSERT IGNORE INTO id_block (table_name, next_value) SELECT %s, COALESCE(MAX({key}), 0) + 1 FROM {table}",
+                            (table,)
+                        )
+
+                    cursor.execute(
+                        f"UPDATE id_block SET next_value = LAST_INSERT_ID(GREATEST(next_value, (SELECT COALESCE(MAX({key}), 0) + 1 FROM {table})) + %s) "
+                        f"WHERE table_name = %s",
+                        (count, table)
+                    )
+
+                    high = cursor.lastrowid
+
+                    conn.commit()
+                except mysql.connector.Error:
+                    conn.rollback()
+                    raise
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: reserve_ids: error: {e}")
+
+        self.seeded_id_blocks.add(table)
+
+        return high - count
+
+    def insert_many(self, table, rows, batch_size = 1000):
+
+        """
+        Inserts many records using batched multi-row statements.
+
+        Missing block-allocated keys (see insert) are reserved for the whole load
+        in one round trip. Rows are grouped by their set of columns so that each group uses a single
+        parameterized INSERT statement. Each group is sent in batches of up to
+        batch_size rows through executemany, which the connector rewrites into one
+        multi-row INSERT, and each batch is committed once. A batch that fails, for
+        example because the validate_global_metric_value trigger rejects a negative
+        value, is rolled back and recorded in the report while later batches still run.
+        Inside transaction() nothing is committed here and a failed batch raises,
+        so the whole unit of work rolls back.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be inserted.
+
+        rows : iterable of dict
+            Dictionaries mapping column names to values, one per record.
+
+        batch_size : int, optional
+            Maximum number of rows sent and committed together (default is 1000).
+
+        Returns
+        -------
+        dict
+            A report with the number of rows "inserted", the number of "batches"
+            sent and a "failed" list describing each failed batch: its
+            columns, first_row (the position of its first row in rows), the
+            indexes of all its rows in rows, the number of rows and the error.
+
+        Raises
+        ------
+        ValueError
+            If batch_size is not a positive integer.
+
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        rows = self.fill_block_keys(table, rows)
+
+        # Each group holds the input positions of its rows, so failures can be
+        # reported against the caller's rows.
+
+        groups = {}
+
+        for i, row in enumerate(rows):
+            groups.setdefault(tuple(row.keys()), []).append(i)
+
+        report = {"inserted": 0, "batches": 0, "failed": []}
+
+        for columns, group in groups.items():
+            placeholders = ", ".join(["%s"] * len(columns))
+
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+            for start in range(0, len(group), batch_size):
+                indexes = group[start:start + batch_size]
+
+                batch = [rows[i] for i in indexes]
+
+                values = [tuple(row[col] for col in columns) for row in batch]
+
+                report["batches"] += 1
+
+                try:
+                    with self.connection() as (conn, cursor):
+                        try:
+                            cursor.executemany(sql, values)
+
+                            for tracker in self.value_trackers:
+                                tracker.record(cursor, table, batch)
+
+                            self._commit(conn)
+                        except mysql.connector.Error:
+                            self._rollback(conn)
+                            raise
+                    report["inserted"] += len(batch)
+                except mysql.connector.Error as e:
+                    if self.in_transaction():
+                        raise Exception(f"value_db: insert_many: error: {e}")
+                    report["failed"].append({
+                        "columns": columns,
+                        "first_row": indexes[0],
+                        "indexes": indexes,
+                        "rows": len(batch),
+                        "error": str(e)
+                    })
+
+        self._invalidate(table)
+
+        return report
+
+    def upsert_many(self, table, rows, key_columns, batch_size = 1000):
+
+        """
+        Inserts or updates many records by natural key, e.g. when a metric feed is replayed.
+
+        Rows are matched on key_columns, which must be covered by a unique index
+        such as uq_global_metric_date (metric_id, metric_date). For each batch the
+        stored rows with the batch's keys are read with one indexed probe, so
+        every row can be reported as inserted, updated or unchanged. Unchanged
+        rows are skipped; the rest are sent as one multi-row
+        INSERT ... ON DUPLICATE KEY UPDATE. If several rows share a key, the
+        last one wins.
+
+        The probe is a locking read (FOR UPDATE), so a concurrent upsert of the
+        same keys waits for this batch to commit and then sees its rows. Two
+        batches inserting the same new key can deadlock on the probed gap;
+        InnoDB rolls one back and that batch is retried from its probe.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be upserted.
+
+        rows : iterable of dict
+            Dictionaries mapping column names to values, one per record.
+
+        key_columns : list of str
+            The natural key columns, e.g. ["metric_id", "plan_id", "metric_date"].
+
+        batch_size : int, optional
+            Maximum number of rows probed, sent and committed together (default is 1000).
+
+        Returns
+        -------
+        dict
+            A report with the numbers of rows "inserted", "updated" and
+            "unchanged", the number of "batches" and a "failed" list describing
+            each failed batch as insert_many does; positions are those of the
+            rows kept for each key.
+
+        Raises
+        ------
+        ValueError
+            If batch_size is not positive or a row lacks a key column.
+
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        key_columns = list(key_columns)
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0, "batches": 0, "failed": []}
+
+        for columns, group in group_upserts(rows, key_columns).items():
+            value_columns = [col for col in columns if col not in key_columns]
+
+            updates = ", ".join(f"{col} = VALUES({col})" for col in value_columns) or f"{key_columns[0]} = {key_columns[0]}"
+
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) ON DUPLICATE KEY UPDATE {updates}"
+
+            match = "(" + ", ".join(["%s"] * len(key_columns)) + ")"
+
+            for start in range(0, len(group), batch_size):
+                indexes = [i for i, _ in group[start:start + batch_size]]
+
+                batch = [row for _, row in group[start:start + batch_size]]
+
+                probe = f"SELECT {', '.join(columns)} FROM {table} WHERE ({', '.join(key_columns)}) IN (" + ", ".join([match] * len(batch)) + ")"
+
+                params = tuple(row[col] for row in batch for col in key_columns)
+
+                # Row-value IN lists are not pruned; a date range lets a table
+                # partitioned by metric_date probe only the batch's partitions.
+
+                bounds = date_bounds(batch) if "metric_date" in key_columns else None
+
+                if bounds:
+                    probe += " AND metric_date BETWEEN %s AND %s"
+                    params += bounds
+
+                probe += " FOR UPDATE"
+
+                report["batches"] += 1
+
+                for attempt in range(DEADLOCK_RETRIES + 1):
+                    try:
+                        with self.connection() as (conn, cursor):
+                            try:
+                                existing = self._fetch_rows(conn, probe, params)
+
+                                new, changed, unchanged = classify_upserts(batch, existing, key_columns)
+
+                                if new or changed:
+                                    cursor.executemany(sql, [tuple(row[col] for col in columns) for row in new + changed])
+
+                                if self.value_trackers and (new or changed):
+                                    replaced = {key_text(row, key_columns): row for row in existing}
+
+                                    for tracker in self.value_trackers:
+                                        tracker.record(cursor, table, new + changed, [replaced[key_text(row, key_columns)] for row in changed])
+
+                                self._commit(conn)
+                            except mysql.connector.Error:
+                                self._rollback(conn)
+                                raise
+                        report["inserted"] += len(new)
+                        report["updated"] += len(changed)
+                        report["unchanged"] += unchanged
+                        break
+                    except mysql.connector.Error as e:
+                        if self.in_transaction():
+                            raise Exception(f"value_db: upsert_many: error: {e}")
+                        if e.errno == ER_LOCK_DEADLOCK and attempt < DEADLOCK_RETRIES:
+                            continue
+                        report["failed"].append({
+                            "columns": columns,
+                            "first_row": indexes[0],
+                            "indexes": indexes,
+                            "rows": len(batch),
+                            "error": str(e)
+                        })
+
+        self._invalidate(table)
+
+        return report
+
+    def fetch_all(self, table):
+
+        """
+        Fetches all records from the specified table.
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from.
+
+        Returns
+        -------
+        list
+            A list of rows.Row objects, which also support dictionary-style access.
+
+        Raises
+        ------
+        Exception
+            If an error occurs during the fetch.
+        
+        """
+
+        sql = f"SELECT * FROM {table}"
+
+        try:
+            with self.connection() as (conn, cursor):
+                return self._fetch_rows(conn, sql)
+        except mysql.connector.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+            return[]
+        
+    def iter_table(self, table, chunk_size = 1000):
+
+        """
+        Streams all records from the specified table in chunks.
+
+        This is the generator counterpart of fetch_all; see iter_query for how
+        rows are read from the server.
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from; must exist in the metadata catalog.
+
+        chunk_size : int, optional
+            Number of rows read from the server per fetch (default is 1000).
+
+        Yields
+        ------
+        dict
+            One dictionary per row.
+
+        Raises
+        ------
+        Exception
+            If the table is unknown or an error occurs during the fetch.
+
+        """
+
+        columns = self.get_columns(table)
+
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+
+        try:
+            yield from self._stream(sql, (), chunk_size)
+        except mysql.connector.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+
+    def fetch_page(self, table, after_key = None, limit = 200, order_by = None, descending = False):
+
+        """
+        Fetches one page of records using keyset (seek) pagination.
+
+        Rows are ordered by the order_by columns followed by any primary key
+        columns not already listed, which keeps the ordering unique for tables
+        with composite keys such as event_plan. The next page starts strictly
+        after the key of the last row of the previous page, so the server seeks
+        into the index instead of counting past an OFFSET.
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from; must exist in the metadata catalog.
+
+        after_key : tuple or scalar, optional
+            Ordering key of the last row of the previous page, one value per
+            ordering column (default fetches the first page).
+
+        limit : int, optional
+            Maximum number of rows to return (default is 200).
+
+        order_by : list of str, optional
+            Leading ordering columns (default orders by the primary key only).
+
+        descending : bool, optional
+            Page from the highest key downward, e.g. most recent records first
+            (default is False).
+
+        Returns
+        -------
+        list
+            A list of rows.Row objects, which also support dictionary-style access.
+
+        Raises
+        ------
+        ValueError
+            If an ordering column is unknown or after_key has the wrong length.
+
+        Exception
+            If an error occurs during the fetch.
+
+        """
+
+        columns = self.get_columns(table)
+
+        order_columns = self.page_order(table, order_by)
+
+        unknown = [col for col in order_columns if col not in columns]
+
+        if unknown:
+            raise ValueError(f"Unknown order_by columns for {table}: {', '.join(unknown)}")
+
+        direction = "DESC" if descending else "ASC"
+
+        comparison = "<" if descending else ">"
+
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+
+        params = []
+
+        if after_key is not None:
+            if not isinstance(after_key, (list, tuple)):
+                after_key = (after_key,)
+
+            if len(after_key) != len(order_columns):
+                raise ValueError(f"after_key must have {len(order_columns)} values for {table}.")
+
+            # Expand (a, b) > (x, y) into a > x OR (a = x AND b > y) so the
+            # optimizer can seek on the leading key column.
+
+            clauses = []
+
+            for i, col in enumerate(order_columns):
+                equals = [f"{prev} = %s" for prev in order_columns[:i]]
+                clauses.append("(" + " AND ".join(equals + [f"{col} {comparison} %s"]) + ")")
+                params.extend(after_key[:i + 1])
+
+            sql += " WHERE " + " OR ".join(clauses)
+
+        sql += " ORDER BY " + ", ".join(f"{col} {direction}" for col in order_columns)
+
+        sql += " LIMIT %s"
+
+        params.append(int(limit))
+
+        try:
+            with self.connection() as (conn, cursor):
+                return self._fetch_rows(conn, sql, tuple(params))
+        except mysql.connector.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+            return []
+
+    def _fetch_rows(self, conn, sql, params = None):
+
+        """
+        Runs a statement on a tuple cursor of conn and returns its rows as Row objects.
+
+        """
+
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(sql, params)
+            return fetch_rows(cursor)
+        finally:
+            cursor.close()
+
+    def page_order(self, table, order_by = None):
+
+        """
+        Returns the columns used to order and key pages of a table.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        order_by : list of str, optional
+            Leading ordering columns (default is the primary key only).
+
+        Returns
+        -------
+        list
+            The order_by columns followed by any primary key columns not already listed.
+
+        """
+
+        order_columns = list(order_by or [])
+
+        for key in self.get_primary_keys(table):
+            if key not in order_columns:
+                order_columns.append(key)
+
+        return order_columns
+
+    def estimate_row_count(self, table):
+
+        """
+        Returns the server's estimate of the number of rows in a table.
+
+        The value comes from information_schema.TABLES and is approximate for
+        InnoDB tables, but it costs no table scan.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        int
+            The estimated row count, or 0 if the table is unknown.
+
+        Raises
+        ------
+        Exception
+            If an error occurs during the lookup.
+
+        """
+
+        sql = """
+            SELECT TABLE_ROWS AS table_rows
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """
+
+        try:
+            with self.connection() as (conn, cursor):
+                cursor.execute(sql, (table,))
+                row = cursor.fetchone()
+                return int(row["table_rows"] or 0) if row else 0
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: estimate_row_count: error: {e}")
+
+    def update(self, table, data, conditions):
+
+        """
+        Updates records in the specified table based on given conditions.
+
+        Parameters
+        ----------
+        table : str
+            The table name where the update should occur.
+
+        data : dict
+            A dictionary of column names and values to update.
+
+        conditions : dict
+            A dictionary of column names and values to specify which rows to update.
+
+        Raises
+        ------
+        Exception
+            If an error occurs while calling the stored procedure.
+        
+        """
+
+        primary_keys = self.get_primary_keys(table)
+        
+        updates = ", ".join([f"{col} = %s" for col in data.keys() if col not in primary_keys])
+
+        condition_str = " AND ".join([f"{col} = %s" for col in primary_keys])
+        
+        if not updates:
+            raise Exception(f"value_db: update: error: no columns to update in {table}")
+            return
+        
+        sql = f"UPDATE {table} SET {updates} WHERE {condition_str}"
+        
+        try:
+            values = tuple(data[col] for col in data.keys() if col not in primary_keys) + tuple(conditions[col] for col in primary_keys)
+            with self.connection() as (conn, cursor):
+                try:
+                    record = {col: conditions[col] for col in primary_keys}
+
+                    stale = [tracker.affected(cursor, table, record) for tracker in self.value_trackers]
+
+                    cursor.execute(sql, values)
+
+                    # The update may move the row to another metric, plan or date.
+
+                    for tracker, keys in zip(self.value_trackers, stale):
+                        tracker.refresh(cursor, table, keys | tracker.affected(cursor, table, record))
+
+                    self._commit(conn)
+                except mysql.connector.Error:
+                    self._rollback(conn)
+                    raise
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: update: error: {e}")
+        finally:
+            self._invalidate(table)
+        
+    def delete(self, table, conditions):
+
+        """
+        Deletes records from the specified table based on given conditions.
+
+        Parameters
+        ----------
+        table : str
+            The table name where deletion should occur.
+
+        conditions : dict
+            A dictionary of column names and values specifying which rows to delete.
 
+        Raises
+        ------
         Exception
             If an error occurs while calling the stored procedure.
         
         """
 
-        if not isinstance(query_str, str):
-            raise TypeError("Query must be a string.")
-        
-        query_str = query_str.strip().lower()
+        condition_str = " AND ".join([f"{col} = %s" for col in conditions.keys()])
+
+        sql = f"DELETE FROM {table} WHERE {condition_str}"
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    stale = [tracker.affected(cursor, table, conditions) for tracker in self.value_trackers]
+
+                    cursor.execute(sql, tuple(conditions.values()))
+
+                    for tracker, keys in zip(self.value_trackers, stale):
+                        tracker.refresh(cursor, table, keys)
+
+                    self._commit(conn)
+                except mysql.connector.Error:
+                    self._rollback(conn)
+                    raise
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: delete: error: {e}")
+        finally:
+            self._invalidate(table)
         
-        if not query_str:
-            raise ValueError("Query cannot be empty.")
+    def call_procedure(self, procedure_name, params = ()):
+
+        """
+        Calls a stored procedure with optional parameters.
+
+        The procedure may write any table, so the query result cache is cleared afterwards.
+
+        Parameters
+        ----------
+        procedure_name : str
+            The name of the stored procedure to call.
 
-        forbidden = ["drop", "delete", "alter", "truncate"]
+        params : tuple, optional
+            The paramaters to pass to the stored procedures (default is an empty tuple).
 
-        # Use regex to match forbidden words as whole words.
+        Returns
+        -------
+        list
+            A list of dictionaries representing the procedure's output.
 
-        pattern = r'\b(' + '|'.join(forbidden) + r')\b'
+        Raises
+        ------
+        Exception
+            If an error occurs while calling the stored procedure.
         
-        if re.search(pattern, query_str):
-            raise ValueError("Query contains forbidden SQL keywords.")
+        """
 
-        return True
-    
-    def execute_query(self, query_str):
+        try:
+            with self.connection() as (conn, cursor):
+                cursor.callproc(procedure_name, params)
+                rows = []
+                for result in cursor.stored_results():
+                    rows.extend(dict(zip(result.column_names, row)) for row in result.fetchall())
+                self._commit(conn)
+        except mysql.connector.Error as e:
+            raise Exception(f"Error calling procedure {procedure_name}: {e}")
+            return []
+
+        self._invalidate()
+
+        return rows
+
+    def explain_query(self, query_str):
+
+        """
+        Runs EXPLAIN FORMAT=JSON on a query and summarizes the plan.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be explained.
+
+        Returns
+        -------
+        dict
+            The plan summary from query_cost.summarize_plan(): query_cost,
+            rows_examined, full_scans, filesort and temporary.
+
+        Raises
+        ------
+        Exception
+            If the query cannot be explained.
+
+        """
+
+        sql = "EXPLAIN FORMAT=JSON " + query_str.strip().rstrip(";")
+
+        try:
+            with self.connection() as (conn, cursor):
+                cursor.execute(sql)
+                row = cursor.fetchone()
+                cursor.fetchall()
+        except mysql.connector.Error as e:
+            raise Exception(f"value_db: explain_query: error: {e}")
+
+        return summarize_plan(json.loads(row["EXPLAIN"]))
+
+    def check_query_cost(self, query_str):
+
+        """
+        Checks a query's EXPLAIN estimate against the configured row budget.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be checked.
+
+        Returns
+        -------
+        dict
+            The plan summary, if the query is within budget.
+
+        Raises
+        ------
+        QueryCostError
+            If the estimated rows examined exceed query_row_budget. The error is
+            confirmable when query_cost_action is "confirm".
+
+        """
+
+        estimate = self.explain_query(query_str)
+
+        if estimate["rows_examined"] <= self.query_row_budget:
+            return estimate
+
+        reasons = [f"An estimated {estimate['rows_examined']:,} rows would be examined; the budget is {self.query_row_budget:,}."]
+
+        if estimate["full_scans"]:
+            reasons.append(f"Full table scans on: {', '.join(estimate['full_scans'])}.")
+
+        if estimate["filesort"]:
+            reasons.append("The result must be sorted without an index (filesort).")
+
+        if estimate["temporary"]:
+            reasons.append("The query needs a temporary table.")
+
+        raise QueryCostError(estimate, reasons, confirmable = self.query_cost_action == "confirm")
+
+    def execute_query(self, query_str, use_cache = False, check_cost = False, timeout = None, cancel_key = None):
 
         """
         Executes a predifined or user-input SQL query after validation.
@@ -395,13 +1572,35 @@ class Database:
         query_str : str
             String representing the query to be executed.
 
+        use_cache : bool, optional
+            Serve SELECT queries from the query result cache when possible and
+            cache fresh results (default is False).
+
+        check_cost : bool, optional
+            Run check_query_cost() before executing; use for user-saved queries
+            (default is False).
+
+        timeout : float, optional
+            Server-side execution time limit in seconds, applied through the
+            max_execution_time session variable (default is no limit).
+
+        cancel_key : str, optional
+            Key cancel_query() can stop the query by, e.g. the worker action
+            running it (default is None, not cancellable).
+
         Returns
         -------
         list
-            A list of dictionaries representing the rows.
+            A list of rows.Row objects, which also support dictionary-style access.
 
         Raises
         ------
+        QueryCostError
+            If check_cost is set and the query is over the row budget.
+
+        QueryInterruptedError
+            If the query hits its time limit or is cancelled.
+
         Exception
             If an error occurs while calling the stored procedure.
         
@@ -409,21 +1608,352 @@ class Database:
 
         if not self.validate_query(query_str):
             raise Exception(f"invalid or unsafe query.")
+
+        # Inside a transaction a read may see uncommitted writes, so it is neither
+        # served from nor stored in the cache.
+
+        cacheable = use_cache and not self.in_transaction() and re.match(r"\s*(select|with)\b", query_str, re.IGNORECASE)
+
+        if cacheable:
+            cached = self.query_cache.get(query_str)
+
+            if cached is not None:
+                return cached
+
+            version = self.query_cache.version
+
+        if check_cost:
+            self.check_query_cost(query_str)
+
+        timeout_ms = int(timeout * 1000) if timeout else 0
         
         try: 
-            self.cursor.execute(query_str)
-            return self.cursor.fetchall()
+            with self.connection() as (conn, cursor):
+                if timeout_ms:
+                    cursor.execute("SET SESSION max_execution_time = %s", (timeout_ms,))
+
+                if cancel_key is not None:
+                    with self._cancel_lock:
+                        self.running_queries[cancel_key] = conn.connection_id
+
+                try:
+                    result = self._fetch_rows(conn, query_str)
+                finally:
+                    if cancel_key is not None:
+                        with self._cancel_lock:
+                            self.running_queries.pop(cancel_key, None)
+
+                    if timeout_ms:
+                        cursor.execute("SET SESSION max_execution_time = DEFAULT")
         except mysql.connector.Error as e:
+            if e.errno == 3024:
+                raise QueryInterruptedError(f"Query stopped after its {timeout:g} second time limit.", timed_out = True)
+            if e.errno == 1317:
+                raise QueryInterruptedError("Query cancelled.", timed_out = False)
             raise Exception(f"Error executing query: {e}")
             return []
+
+        if cacheable:
+            self.query_cache.put(query_str, result, self.tables_read(query_str), version)
+
+        return result
+
+    def cancel_query(self, cancel_key):
+
+        """
+        Stops the query running through execute_query under cancel_key, if any.
+
+        KILL QUERY is issued from a separate, short-lived control connection, so
+        this works even while the shared connection is busy. The key is checked
+        and the KILL sent under the lock execute_query clears the key with, so
+        a query that has already finished is never signalled and the KILL
+        cannot reach the next statement on its connection. The interrupted
+        query raises QueryInterruptedError in its own thread.
+
+        Parameters
+        ----------
+        cancel_key : str
+            The key the query was started with.
+
+        Returns
+        -------
+        bool
+            True if a query was signalled.
+
+        Raises
+        ------
+        Exception
+            If the control connection or KILL QUERY fails.
+
+        """
+
+        with self._cancel_lock:
+            connection_id = self.running_queries.get(cancel_key)
+
+            if connection_id is None:
+                return False
+
+            try:
+                control = mysql.connector.connect(**self.connect_args)
+
+                try:
+                    cursor = control.cursor()
+                    cursor.execute(f"KILL QUERY {int(connection_id)}")
+                    cursor.close()
+                finally:
+                    control.close()
+            except mysql.connector.Error as e:
+                raise Exception(f"value_db: cancel_query: error: {e}")
+
+        return True
+
+    def tables_read(self, query_str):
+
+        """
+        Returns the tables a query reads, for query cache invalidation.
+
+        Views are mapped to a wildcard because their base tables are not tracked.
+
+        Parameters
+        ----------
+        query_str : str
+            The query text.
+
+        Returns
+        -------
+        set
+            Lower-case table names, possibly including QueryCache.ANY_TABLE.
+
+        """
+
+        names = {name.lower(): name for name in self.catalog.table_names()}
+
+        tables = set()
+
+        for table in QueryCache.tables_read(query_str, names):
+            if self.catalog.is_view(names[table]):
+                tables.add(QueryCache.ANY_TABLE)
+            else:
+                tables.add(table)
+
+        return tables
         
+    def iter_query(self, query_str, chunk_size = 1000, params = ()):
+
+        """
+        Streams the rows of a predefined or user-input SQL query after validation.
+
+        Unlike execute_query, rows are read from an unbuffered cursor with
+        fetchmany, so only chunk_size rows are held in memory at a time.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be executed.
+
+        chunk_size : int, optional
+            Number of rows read from the server per fetch (default is 1000).
+
+        params : tuple, optional
+            Values for any %s placeholders in the query (default is an empty tuple).
+
+        Yields
+        ------
+        dict
+            One dictionary per row.
+
+        Raises
+        ------
+        Exception
+            If the query is unsafe or an error occurs while executing it.
+
+        Notes
+        -----
+        The rows are read on a connection of their own, checked out from the
+        pool or opened for the stream outside pooled mode, so other statements
+        may run while iterating and a generator closed early leaves no unread
+        rows behind. Inside transaction() the rows are read, buffered, on the
+        transaction's connection so they include its uncommitted writes.
+
+        """
+
+        if not self.validate_query(query_str):
+            raise Exception(f"invalid or unsafe query.")
+
+        try:
+            yield from self._stream(query_str, params, chunk_size)
+        except mysql.connector.Error as e:
+            raise Exception(f"Error executing query: {e}")
+
+    def query_columnar(self, query_str, params = (), decimal_mode = "float", chunk_size = 10000):
+
+        """
+        Runs a predefined or user-input SQL query and returns its result by column.
+
+        Rows are read from an unbuffered tuple cursor with fetchmany and each
+        chunk is converted to typed NumPy arrays straight away, so no per-row
+        dictionaries or Decimal objects are kept. Use this for analytics over
+        long metric histories; see columnar.ColumnarResult for the type mapping.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be executed.
+
+        params : tuple, optional
+            Values for any %s placeholders in the query (default is an empty tuple).
+
+        decimal_mode : str, optional
+            "float" (default) returns DECIMAL columns as float64; "scaled" returns
+            them as exact int64 hundredths.
+
+        chunk_size : int, optional
+            Number of rows read from the server per fetch (default is 10000).
+
+        Returns
+        -------
+        ColumnarResult
+            The column header and one array per column.
+
+        Raises
+        ------
+        ImportError
+            If NumPy is not installed.
+
+        Exception
+            If the query is unsafe or an error occurs while executing it.
+
+        """
+
+        if not self.validate_query(query_str):
+            raise Exception(f"invalid or unsafe query.")
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+
+        try:
+            with self.connection() as (conn, cursor):
+                stream = conn.cursor(buffered = False)
+
+                try:
+                    stream.execute(query_str, params)
+
+                    chunks = iter(lambda: stream.fetchmany(chunk_size), [])
+
+                    return ColumnarResult.from_chunks(list(stream.column_names), chunks, decimal_mode = decimal_mode)
+                finally:
+                    stream.close()
+        except mysql.connector.Error as e:
+            raise Exception(f"Error executing query: {e}")
+
+    def _stream(self, sql, params, chunk_size):
+
+        """
+        Yields rows of a statement from a dedicated unbuffered cursor, chunk by chunk.
+
+        """
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+
+        tx = getattr(self._local, "tx", None)
+
+        if tx is not None:
+            stream = tx["conn"].cursor(dictionary = True, buffered = True)
+
+            try:
+                stream.execute(sql, params)
+
+                yield from stream.fetchall()
+            finally:
+                stream.close()
+            return
+
+        # The shared connection is never held between yields.
+
+        conn = self.checkout() if self.pool is not None else mysql.connector.connect(**self.connect_args)
+
+        stream = conn.cursor(dictionary = True, buffered = False)
+
+        exhausted = False
+
+        try:
+            stream.execute(sql, params)
+
+            while True:
+                rows = stream.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                yield from rows
+
+            exhausted = True
+        finally:
+            if not exhausted and self.pool is None:
+                # Dropping the socket discards the unread rows of an abandoned stream.
+
+                conn.shutdown()
+            else:
+                if not exhausted:
+                    # A pooled connection goes back to the pool, so its unread rows are drained.
+
+                    try:
+                        while stream.fetchmany(chunk_size):
+                            pass
+                    except mysql.connector.Error:
+                        pass
+
+                stream.close()
+                conn.close()
+
+    def reconnect(self):
+
+        """
+        Re-establishes the shared connection if the server dropped it.
+
+        Pooled connections are pinged on checkout instead (see pool_ping), so in
+        pooled mode there is nothing to do.
+
+        Raises
+        ------
+        Exception
+            If the server cannot be reached.
+
+        """
+
+        if self.pool is not None:
+            return
+
+        with self._lock:
+            try:
+                self.conn.ping(reconnect = True, attempts = 1, delay = 0)
+            except mysql.connector.Error as e:
+                raise Exception(f"value_db: reconnect: error: {e}")
+
+            self.cursor = self.conn.cursor(dictionary = True)
+
     def close(self):
 
         """
-        Closes the database connection.
-        
+        Closes the database connection, or releases the connection pool.
+
+        mysql-connector has no public call that closes a pool, so the pool is
+        dropped: its idle connections are closed as it is garbage collected,
+        and connections still checked out go with it once they are returned.
+        Calling close() again does nothing.
+
         """
 
+        if self.pool is not None:
+            self.pool = None
+            return
+
+        if self.conn is None:
+            return
+
         self.cursor.close()
         self.conn.close()
+
+        self.conn = self.cursor = None
     
\ No newline at end of file
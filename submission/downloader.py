@@ -27,6 +27,12 @@ class Downloader:
     download(query_result, query_title)
         Prompts the user to save the query result as a csv file.
 
+    ask_file_path(query_title)
+        Prompts the user for the csv file path.
+
+    save(query_result, file_path)
+        Writes the query result to a csv file.
+
     """
 
     def __init__(self, msg_handler):
@@ -68,6 +74,39 @@ class Downloader:
 
             return
         
+        file_path = self.ask_file_path(query_title)
+
+        if not file_path:
+
+            return
+        
+        try:
+
+            self.save(query_result, file_path)
+
+            self.msg_handler.show_info("Result Saved", f"Result saved to the following location: \n\n {file_path}")
+
+        except Exception as e:
+
+            self.msg_handler.show_error("Download Error", f"Error saving file: \n\n {e}")
+
+    def ask_file_path(self, query_title):
+
+        """
+        Prompt the user for the csv file to save a query result to.
+
+        Parameters
+        ----------
+        query_title : str
+            The title of the query, used to generate the default file name.
+
+        Returns
+        -------
+        str or None
+            The selected file path, or None if the user cancelled.
+
+        """
+
         title = query_title.strip().replace(" ", "_")
 
         date_str = datetime.now().strftime("%Y-%m-%d")
@@ -85,21 +124,36 @@ class Downloader:
 
             self.msg_handler.show_warning("Download Error", "No file path specified for download.")
 
-            return
+            return None
         
-        try:
+        return file_path
+
+    def save(self, query_result, file_path):
+
+        """
+        Write a query result to a csv file without any user interaction.
+
+        This method does no dialog or message box work, so it can run on a 
+        background thread; errors are raised to the caller.
 
-            with open(file_path, "w", newline = "", encoding = "utf-8") as csv_file:
+        Parameters
+        ----------
+        query_result : list of dict
+            The data to be saved, where each dictionary represents a row of the query result.
 
-                writer = csv.DictWriter(csv_file, fieldnames = query_result[0].keys())
+        file_path : str
+            The path of the csv file to write.
 
-                writer.writeheader()
+        Returns
+        -------
+        None
 
-                writer.writerows(query_result)
+        """
 
-                self.msg_handler.show_info("Result Saved", f"Result saved to the following location: \n\n {file_path}")
+        with open(file_path, "w", newline = "", encoding = "utf-8") as csv_file:
 
-        except Exception as e:
+            writer = csv.DictWriter(csv_file, fieldnames = query_result[0].keys())
 
-            self.msg_handler.show_error("Download Error", f"Error saving file: \n\n {e}")
-            
\ No newline at end of file
+            writer.writeheader()
+
+            writer.writerows(query_result)
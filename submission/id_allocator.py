@@ -0,0 +1,122 @@
+import threading
+
+class IdAllocator:
+
+    """
+    A hi/lo allocator of primary key values for tables without AUTO_INCREMENT keys.
+
+    Blocks of block_size consecutive values are reserved from the id_block
+    table with one statement (see reserve_ids() on the database backends) and
+    handed out locally, so inserting into a table such as plan costs a round
+    trip per block instead of per row. Values of an unused block are skipped
+    when the application exits; keys stay unique and increasing, though not
+    gap-free. Each new block starts past the table's largest stored key, so
+    rows inserted with explicit keys are skipped; an explicit key inside a
+    block already reserved by a client can still collide, so bulk loads
+    should leave keys to the allocator.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database whose reserve_ids(table, count) method reserves blocks.
+
+    block_size : int
+        Number of values reserved per round trip.
+
+    Methods
+    -------
+    next_id(table):
+        Returns the next key value for a table.
+
+    reserve(table, count):
+        Reserves count consecutive key values for a bulk load.
+
+    """
+
+    def __init__(self, db, block_size = 100):
+
+        """
+        Initialize the allocator with no reserved blocks.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database that owns the id_block table.
+
+        block_size : int, optional
+            Number of values reserved per round trip (default is 100).
+
+        Raises
+        ------
+        ValueError
+            If block_size is not a positive integer.
+
+        """
+
+        if block_size < 1:
+            raise ValueError("block_size must be a positive integer.")
+
+        self.db = db
+
+        self.block_size = block_size
+
+        self.blocks = {}
+
+        self._lock = threading.Lock()
+
+    def next_id(self, table):
+
+        """
+        Returns the next key value for a table, reserving a new block when the current one is used up.
+
+        Parameters
+        ----------
+        table : str
+            The table that needs a key.
+
+        Returns
+        -------
+        int
+            An unused key value.
+
+        """
+
+        with self._lock:
+            low, high = self.blocks.get(table, (0, 0))
+
+            if low >= high:
+                low = self.db.reserve_ids(table, self.block_size)
+                high = low + self.block_size
+
+            self.blocks[table] = (low + 1, high)
+
+            return low
+
+    def reserve(self, table, count):
+
+        """
+        Reserves count consecutive key values in one round trip.
+
+        The locally cached block is left alone; bulk loads get their own range.
+
+        Parameters
+        ----------
+        table : str
+            The table being loaded.
+
+        count : int
+            Number of key values needed.
+
+        Returns
+        -------
+        range
+            The reserved key values.
+
+        """
+
+        if count < 1:
+            return range(0)
+
+        first = self.db.reserve_ids(table, count)
+
+        return range(first, first + count)
@@ -0,0 +1,568 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Date formats tried, in order, for metric_date. Month-first formats are
+# tried before day-first ones, so 03/04/2024 is read as March 4.
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%d-%b-%Y", "%d %b %Y", "%b %d, %Y")
+
+KEY_COLUMNS = ["metric_id", "plan_id", "metric_date"]
+
+CENT = Decimal("0.01")
+
+# DECIMAL(10,2) holds values below 10 ** 8.
+
+MAX_VALUE = Decimal(10) ** 8
+
+# Lookup maps and settings of a parser process, set once by _init_parser so
+# the maps are not pickled again for every file.
+
+_parser = {}
+
+def load_lookup_maps(db, plan_level = True):
+
+    """
+    Reads the name-to-id maps used to resolve metric feeds.
+
+    Names are matched without regard to case or surrounding spaces. A name
+    shared by several rows maps to None, so rows using it are rejected as
+    ambiguous rather than loaded against an arbitrary id.
+
+    Parameters
+    ----------
+    db : StorageBackend
+        The database to read the metric and plan tables from.
+
+    plan_level : bool, optional
+        Map plan-level metrics if True (default), global metrics if False.
+
+    Returns
+    -------
+    dict
+        Lookups for convert_row(): "metrics" and "plans" map normalized
+        metric_name and plan_name to their ids, and "metric_ids" and
+        "plan_ids" hold the valid ids.
+
+    """
+
+    metrics = {}
+
+    for row in db.execute_query(f"SELECT metric_id, metric_name FROM metric WHERE is_plan_level = {int(plan_level)}"):
+        name = _normalize(row["metric_name"])
+        metrics[name] = None if name in metrics else row["metric_id"]
+
+    plans = {}
+
+    for row in db.execute_query("SELECT plan_id, plan_name FROM plan"):
+        name = _normalize(row["plan_name"])
+        plans[name] = None if name in plans else row["plan_id"]
+
+    return {
+        "metrics": metrics,
+        "metric_ids": {value for value in metrics.values() if value is not None},
+        "plans": plans,
+        "plan_ids": {value for value in plans.values() if value is not None}
+    }
+
+def _normalize(name):
+
+    return " ".join(str(name).split()).casefold()
+
+def _init_parser(lookups, date_formats):
+
+    _parser["lookups"] = lookups
+
+    _parser["date_formats"] = date_formats
+
+def parse_date(text, date_formats = DATE_FORMATS):
+
+    """
+    Parses a metric date written in any of date_formats.
+
+    Parameters
+    ----------
+    text : str
+        The date as written in the file.
+
+    date_formats : sequence of str, optional
+        strptime formats to try, in order (default is DATE_FORMATS).
+
+    Returns
+    -------
+    datetime.date or None
+        The date, or None if no format matches.
+
+    """
+
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+
+    return None
+
+def parse_value(text):
+
+    """
+    Converts a metric value to a Decimal with DECIMAL(10,2) precision.
+
+    Thousands separators are removed and the value is rounded half up to cents.
+
+    Parameters
+    ----------
+    text : str
+        The value as written in the file.
+
+    Returns
+    -------
+    Decimal or None
+        The rounded value, or None if the text is not a finite number or does
+        not fit in DECIMAL(10,2).
+
+    """
+
+    try:
+        value = Decimal(text.replace(",", "")).quantize(CENT, rounding = ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        return None
+
+    if not value.is_finite() or abs(value) >= MAX_VALUE:
+        return None
+
+    return value
+
+def _resolve(record, header, name_column, id_column, names, ids):
+
+    # Returns (id, reason); the name column wins when a file has both.
+
+    if name_column in header:
+        text = record[header[name_column]].strip()
+
+        if not text:
+            return None, f"{name_column} is missing"
+
+        if _normalize(text) not in names:
+            return None, f"unknown {name_column} {text!r}"
+
+        found = names[_normalize(text)]
+
+        return (found, None) if found is not None else (None, f"{name_column} {text!r} is ambiguous")
+
+    text = record[header[id_column]].strip()
+
+    if not text.isdigit() or int(text) not in ids:
+        return None, f"unknown {id_column} {text!r}"
+
+    return int(text), None
+
+def parse_file(path, batch_size = 1000, max_rejects = 100):
+
+    """
+    Parses and validates one plan metric CSV file in a parser process.
+
+    The file needs a header with metric_name or metric_id, plan_name or
+    plan_id, metric_date and actual_value columns; other columns are ignored.
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV file.
+
+    batch_size : int, optional
+        Rows per converted batch (default is 1000).
+
+    max_rejects : int, optional
+        Rejected rows listed individually (default is 100).
+
+    Returns
+    -------
+    dict
+        The "file", the number of data "rows", the converted "batches" (lists
+        of plan_metric_value rows), the number "rejected" and the first
+        rejected rows as (line, reason) pairs ("rejects"), or an "error" if
+        the file could not be read.
+
+    """
+
+    parsed = {"file": path, "rows": 0, "batches": [], "rejected": 0, "rejects": [], "error": None}
+
+    try:
+        with open(path, newline = "", encoding = "utf-8-sig") as csv_file:
+            reader = csv.reader(csv_file)
+
+            header = {name.strip(): i for i, name in enumerate(next(reader, []))}
+
+            missing = [
+                col for col, alternative in (("metric_name", "metric_id"), ("plan_name", "plan_id"), ("metric_date", None), ("actual_value", None))
+                if col not in header and alternative not in header
+            ]
+
+            if missing:
+                parsed["error"] = f"missing columns: {', '.join(missing)}"
+                return parsed
+
+            width = max(header.values()) + 1
+
+            batch = []
+
+            for line, record in enumerate(reader, start = 2):
+                if not record:
+                    continue
+
+                parsed["rows"] += 1
+
+                record = record + [""] * (width - len(record))
+
+                row, reason = convert_row(record, header, _parser["lookups"], _parser["date_formats"])
+
+                if reason is not None:
+                    parsed["rejected"] += 1
+
+                    if len(parsed["rejects"]) < max_rejects:
+                        parsed["rejects"].append((line, reason))
+
+                    continue
+
+                batch.append(row)
+
+                if len(batch) >= batch_size:
+                    parsed["batches"].append(batch)
+                    batch = []
+
+            if batch:
+                parsed["batches"].append(batch)
+
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        parsed["error"] = str(e)
+        parsed["batches"] = []
+
+    return parsed
+
+def convert_row(record, header, lookups, date_formats = DATE_FORMATS):
+
+    """
+    Converts one CSV record to a global_metric_value or plan_metric_value row.
+
+    A record is a plan metric value when the header has a plan_name or plan_id
+    column, and a global metric value otherwise.
+
+    Parameters
+    ----------
+    record : list of str
+        The CSV fields, at least as many as the header.
+
+    header : dict
+        Column name to field position.
+
+    lookups : dict
+        Name and id maps from load_lookup_maps().
+
+    date_formats : sequence of str, optional
+        strptime formats accepted for metric_date (default is DATE_FORMATS).
+
+    Returns
+    -------
+    tuple
+        (row, None) for a valid record, or (None, reason) for a rejected one.
+
+    """
+
+    row = {}
+
+    metric_id, reason = _resolve(record, header, "metric_name", "metric_id", lookups["metrics"], lookups["metric_ids"])
+
+    if reason is not None:
+        return None, reason
+
+    row["metric_id"] = metric_id
+
+    if "plan_name" in header or "plan_id" in header:
+        plan_id, reason = _resolve(record, header, "plan_name", "plan_id", lookups["plans"], lookups["plan_ids"])
+
+        if reason is not None:
+            return None, reason
+
+        row["plan_id"] = plan_id
+
+    text = record[header["metric_date"]].strip()
+
+    row["metric_date"] = parse_date(text, date_formats)
+
+    if row["metric_date"] is None:
+        return None, f"invalid metric_date {text!r}"
+
+    text = record[header["actual_value"]].strip()
+
+    row["actual_value"] = parse_value(text)
+
+    if row["actual_value"] is None:
+        return None, f"invalid actual_value {text!r}"
+
+    if row["actual_value"] < 0:
+        return None, "actual_value is negative"
+
+    return row, None
+
+class MetricFileImporter:
+
+    """
+    Imports many plan-level metric CSV files into plan_metric_value in parallel.
+
+    Files are parsed in a process pool, where dates are parsed, values are
+    rounded to DECIMAL(10,2) and metric and plan names are resolved against
+    maps read once from the database. Parsed files are then upserted on
+    (metric_id, plan_id, metric_date) by a few writer threads, each using its
+    own pooled connection, so parsing (CPU-bound) overlaps with inserting
+    (I/O-bound).
+
+    At most window files are parsed ahead of the writers. When the writers
+    fall behind, parsing stops until a file has been written, so memory stays
+    bounded however many files are given. Files are handed to the writers in
+    the order given and the batches of a file are committed in order, so a
+    failed import can be resumed from the first file that did not finish.
+    Files are written side by side only while they share no (metric_id,
+    plan_id, metric_date) key: a file holding a key of a file still being
+    written waits for that write, so the later file's value wins, e.g. for a
+    corrected re-send.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database to import into.
+
+    workers : int
+        Number of parser processes.
+
+    writers : int
+        Number of writer threads; more than the connection pool size only adds waiting.
+
+    window : int
+        Maximum number of parsed files waiting to be written.
+
+    batch_size : int
+        Rows per upsert batch and commit.
+
+    date_formats : tuple of str
+        strptime formats accepted for metric_date.
+
+    Methods
+    -------
+    import_files(paths, progress=None):
+        Imports the files and returns a report per file.
+
+    """
+
+    def __init__(self, db, workers = None, writers = None, window = None, batch_size = 1000, date_formats = DATE_FORMATS):
+
+        """
+        Initialize the importer.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database to import into.
+
+        workers : int, optional
+            Parser processes (default is the number of CPUs).
+
+        writers : int, optional
+            Writer threads (default is the connection pool size, or 1 without a pool).
+
+        window : int, optional
+            Parsed files allowed to wait for a writer (default is twice the workers).
+
+        batch_size : int, optional
+            Rows per upsert batch and commit (default is 1000).
+
+        date_formats : sequence of str, optional
+            strptime formats accepted for metric_date (default is DATE_FORMATS).
+
+        """
+
+        self.db = db
+
+        self.workers = workers or os.cpu_count() or 1
+
+        pool = getattr(db, "pool", None)
+
+        self.writers = writers or (pool.pool_size if pool is not None else 1)
+
+        self.window = window or 2 * self.workers
+
+        self.batch_size = batch_size
+
+        self.date_formats = tuple(date_formats)
+
+    def import_files(self, paths, progress = None):
+
+        """
+        Parses and upserts a list of plan metric CSV files.
+
+        Parameters
+        ----------
+        paths : iterable of str
+            The CSV files, in the order they should be committed.
+
+        progress : callable, optional
+            Called with each file's report as soon as the file is written.
+
+        Returns
+        -------
+        list
+            One report per file, in order: the parse results ("file", "rows",
+            "rejected", "rejects", "error") plus the "inserted", "updated",
+            "unchanged" and "failed" counts of the upsert.
+
+        """
+
+        lookups = load_lookup_maps(self.db)
+
+        paths = iter(paths)
+
+        parsing = deque()
+
+        writing = deque()
+
+        reports = []
+
+        def collect():
+
+            report = writing.popleft()[0].result()
+
+            reports.append(report)
+
+            if progress is not None:
+                progress(report)
+
+        with ProcessPoolExecutor(self.workers, initializer = _init_parser, initargs = (lookups, self.date_formats)) as parsers, \
+                ThreadPoolExecutor(self.writers) as writers:
+
+            def fill():
+
+                while len(parsing) < self.window:
+                    path = next(paths, None)
+
+                    if path is None:
+                        return
+
+                    parsing.append(parsers.submit(parse_file, path, self.batch_size))
+
+            fill()
+
+            while parsing:
+                parsed = parsing.popleft().result()
+
+                keys = {tuple(row[col] for col in KEY_COLUMNS) for batch in parsed["batches"] for row in batch}
+
+                # Back-pressure: wait for the oldest write before handing over
+                # another file, and for every earlier file sharing a key with it.
+
+                while len(writing) >= self.writers or any(not keys.isdisjoint(pending) for _, pending in writing):
+                    collect()
+
+                writing.append((writers.submit(self._write, parsed), keys))
+
+                fill()
+
+            while writing:
+                collect()
+
+        return reports
+
+    def _write(self, parsed):
+
+        report = {key: value for key, value in parsed.items() if key != "batches"}
+
+        report.update({"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0})
+
+        for batch in parsed["batches"]:
+            result = self.db.upsert_many("plan_metric_value", batch, KEY_COLUMNS, batch_size = self.batch_size)
+
+            for key in ("inserted", "updated", "unchanged"):
+                report[key] += result[key]
+
+            report["failed"] += sum(failure["rows"] for failure in result["failed"])
+
+        return report
+
+def expand_paths(arguments):
+
+    """
+    Expands directories and glob patterns into a sorted list of CSV files.
+
+    """
+
+    paths = []
+
+    for argument in arguments:
+        if os.path.isdir(argument):
+            paths.extend(sorted(glob.glob(os.path.join(argument, "*.csv"))))
+        elif glob.has_magic(argument):
+            paths.extend(sorted(glob.glob(argument)))
+        else:
+            paths.append(argument)
+
+    return paths
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Import plan-level metric CSV files into plan_metric_value.")
+
+    parser.add_argument("paths", nargs = "+", help = "CSV files, directories or glob patterns")
+    parser.add_argument("--workers", type = int, help = "parser processes (default: CPU count)")
+    parser.add_argument("--writers", type = int, help = "writer threads (default: connection pool size)")
+    parser.add_argument("--window", type = int, help = "parsed files waiting to be written (default: 2 x workers)")
+    parser.add_argument("--batch-size", type = int, default = 1000, help = "rows per upsert batch and commit")
+    parser.add_argument("--date-format", action = "append", dest = "date_formats", help = "accepted strptime date format; repeat for several (default: common formats)")
+    parser.add_argument("--config", help = "path to config.ini")
+
+    args = parser.parse_args(argv)
+
+    from backend import open_database
+
+    db = open_database(args.config)
+
+    importer = MetricFileImporter(
+        db,
+        workers = args.workers,
+        writers = args.writers,
+        window = args.window,
+        batch_size = args.batch_size,
+        date_formats = args.date_formats or DATE_FORMATS
+    )
+
+    def show(report):
+
+        if report["error"]:
+            print(f"{report['file']}: error: {report['error']}")
+            return
+
+        print(f"{report['file']}: {report['rows']} rows, {report['inserted']} inserted, {report['updated']} updated, "
+              f"{report['unchanged']} unchanged, {report['rejected']} rejected, {report['failed']} failed")
+
+        for line, reason in report["rejects"]:
+            print(f"  line {line}: {reason}")
+
+    try:
+        reports = importer.import_files(expand_paths(args.paths), progress = show)
+    finally:
+        db.close()
+
+    failed = sum(1 for report in reports if report["error"] or report["failed"])
+
+    print(f"{len(reports)} files, {sum(report['inserted'] for report in reports)} inserted, "
+          f"{sum(report['updated'] for report in reports)} updated, {sum(report['rejected'] for report in reports)} rejected, "
+          f"{failed} files with errors")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
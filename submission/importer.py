@@ -0,0 +1,455 @@
+import csv
+import os
+import sys
+
+# Columns accepted for each import target. Each column has a kind ("int",
+# "decimal", "date" or "text"), whether it is required, an optional minimum,
+# maximum text length and referenced table, mirroring the schema, its foreign
+# keys and the validate_*_metric_value triggers.
+
+TARGETS = {
+    "global_metric_value": {
+        "columns": {
+            "metric_id": {"kind": "int", "required": True, "references": ("metric", "metric_id")},
+            "metric_date": {"kind": "date", "required": True},
+            "actual_value": {"kind": "decimal", "required": True, "minimum": 0}
+        },
+        "merge": "upsert",
+        "key": ["metric_id", "metric_date"]
+    },
+    "plan_metric_value": {
+        "columns": {
+            "metric_id": {"kind": "int", "required": True, "references": ("metric", "metric_id")},
+            "plan_id": {"kind": "int", "required": True, "references": ("plan", "plan_id")},
+            "metric_date": {"kind": "date", "required": True},
+            "actual_value": {"kind": "decimal", "required": True, "minimum": 0}
+        },
+        "merge": "upsert",
+        "key": ["metric_id", "plan_id", "metric_date"]
+    },
+    "event": {
+        "columns": {
+            "event_title": {"kind": "text", "required": True, "max_length": 100},
+            "event_description": {"kind": "text", "required": True},
+            "event_date": {"kind": "date", "required": True},
+            "activation_id": {"kind": "int", "required": False}
+        },
+        "merge": "insert",
+        "key": []
+    },
+    "event_plan": {
+        "columns": {
+            "event_id": {"kind": "int", "required": True, "references": ("event", "event_id")},
+            "plan_id": {"kind": "int", "required": True, "references": ("plan", "plan_id")}
+        },
+        "merge": "ignore",
+        "key": ["event_id", "plan_id"]
+    }
+}
+
+# Patterns avoid backslashes so they read the same in MySQL and SQLite string literals.
+
+PATTERNS = {
+    "int": "^[0-9]+$",
+    "decimal": "^-?[0-9]{1,8}([.][0-9]{1,2})?$",
+    "date": "^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$"
+}
+
+DIALECTS = {
+    "mysql": {
+        "create_stage": "CREATE TEMPORARY TABLE {stage} (line_no INT AUTO_INCREMENT PRIMARY KEY, {columns}, reject_reason VARCHAR(255))",
+        "drop_stage": "DROP TEMPORARY TABLE IF EXISTS {stage}",
+        "casts": {
+            "int": "CAST({col} AS SIGNED)",
+            "decimal": "CAST({col} AS DECIMAL(10,2))",
+            "date": "CAST({col} AS DATE)",
+            "text": "{col}"
+        },
+        "bad_date": "CAST(SUBSTRING({col}, 9, 2) AS SIGNED) > DAY(LAST_DAY(CONCAT(LEFT({col}, 7), '-01')))",
+        "length": "CHAR_LENGTH",
+        "insert_ignore": "INSERT IGNORE",
+        "upsert": "ON DUPLICATE KEY UPDATE {updates}",
+        "update_value": "{col} = VALUES({col})"
+    },
+    "sqlite": {
+        "create_stage": "CREATE TEMP TABLE {stage} (line_no INTEGER PRIMARY KEY, {columns}, reject_reason TEXT)",
+        "drop_stage": "DROP TABLE IF EXISTS temp.{stage}",
+        "casts": {
+            "int": "CAST({col} AS INTEGER)",
+            "decimal": "CAST({col} AS DECIMAL(10,2))",
+            "date": "{col}",
+            "text": "{col}"
+        },
+        "bad_date": "date({col}, '+0 days') IS NOT {col}",
+        "length": "LENGTH",
+        "insert_ignore": "INSERT OR IGNORE",
+        "upsert": "ON CONFLICT ({key}) DO UPDATE SET {updates}",
+        "update_value": "{col} = excluded.{col}"
+    }
+}
+
+class ImportCancelled(Exception):
+
+    """
+    Raised inside the import transaction to roll back a validate_only run.
+
+    """
+
+class BulkImporter:
+
+    """
+    Loads CSV files into metric value, event and event_plan tables in bulk.
+
+    A file is streamed into a temporary staging table of text columns, with
+    LOAD DATA LOCAL INFILE on MySQL when allow_local_infile is enabled (and
+    batched inserts otherwise). The staged rows are then validated with one
+    UPDATE per rule, which marks each bad row with a reject reason: missing
+    values, malformed numbers and dates, negative metric values and missing
+    metric, plan or event references. Finally the valid rows are merged into
+    the target with a single INSERT ... SELECT. Metric values are upserted on
+    their natural key, events are appended and existing event_plan links are
+    skipped. Everything runs in one transaction, so a failed import leaves
+    the target untouched.
+
+    The CSV must have a header row naming target columns; other columns are
+    ignored. Dates are YYYY-MM-DD and empty fields are NULL.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database to import into.
+
+    chunk_size : int
+        Rows per batch when the file is staged with batched inserts.
+
+    max_rejects : int
+        Maximum number of rejected rows listed individually in the report.
+
+    Methods
+    -------
+    import_file(table, path, validate_only=False):
+        Stages, validates and merges a CSV file, returning a report.
+
+    """
+
+    def __init__(self, db, chunk_size = 10000, max_rejects = 100):
+
+        """
+        Initialize the importer.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database to import into.
+
+        chunk_size : int, optional
+            Rows per batch for batched staging (default is 10000).
+
+        max_rejects : int, optional
+            Rejected rows listed in the report (default is 100).
+
+        """
+
+        self.db = db
+
+        self.chunk_size = chunk_size
+
+        self.max_rejects = max_rejects
+
+        self.sql = DIALECTS[db.dialect]
+
+    def import_file(self, table, path, validate_only = False):
+
+        """
+        Stages, validates and merges one CSV file into a table.
+
+        Parameters
+        ----------
+        table : str
+            One of global_metric_value, plan_metric_value, event or event_plan.
+
+        path : str
+            Path of the CSV file.
+
+        validate_only : bool, optional
+            Stage and validate, report, then roll back without merging (default is False).
+
+        Returns
+        -------
+        dict
+            A report with the "table", "file", the number of "rows" read,
+            "loaded" (valid rows merged, or that would be merged), "rejected",
+            "skipped" (event_plan links that already existed), the reject
+            counts by reason ("reasons") and the first rejected rows as
+            (line, reason) pairs ("rejects"). Line numbers count the header as
+            line 1.
+
+        Raises
+        ------
+        ValueError
+            If the table is not supported or the header lacks a required column.
+
+        Exception
+            If staging or merging fails; nothing is merged.
+
+        """
+
+        if table not in TARGETS:
+            raise ValueError(f"Bulk import is not supported for {table}.")
+
+        target = TARGETS[table]
+
+        header = self._read_header(path)
+
+        columns = [col for col in target["columns"] if col in header]
+
+        missing = [col for col, rule in target["columns"].items() if rule["required"] and col not in header]
+
+        if missing:
+            raise ValueError(f"{os.path.basename(path)} is missing required columns: {', '.join(missing)}")
+
+        stage = f"stage_{table}"
+
+        report = {"table": table, "file": path}
+
+        try:
+            with self.db.transaction():
+                with self.db.connection() as (conn, cursor):
+                    cursor.execute(self.sql["drop_stage"].format(stage = stage))
+
+                    cursor.execute(self.sql["create_stage"].format(
+                        stage = stage,
+                        columns = ", ".join(f"{col} TEXT" for col in columns)
+                    ))
+
+                    try:
+                        self._stage(cursor, stage, path, header, columns)
+
+                        self._validate(cursor, stage, target, columns)
+
+                        self._report(cursor, stage, report)
+
+                        if validate_only:
+                            raise ImportCancelled()
+
+                        report["skipped"] = report["loaded"] - self._merge(cursor, stage, table, target, columns)
+                    finally:
+                        cursor.execute(self.sql["drop_stage"].format(stage = stage))
+        except ImportCancelled:
+            report["skipped"] = 0
+            return report
+
+        self.db.table_changed(table)
+
+        return report
+
+    def _read_header(self, path):
+
+        with open(path, newline = "", encoding = "utf-8-sig") as csv_file:
+            header = next(csv.reader(csv_file), [])
+
+        return [name.strip() for name in header]
+
+    def _stage(self, cursor, stage, path, header, columns):
+
+        """
+        Copies the CSV file into the staging table, trimming values and storing empty fields as NULL.
+
+        """
+
+        if self.db.dialect == "mysql" and self.db.allow_local_infile:
+            with open(path, "rb") as csv_file:
+                first_line = csv_file.readline()
+
+            newline = "\\r\\n" if first_line.endswith(b"\r\n") else "\\n"
+
+            variables = ", ".join(f"@v{i}" for i in range(len(header)))
+
+            assignments = ", ".join(f"{col} = NULLIF(TRIM(@v{header.index(col)}), '')" for col in columns)
+
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {stage} CHARACTER SET utf8mb4 "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                f"LINES TERMINATED BY '{newline}' IGNORE 1 LINES ({variables}) SET {assignments}",
+                (os.path.abspath(path),)
+            )
+            return
+
+        positions = [header.index(col) for col in columns]
+
+        placeholders = ", ".join([self.db.placeholder] * len(columns))
+
+        sql = f"INSERT INTO {stage} ({', '.join(columns)}) VALUES ({placeholders})"
+
+        with open(path, newline = "", encoding = "utf-8-sig") as csv_file:
+            reader = csv.reader(csv_file)
+
+            next(reader, None)
+
+            batch = []
+
+            for record in reader:
+                if not record:
+                    continue
+
+                batch.append(tuple(
+                    (record[i].strip() or None) if i < len(record) else None
+                    for i in positions
+                ))
+
+                if len(batch) >= self.chunk_size:
+                    cursor.executemany(sql, batch)
+                    batch = []
+
+            if batch:
+                cursor.executemany(sql, batch)
+
+    def _validate(self, cursor, stage, target, columns):
+
+        """
+        Marks invalid staged rows with a reject reason, one set-wise UPDATE per rule.
+
+        The first failing rule of a row wins, since later rules skip rows that
+        already have a reason.
+
+        """
+
+        casts = self.sql["casts"]
+
+        rules = []
+
+        for col in columns:
+            rule = target["columns"][col]
+
+            kind = rule["kind"]
+
+            if rule["required"]:
+                rules.append((f"{col} is missing", f"{col} IS NULL"))
+
+            if kind in PATTERNS:
+                rules.append((f"{col} is not a valid {kind}", f"{col} IS NOT NULL AND {col} NOT REGEXP '{PATTERNS[kind]}'"))
+
+            if kind == "date":
+                rules.append((f"{col} is not a valid date", f"{col} IS NOT NULL AND " + self.sql["bad_date"].format(col = col)))
+
+            if "minimum" in rule:
+                rules.append((f"{col} is below {rule['minimum']}", f"{col} IS NOT NULL AND {casts[kind].format(col = col)} < {rule['minimum']}"))
+
+            if "max_length" in rule:
+                rules.append((f"{col} is longer than {rule['max_length']} characters", f"{self.sql['length']}({col}) > {rule['max_length']}"))
+
+            if "references" in rule:
+                parent, parent_col = rule["references"]
+                rules.append((
+                    f"{col} has no matching {parent}",
+                    f"{col} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.{parent_col} = {casts[kind].format(col = f'{stage}.{col}')})"
+                ))
+
+        for reason, condition in rules:
+            cursor.execute(
+                f"UPDATE {stage} SET reject_reason = {self.db.placeholder} WHERE reject_reason IS NULL AND {condition}",
+                (reason,)
+            )
+
+    def _report(self, cursor, stage, report):
+
+        cursor.execute(f"SELECT reject_reason, COUNT(*) AS row_count FROM {stage} GROUP BY reject_reason")
+
+        counts = {row["reject_reason"]: row["row_count"] for row in cursor.fetchall()}
+
+        report["loaded"] = counts.pop(None, 0)
+
+        report["rejected"] = sum(counts.values())
+
+        report["rows"] = report["loaded"] + report["rejected"]
+
+        report["reasons"] = counts
+
+        cursor.execute(
+            f"SELECT line_no, reject_reason FROM {stage} WHERE reject_reason IS NOT NULL ORDER BY line_no LIMIT {int(self.max_rejects)}"
+        )
+
+        report["rejects"] = [(row["line_no"] + 1, row["reject_reason"]) for row in cursor.fetchall()]
+
+    def _merge(self, cursor, stage, table, target, columns):
+
+        """
+        Merges the valid staged rows into the target with one INSERT ... SELECT.
+
+        Returns
+        -------
+        int
+            The rows inserted by an "ignore" merge; for other merges, the number
+            of valid rows.
+
+        """
+
+        casts = self.sql["casts"]
+
+        select = ", ".join(casts[target["columns"][col]["kind"]].format(col = col) for col in columns)
+
+        source = f"SELECT {select} FROM {stage} WHERE reject_reason IS NULL ORDER BY line_no"
+
+        insert = self.sql["insert_ignore"] if target["merge"] == "ignore" else "INSERT"
+
+        sql = f"{insert} INTO {table} ({', '.join(columns)}) {source}"
+
+        if target["merge"] == "upsert":
+            updates = ", ".join(
+                self.sql["update_value"].format(col = col) for col in columns if col not in target["key"]
+            )
+            sql += " " + self.sql["upsert"].format(key = ", ".join(target["key"]), updates = updates)
+
+        cursor.execute(sql)
+
+        merged = cursor.rowcount
+
+        # The set-wise merge bypasses the per-row statistics and rollup updates,
+        # so the summaries of the values it touched are recomputed.
+
+        trackers = [tracker for tracker in self.db.value_trackers if tracker.tracks(table, columns)]
+
+        if trackers:
+            keys = [
+                f"{casts[target['columns'][col]['kind']].format(col = col)} AS {col}"
+                for col in ("metric_id", "plan_id", "metric_date") if col in columns
+            ]
+
+            cursor.execute(f"SELECT DISTINCT {', '.join(keys)} FROM {stage} WHERE reject_reason IS NULL")
+
+            merged_rows = cursor.fetchall()
+
+            for tracker in trackers:
+                tracker.refresh(cursor, table, tracker.keys(table, merged_rows))
+
+        if target["merge"] == "ignore":
+            return merged
+
+        cursor.execute(f"SELECT COUNT(*) AS row_count FROM {stage} WHERE reject_reason IS NULL")
+
+        return cursor.fetchone()["row_count"]
+
+if __name__ == "__main__":
+
+    # Usage: python importer.py <table> <file.csv> [--validate-only]
+
+    from backend import open_database
+
+    if len(sys.argv) < 3:
+        sys.exit("usage: python importer.py <table> <file.csv> [--validate-only]")
+
+    db = open_database()
+
+    try:
+        result = BulkImporter(db).import_file(sys.argv[1], sys.argv[2], validate_only = "--validate-only" in sys.argv[3:])
+    finally:
+        db.close()
+
+    print(f"{result['table']}: {result['rows']} rows, {result['loaded']} loaded, "
+          f"{result['rejected']} rejected, {result['skipped']} skipped")
+
+    for reason, count in result["reasons"].items():
+        print(f"  {count:>8}  {reason}")
+
+    for line, reason in result["rejects"]:
+        print(f"  line {line}: {reason}")
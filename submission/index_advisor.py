@@ -0,0 +1,843 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+from query_cache import QueryCache
+from query_cost import summarize_plan
+
+# Default script of predefined queries analyzed with the saved queries.
+
+PREDEFINED_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "predefined_queries.sql")
+
+# Most columns in a proposed index; a covering index wider than this is proposed without its covering columns.
+
+MAX_COLUMNS = 5
+
+# Most proposals per table, keeping those that serve the most queries.
+
+MAX_PER_TABLE = 3
+
+TOKEN = re.compile(r"""
+    (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.)*")
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<ident>`?[A-Za-z_][A-Za-z0-9_$]*`?(?:\.`?(?:[A-Za-z_][A-Za-z0-9_$]*|\*)`?)?)
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<op><=|>=|<>|!=|[=<>(),;*+\-/%])
+""", re.S | re.X)
+
+# Words that are never table aliases or column names.
+
+KEYWORDS = {
+    "all", "and", "any", "as", "asc", "between", "by", "case", "cross", "current", "desc", "distinct",
+    "else", "end", "except", "exists", "following", "from", "full", "group", "having", "in", "inner",
+    "intersect", "interval", "is", "join", "left", "like", "limit", "natural", "not", "null", "offset",
+    "on", "or", "order", "outer", "over", "partition", "preceding", "range", "recursive", "right",
+    "rollup", "row", "rows", "select", "some", "straight_join", "then", "unbounded", "union", "using",
+    "when", "where", "window", "with"
+}
+
+# Comparisons that can seek an index on an equality or a range.
+
+EQUALITY_OPS = {"=", "in"}
+
+RANGE_OPS = {"<", ">", "<=", ">=", "between", "like"}
+
+def parse_script(text):
+
+    """
+    Splits a predefined query script into titled queries.
+
+    Each query follows a comment block whose first line is the query title,
+    as in predefined_queries.sql; the script's header block is skipped.
+
+    Parameters
+    ----------
+    text : str
+        The script text.
+
+    Returns
+    -------
+    list of tuple
+        (title, query) pairs in script order.
+
+    """
+
+    queries = []
+
+    # Comment texts and the text after each, alternately.
+
+    parts = re.split(r"/\*(.*?)\*/", text, flags = re.S)
+
+    for comment, query in zip(parts[1::2], parts[2::2]):
+        lines = [line.strip() for line in comment.splitlines() if line.strip()]
+
+        query = query.strip()
+
+        if lines and query and not lines[0].startswith("Name:"):
+            queries.append((lines[0], query))
+
+    return queries
+
+def _tokens(query):
+
+    tokens = []
+
+    for match in TOKEN.finditer(query):
+        kind = match.lastgroup
+
+        if kind in ("comment", None):
+            continue
+
+        text = match.group().replace("`", "")
+
+        tokens.append((kind, text, text.lower()))
+
+    return tokens
+
+def access_patterns(query, columns):
+
+    """
+    Finds how a query uses the columns of each table it reads.
+
+    The query is scanned, not parsed: every column reference is classified by
+    the clause it appears in, and unqualified columns are resolved against
+    the tables of their own SELECT, then of the enclosing ones.
+
+    Parameters
+    ----------
+    query : str
+        The query text.
+
+    columns : dict
+        Lower-case table names mapped to their lower-case column names.
+
+    Returns
+    -------
+    dict
+        Table names mapped to dictionaries of column lists, in order of first
+        use: "join" (equi-join keys), "equality" and "range" (filters that can
+        seek), "partition" and "group" (window partitions and GROUP BY),
+        "order" (window and query ORDER BY) and "used" (every column read).
+
+    """
+
+    tokens = _tokens(query)
+
+    # Each SELECT is a scope with its own aliases; frames track the clause
+    # inside every open parenthesis.
+
+    scopes = [{"parent": None, "aliases": {}, "tables": []}]
+
+    frames = [{"scope": 0, "clause": None, "expr": False}]
+
+    refs = []
+
+    expect_table = False
+
+    for i, (kind, text, lower) in enumerate(tokens):
+        frame = frames[-1]
+
+        prev = tokens[i - 1][2] if i else ""
+
+        following = tokens[i + 1][2] if i + 1 < len(tokens) else ""
+
+        if lower == "(":
+            if following in ("select", "with"):
+                scopes.append({"parent": frame["scope"], "aliases": {}, "tables": []})
+                frames.append({"scope": len(scopes) - 1, "clause": None, "expr": False})
+            else:
+                # Window specifications sort and partition even inside an expression.
+
+                function = i > 0 and tokens[i - 1][0] == "ident" and prev not in KEYWORDS
+                frames.append({"scope": frame["scope"], "clause": frame["clause"], "expr": (frame["expr"] or function) and prev != "over"})
+            expect_table = False
+            continue
+
+        if lower == ")":
+            if len(frames) > 1:
+                frames.pop()
+            expect_table = False
+            continue
+
+        if kind == "ident" and lower in KEYWORDS:
+            if lower in ("union", "intersect", "except"):
+                scopes.append({"parent": scopes[frame["scope"]]["parent"], "aliases": {}, "tables": []})
+                frame["scope"] = len(scopes) - 1
+                frame["clause"] = None
+            elif lower in ("from", "join", "straight_join"):
+                frame["clause"] = "from"
+                expect_table = True
+                continue
+            elif lower == "by" and prev == "partition":
+                frame["clause"] = "partition"
+            elif lower == "by" and prev == "order":
+                frame["clause"] = "order"
+            elif lower == "by" and prev == "group":
+                frame["clause"] = "group"
+            elif lower in ("select", "where", "on", "having", "using", "limit"):
+                frame["clause"] = lower
+            expect_table = False
+            continue
+
+        if kind == "op" and lower == "," and frame["clause"] == "from":
+            expect_table = True
+            continue
+
+        if kind != "ident":
+            expect_table = False
+            continue
+
+        # Function names are not columns.
+
+        if following == "(":
+            expect_table = False
+            continue
+
+        if expect_table:
+            scope = scopes[frame["scope"]]
+
+            table = lower if lower in columns else None
+
+            alias = following if tokens[i + 1:i + 2] and tokens[i + 1][0] == "ident" and following not in KEYWORDS else None
+
+            if alias is None and following == "as" and i + 2 < len(tokens):
+                alias = tokens[i + 2][2]
+
+            scope["aliases"][lower] = table
+
+            if alias:
+                scope["aliases"][alias] = table
+
+            if table:
+                scope["tables"].append(table)
+
+            expect_table = False
+            continue
+
+        # The identifier after a table is its alias, already recorded.
+
+        if frame["clause"] == "from" and (prev == "as" or i and tokens[i - 1][0] == "ident" and prev not in KEYWORDS):
+            continue
+
+        if prev == "as":
+            continue
+
+        # Columns inside function calls cannot seek or sort an index.
+
+        clause = "expr" if frame["expr"] else frame["clause"]
+
+        refs.append((frame["scope"], lower, clause, _comparison(tokens, i)))
+
+    patterns = {}
+
+    for scope_id, name, clause, op in refs:
+        table, column = _resolve(scopes, scope_id, name, columns)
+
+        if table is None:
+            continue
+
+        pattern = patterns.setdefault(table, {key: [] for key in ("join", "equality", "range", "partition", "group", "order", "used")})
+
+        if clause in ("on", "using") and op == "join":
+            _append(pattern["join"], column)
+        elif clause in ("where", "on", "having") and op in ("join", "equality"):
+            _append(pattern["equality"], column)
+        elif clause in ("where", "on", "having") and op == "range":
+            _append(pattern["range"], column)
+        elif clause in ("partition", "group", "order"):
+            _append(pattern[clause], column)
+
+        _append(pattern["used"], column)
+
+    return patterns
+
+def _comparison(tokens, i):
+
+    # Returns "join" for a column compared with another column, "equality"
+    # or "range" for a comparison with a value, and None otherwise.
+
+    def word(j):
+        return tokens[j][2] if 0 <= j < len(tokens) else ""
+
+    after, before = word(i + 1), word(i - 1)
+
+    if after == "not":
+        return None
+
+    if after in EQUALITY_OPS:
+        other = tokens[i + 2] if i + 2 < len(tokens) else None
+        if after == "=" and other and other[0] == "ident" and other[2] not in KEYWORDS and word(i + 3) != "(":
+            return "join"
+        return "equality"
+
+    if before in EQUALITY_OPS and before != "in":
+        other = tokens[i - 2] if i >= 2 else None
+        return "join" if other and other[0] == "ident" and other[2] not in KEYWORDS else "equality"
+
+    if after in RANGE_OPS or before in RANGE_OPS:
+        return "range"
+
+    return None
+
+def _resolve(scopes, scope_id, name, columns):
+
+    if "." in name:
+        qualifier, column = name.split(".", 1)
+
+        while scope_id is not None:
+            aliases = scopes[scope_id]["aliases"]
+
+            if qualifier in aliases:
+                table = aliases[qualifier]
+                return (table, column) if table and column in columns[table] else (None, None)
+
+            scope_id = scopes[scope_id]["parent"]
+
+        return None, None
+
+    while scope_id is not None:
+        found = [table for table in dict.fromkeys(scopes[scope_id]["tables"]) if name in columns[table]]
+
+        if len(found) == 1:
+            return found[0], name
+
+        if found:
+            return None, None
+
+        scope_id = scopes[scope_id]["parent"]
+
+    return None, None
+
+def _append(items, item):
+
+    if item not in items:
+        items.append(item)
+
+def candidate(pattern, max_columns = MAX_COLUMNS):
+
+    """
+    Builds the index that best serves one query's use of a table.
+
+    Columns are ordered equality first (join keys and equality filters), then
+    window partitions and GROUP BY, then a single range filter, or else the
+    ORDER BY columns; the other columns read are appended to make the index
+    covering when it stays within max_columns.
+
+    Parameters
+    ----------
+    pattern : dict
+        One table's entry from access_patterns().
+
+    max_columns : int, optional
+        Most columns in the index (default is MAX_COLUMNS).
+
+    Returns
+    -------
+    dict or None
+        "groups" (tuple of column tuples; the order of columns within a
+        group does not matter to the query), "covering" (the other columns
+        read) and "columns" (the index columns), or None if the query cannot
+        seek or sort on the table.
+
+    """
+
+    equality = []
+
+    for col in pattern["join"] + pattern["equality"]:
+        _append(equality, col)
+
+    grouped = [col for col in dict.fromkeys(pattern["partition"] + pattern["group"]) if col not in equality]
+
+    groups = [tuple(equality), tuple(grouped)]
+
+    if pattern["range"]:
+        sort = [col for col in pattern["range"][:1] if col not in equality + grouped]
+    else:
+        sort = [col for col in pattern["order"] if col not in equality + grouped]
+
+    groups = [group for group in groups + [(col,) for col in sort] if group]
+
+    key = [col for group in groups for col in group]
+
+    if not key or len(key) > max_columns:
+        return None
+
+    covering = [col for col in pattern["used"] if col not in key]
+
+    columns = key + covering if len(key) + len(covering) <= max_columns else key
+
+    return {"groups": tuple(groups), "covering": tuple(covering), "columns": tuple(columns)}
+
+def _serves(index, found, primary_keys, clustered = False):
+
+    # An index serves a candidate whose column groups, each in any order,
+    # make up its leading columns and which holds every other column read.
+    # InnoDB secondary indexes end with the primary key columns they point
+    # to, and the clustered primary key holds every column.
+
+    index = list(index)
+
+    if clustered and found["groups"] and set(primary_keys) <= set(found["groups"][0]):
+        return True
+
+    position = 0
+
+    for group in found["groups"]:
+        if set(index[position:position + len(group)]) != set(group):
+            return False
+
+        position += len(group)
+
+    return clustered or set(found["covering"]) <= set(index) | set(primary_keys)
+
+def propose(queries, schema, max_columns = MAX_COLUMNS, max_per_table = MAX_PER_TABLE):
+
+    """
+    Proposes a minimal set of composite and covering indexes for a set of queries.
+
+    Each query contributes one candidate per table it reads. A candidate is
+    dropped when the primary key, an existing index or a wider candidate
+    already serves it, so one index can stand in for several queries.
+
+    Parameters
+    ----------
+    queries : list of tuple
+        (title, query) pairs.
+
+    schema : dict
+        "columns" (table to column names), "primary_keys" (table to key
+        columns), "indexes" (table to a dict of index name to columns) and
+        "unique" (table to unique index names), as returned by
+        IndexAdvisor.schema().
+
+    max_columns : int, optional
+        Most columns in a proposed index (default is MAX_COLUMNS).
+
+    max_per_table : int, optional
+        Most proposals per table (default is MAX_PER_TABLE).
+
+    Returns
+    -------
+    list of dict
+        Proposals with "table", "name", "columns" (tuple), "queries" (list of
+        titles served) and "supersedes" (existing non-unique indexes it
+        extends, which it makes redundant).
+
+    """
+
+    columns = {table.lower(): {col.lower() for col in cols} for table, cols in schema["columns"].items()}
+
+    candidates = {}
+
+    for title, query in queries:
+        for table, pattern in access_patterns(query, columns).items():
+            found = candidate(pattern, max_columns)
+
+            if found:
+                entry = candidates.setdefault(table, {}).setdefault(found["columns"], dict(found, queries = []))
+                _append(entry["queries"], title)
+
+    proposals = []
+
+    for table, found in sorted(candidates.items()):
+        primary_keys = [col.lower() for col in schema["primary_keys"].get(table, [])]
+
+        existing = {name: [col.lower() for col in cols] for name, cols in schema["indexes"].get(table, {}).items()}
+
+        unique = schema["unique"].get(table, set())
+
+        selected = []
+
+        for cols, entry in sorted(found.items(), key = lambda item: (-len(item[0]), item[0])):
+            if primary_keys and _serves(primary_keys, entry, primary_keys, clustered = True):
+                continue
+
+            if any(_serves(index, entry, primary_keys) for index in existing.values()):
+                continue
+
+            for proposal in selected:
+                if _serves(proposal["columns"], entry, primary_keys):
+                    for title in entry["queries"]:
+                        _append(proposal["queries"], title)
+                    break
+            else:
+                selected.append({
+                    "table": table,
+                    "name": index_name(cols),
+                    "columns": cols,
+                    "queries": list(entry["queries"]),
+                    "supersedes": [name for name, index in existing.items() if name not in unique and cols[:len(index)] == tuple(index)]
+                })
+
+        selected.sort(key = lambda proposal: -len(proposal["queries"]))
+
+        proposals.extend(selected[:max_per_table])
+
+    return proposals
+
+def index_name(columns):
+
+    """
+    Returns the name of a proposed index, within MySQL's 64-character limit.
+
+    """
+
+    name = "idx_" + "_".join(columns)
+
+    if len(name) > 64:
+        name = name[:55] + "_" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+
+    return name
+
+def _used_indexes(plan):
+
+    # Index names the plan reads, from every table access.
+
+    used = set()
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, dict):
+            if "table_name" in node and node.get("key"):
+                used.add(node["key"])
+            for value in node.values():
+                walk(value)
+
+    walk(plan)
+
+    return used
+
+class IndexAdvisor:
+
+    """
+    Proposes composite and covering indexes from the access patterns of the saved queries.
+
+    The queries in user_query and in predefined_queries.sql are scanned for
+    their join keys, filter columns, GROUP BY, ORDER BY and window
+    PARTITION BY/ORDER BY columns, and propose() turns these into a minimal
+    set of indexes that existing indexes do not already serve.
+
+    On MySQL 8, compare() creates the proposals as INVISIBLE indexes, so the
+    optimizer ignores them for every other session, and runs EXPLAIN on each
+    query with the use_invisible_indexes optimizer switch off and on. The
+    before and after estimates show what each index would change; the indexes
+    are dropped again unless they are applied.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database whose schema and queries are analyzed.
+
+    Methods
+    -------
+    schema():
+        Returns the columns, primary keys and indexes of each table.
+
+    queries(script_path=PREDEFINED_SCRIPT):
+        Returns the saved and predefined queries, without duplicates.
+
+    advise(script_path=PREDEFINED_SCRIPT, max_columns=MAX_COLUMNS, max_per_table=MAX_PER_TABLE):
+        Returns the queries and the proposed indexes.
+
+    compare(proposals, queries, apply=False):
+        Returns EXPLAIN estimates for each query without and with the proposals.
+
+    """
+
+    def __init__(self, db):
+
+        """
+        Initialize the advisor.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database whose schema and queries are analyzed.
+
+        """
+
+        self.db = db
+
+    def schema(self):
+
+        """
+        Returns the columns, primary keys and indexes of each table.
+
+        Returns
+        -------
+        dict
+            "columns" (table to column names), "primary_keys" (table to key
+            columns), "indexes" (table to a dict of secondary and unique index
+            names to their columns, in index order) and "unique" (table to
+            unique index names); views are left out.
+
+        """
+
+        schema = {"columns": {}, "primary_keys": {}, "indexes": {}, "unique": {}}
+
+        with self.db.connection() as (conn, cursor):
+            if self.db.dialect == "mysql":
+                cursor.execute(
+                    "SELECT s.TABLE_NAME AS table_name, s.INDEX_NAME AS index_name, s.COLUMN_NAME AS column_name, s.NON_UNIQUE AS non_unique "
+                    "FROM information_schema.STATISTICS s WHERE s.TABLE_SCHEMA = DATABASE() "
+                    "ORDER BY s.TABLE_NAME, s.INDEX_NAME, s.SEQ_IN_INDEX"
+                )
+
+                for row in cursor.fetchall():
+                    if row["index_name"] == "PRIMARY" or not row["column_name"]:
+                        continue
+
+                    schema["indexes"].setdefault(row["table_name"].lower(), {}).setdefault(row["index_name"], []).append(row["column_name"])
+
+                    if not int(row["non_unique"]):
+                        schema["unique"].setdefault(row["table_name"].lower(), set()).add(row["index_name"])
+
+                for table in self.db.catalog.table_names():
+                    if not self.db.catalog.is_view(table):
+                        schema["columns"][table.lower()] = self.db.catalog.columns(table)
+                        schema["primary_keys"][table.lower()] = self.db.catalog.clustered_key(table)
+            else:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+
+                for table in [row["name"] for row in cursor.fetchall()]:
+                    cursor.execute(f"PRAGMA table_info({table})")
+
+                    info = cursor.fetchall()
+
+                    schema["columns"][table.lower()] = [col["name"] for col in info]
+                    schema["primary_keys"][table.lower()] = [col["name"] for col in sorted(info, key = lambda col: col["pk"]) if col["pk"]]
+
+                    cursor.execute(f"PRAGMA index_list({table})")
+
+                    for index in [row for row in cursor.fetchall() if row["origin"] != "pk"]:
+                        cursor.execute(f"PRAGMA index_info({index['name']})")
+                        schema["indexes"].setdefault(table.lower(), {})[index["name"]] = [col["name"] for col in sorted(cursor.fetchall(), key = lambda col: col["seqno"])]
+
+                        if index["unique"]:
+                            schema["unique"].setdefault(table.lower(), set()).add(index["name"])
+
+        return schema
+
+    def queries(self, script_path = PREDEFINED_SCRIPT):
+
+        """
+        Returns the saved queries and the predefined queries, without duplicates.
+
+        Parameters
+        ----------
+        script_path : str, optional
+            Script of predefined queries (default is predefined_queries.sql
+            next to this module); None reads user_query only.
+
+        Returns
+        -------
+        list of tuple
+            (title, query) pairs; a query saved under several titles is kept once.
+
+        """
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute("SELECT query_title, query_string FROM user_query ORDER BY query_id")
+            queries = [(row["query_title"], row["query_string"]) for row in cursor.fetchall()]
+
+        if script_path and os.path.exists(script_path):
+            with open(script_path, encoding = "utf-8", errors = "replace") as f:
+                queries.extend(parse_script(f.read()))
+
+        unique = {}
+
+        for title, query in queries:
+            unique.setdefault(QueryCache.normalize(query), (title, query))
+
+        return list(unique.values())
+
+    def advise(self, script_path = PREDEFINED_SCRIPT, max_columns = MAX_COLUMNS, max_per_table = MAX_PER_TABLE):
+
+        """
+        Analyzes the saved and predefined queries and proposes indexes for them.
+
+        Returns
+        -------
+        tuple
+            The (title, query) pairs analyzed and the proposals from propose().
+
+        """
+
+        queries = self.queries(script_path)
+
+        return queries, propose(queries, self.schema(), max_columns, max_per_table)
+
+    def compare(self, proposals, queries, apply = False):
+
+        """
+        Runs EXPLAIN on each query without and with the proposed indexes (MySQL 8 only).
+
+        The proposals are created as INVISIBLE indexes on one connection, whose
+        session toggles the use_invisible_indexes optimizer switch between the
+        two EXPLAINs. Creating an index reads the whole table, so run this
+        outside busy hours on large tables.
+
+        Parameters
+        ----------
+        proposals : list of dict
+            Proposals from propose().
+
+        queries : list of tuple
+            (title, query) pairs to explain.
+
+        apply : bool, optional
+            Make the proposals the optimizer used visible and keep them
+            (default is False, drop every proposal afterwards).
+
+        Returns
+        -------
+        list of dict
+            One entry per query with "title", "before" and "after" plan
+            summaries from query_cost.summarize_plan(), "indexes" (proposals
+            the after plan reads) and "error" (None, or why the query could
+            not be explained).
+
+        Raises
+        ------
+        Exception
+            If the backend is not MySQL or an index cannot be created.
+
+        """
+
+        if self.db.dialect != "mysql":
+            raise Exception("value_db: compare: error: invisible indexes need MySQL 8")
+
+        names = {proposal["name"] for proposal in proposals}
+
+        results = []
+
+        created = []
+
+        with self.db.connection() as (conn, cursor):
+            try:
+                for proposal in proposals:
+                    cursor.execute(f"CREATE INDEX {proposal['name']} ON {proposal['table']} ({', '.join(proposal['columns'])}) INVISIBLE")
+                    created.append(proposal)
+
+                for title, query in queries:
+                    result = {"title": title, "before": None, "after": None, "indexes": [], "error": None}
+
+                    try:
+                        cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=off'")
+                        result["before"] = summarize_plan(self._explain(cursor, query))
+
+                        cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=on'")
+                        plan = self._explain(cursor, query)
+                        result["after"] = summarize_plan(plan)
+                        result["indexes"] = sorted(_used_indexes(plan) & names)
+                    except Exception as e:
+                        result["error"] = str(e)
+
+                    results.append(result)
+
+            finally:
+                cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=off'")
+
+                used = {name for result in results for name in result["indexes"]}
+
+                for proposal in created:
+                    if apply and proposal["name"] in used:
+                        cursor.execute(f"ALTER TABLE {proposal['table']} ALTER INDEX {proposal['name']} VISIBLE")
+                    else:
+                        cursor.execute(f"DROP INDEX {proposal['name']} ON {proposal['table']}")
+
+        return results
+
+    def _explain(self, cursor, query):
+
+        cursor.execute("EXPLAIN FORMAT=JSON " + query.strip().rstrip(";"))
+
+        row = cursor.fetchone()
+
+        cursor.fetchall()
+
+        return json.loads(row["EXPLAIN"])
+
+def report(proposals, results = None):
+
+    """
+    Formats proposals, and optionally their EXPLAIN comparison, as text.
+
+    """
+
+    lines = []
+
+    if not proposals:
+        lines.append("No indexes to propose; existing indexes serve every query.")
+
+    for proposal in proposals:
+        lines.append(f"CREATE INDEX {proposal['name']} ON {proposal['table']} ({', '.join(proposal['columns'])});")
+        lines.append(f"    -- serves {len(proposal['queries'])} quer{'y' if len(proposal['queries']) == 1 else 'ies'}: {'; '.join(proposal['queries'])}")
+
+        if proposal["supersedes"]:
+            lines.append(f"    -- extends {', '.join(proposal['supersedes'])}, which may be dropped")
+
+        if results and not any(proposal["name"] in result["indexes"] for result in results):
+            lines.append("    -- not chosen by the optimizer in any EXPLAIN")
+
+    if results:
+        lines.append("")
+        lines.append(f"{'query':60} {'cost before':>12} {'cost after':>12} {'rows before':>12} {'rows after':>12}  indexes used")
+
+        for result in results:
+            title = result["title"][:60]
+
+            if result["error"]:
+                lines.append(f"{title:60} error: {result['error']}")
+                continue
+
+            before, after = result["before"], result["after"]
+
+            lines.append(
+                f"{title:60} {before['query_cost']:>12.1f} {after['query_cost']:>12.1f} "
+                f"{before['rows_examined']:>12} {after['rows_examined']:>12}  {', '.join(result['indexes']) or '-'}"
+            )
+
+    return "\n".join(lines)
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Propose composite and covering indexes for the saved and predefined queries.")
+
+    parser.add_argument("--config", help = "path to config.ini")
+    parser.add_argument("--script", default = PREDEFINED_SCRIPT, help = "predefined query script to analyze with user_query")
+    parser.add_argument("--max-columns", type = int, default = MAX_COLUMNS, help = "most columns per proposed index")
+    parser.add_argument("--max-per-table", type = int, default = MAX_PER_TABLE, help = "most proposed indexes per table")
+    parser.add_argument("--no-explain", action = "store_true", help = "only propose indexes; do not compare EXPLAIN estimates")
+    parser.add_argument("--apply", action = "store_true", help = "keep the proposed indexes the optimizer used")
+
+    args = parser.parse_args(argv)
+
+    from backend import open_database
+
+    db = open_database(args.config)
+
+    try:
+        advisor = IndexAdvisor(db)
+
+        queries, proposals = advisor.advise(args.script, args.max_columns, args.max_per_table)
+
+        results = None
+
+        if proposals and not args.no_explain and db.dialect == "mysql":
+            results = advisor.compare(proposals, queries, apply = args.apply)
+
+        print(report(proposals, results))
+
+    finally:
+        db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,514 @@
+import configparser
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+
+from backend import default_config_path
+from import_metrics import DATE_FORMATS, convert_row, load_lookup_maps
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = {
+    "global_metric_value": ["metric_id", "metric_date"],
+    "plan_metric_value": ["metric_id", "plan_id", "metric_date"]
+}
+
+def load_ingest_config(config_file_path = None):
+
+    """
+    Reads the [ingest] section of the config file.
+
+    Parameters
+    ----------
+    config_file_path : str, optional
+        Path to the config file (default is backend.default_config_path()).
+
+    Returns
+    -------
+    dict
+        drop_dir, archive_dir (None to leave loaded files in place),
+        poll_interval, flush_size, flush_interval and log_file. Relative
+        directories are resolved against the config file's directory.
+
+    Raises
+    ------
+    ValueError
+        If a size or interval is not positive.
+
+    """
+
+    config_file_path = config_file_path or default_config_path()
+
+    config = configparser.ConfigParser()
+
+    config.read(config_file_path)
+
+    section = config["ingest"] if config.has_section("ingest") else config[config.default_section]
+
+    base = os.path.dirname(os.path.abspath(config_file_path))
+
+    def directory(key, fallback):
+
+        value = section.get(key, fallback = fallback).strip()
+
+        return os.path.join(base, value) if value else None
+
+    ingest_config = {
+        "drop_dir": directory("drop_dir", "drop"),
+        "archive_dir": directory("archive_dir", ""),
+        "poll_interval": section.getfloat("poll_interval", fallback = 5),
+        "flush_size": section.getint("flush_size", fallback = 1000),
+        "flush_interval": section.getfloat("flush_interval", fallback = 30),
+        "log_file": directory("log_file", "")
+    }
+
+    for key in ("poll_interval", "flush_size", "flush_interval"):
+        if ingest_config[key] <= 0:
+            raise ValueError(f"{key} must be positive.")
+
+    return ingest_config
+
+def content_hash(path):
+
+    """
+    Returns the SHA-256 hex digest of a file's content.
+
+    """
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as data:
+        for block in iter(lambda: data.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+class IngestDaemon:
+
+    """
+    A headless service that loads metric files dropped into a directory.
+
+    Each poll, CSV files in drop_dir whose size and modification time have
+    not changed since the previous poll (so files still being copied are
+    left alone) are identified by a SHA-256 hash of their content. Files
+    whose hash is already recorded in the ingested_file table are skipped,
+    whatever their name, so a restart or a re-dropped copy does not load a
+    file twice.
+
+    Rows are converted as by import_metrics.py: a file with a plan_name or
+    plan_id column feeds plan_metric_value, any other file feeds
+    global_metric_value. Valid rows are buffered and upserted on their
+    natural key in micro-batches, once flush_size rows are waiting or
+    flush_interval seconds after the first buffered row. A file's
+    checkpoint is written in the same transaction as the batch holding its
+    last rows. If the service stops partway through a file, the file is
+    read again on restart, and the upsert makes that harmless.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database to load into.
+
+    drop_dir : str
+        Directory watched for *.csv files.
+
+    archive_dir : str or None
+        Directory loaded files are moved to once checkpointed; None leaves them in place.
+
+    poll_interval : float
+        Seconds between scans of drop_dir.
+
+    flush_size : int
+        Buffered rows that trigger a flush.
+
+    flush_interval : float
+        Maximum seconds a buffered row waits before a flush.
+
+    Methods
+    -------
+    run(stop_event=None):
+        Polls and flushes until stop_event is set, then flushes what is left.
+
+    poll():
+        Scans drop_dir once and reads the files that are ready.
+
+    flush():
+        Writes buffered rows and checkpoints in one transaction.
+
+    """
+
+    def __init__(self, db, drop_dir, archive_dir = None, poll_interval = 5, flush_size = 1000, flush_interval = 30, date_formats = DATE_FORMATS):
+
+        """
+        Initialize the service and load the hashes of files already ingested.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database to load into.
+
+        drop_dir : str
+            Directory watched for *.csv files; created if missing.
+
+        archive_dir : str, optional
+            Directory loaded files are moved to (default is None, leave in place).
+
+        poll_interval : float, optional
+            Seconds between scans (default is 5).
+
+        flush_size : int, optional
+            Buffered rows that trigger a flush (default is 1000).
+
+        flush_interval : float, optional
+            Maximum seconds a buffered row waits (default is 30).
+
+        date_formats : sequence of str, optional
+            strptime formats accepted for metric_date (default is DATE_FORMATS).
+
+        """
+
+        self.db = db
+
+        self.drop_dir = drop_dir
+
+        self.archive_dir = archive_dir
+
+        self.poll_interval = poll_interval
+
+        self.flush_size = flush_size
+
+        self.flush_interval = flush_interval
+
+        self.date_formats = tuple(date_formats)
+
+        os.makedirs(drop_dir, exist_ok = True)
+
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok = True)
+
+        self.ingested = {row["content_hash"] for row in db.execute_query("SELECT content_hash FROM ingested_file")}
+
+        # Rows waiting to be flushed, by table, and the checkpoints of files whose
+        # rows are all buffered or flushed.
+
+        self.buffer = {table: [] for table in KEY_COLUMNS}
+
+        self.checkpoints = []
+
+        self.first_buffered = None
+
+        # File stats seen at the previous poll, and stats of files already
+        # identified as ingested, so unchanged files are not hashed again.
+
+        self.seen = {}
+
+        self.known = {}
+
+    def buffered(self):
+
+        return sum(len(rows) for rows in self.buffer.values())
+
+    def run(self, stop_event = None):
+
+        """
+        Polls and flushes until stop_event is set, then flushes what is left.
+
+        Parameters
+        ----------
+        stop_event : threading.Event, optional
+            Set to stop the service (default is None, run until interrupted).
+
+        """
+
+        stop_event = stop_event or threading.Event()
+
+        logger.info("Watching %s", self.drop_dir)
+
+        while not stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("Poll failed: %s", e)
+
+            if self.due():
+                self.flush()
+
+            stop_event.wait(self.poll_interval)
+
+        if self.checkpoints or self.buffered():
+            self.flush()
+
+        logger.info("Stopped")
+
+    def due(self):
+
+        if self.buffered() >= self.flush_size:
+            return True
+
+        return self.first_buffered is not None and time.monotonic() - self.first_buffered >= self.flush_interval
+
+    def poll(self):
+
+        """
+        Scans drop_dir once and reads every file that is ready.
+
+        Reading stops early while a full buffer cannot be flushed, e.g. while
+        the database is unreachable, so memory stays bounded. A file left
+        partly read this way is read again from the start at the next poll.
+
+        """
+
+        stats = {}
+
+        for entry in sorted(os.scandir(self.drop_dir), key = lambda entry: entry.name):
+            if entry.is_file() and entry.name.lower().endswith(".csv"):
+                stat = entry.stat()
+                stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        ready = [path for path, stat in stats.items() if self.seen.get(path) == stat and self.known.get(path) != stat]
+
+        self.seen = stats
+
+        self.known = {path: stat for path, stat in self.known.items() if path in stats}
+
+        if not ready:
+            return
+
+        lookups = {
+            "global_metric_value": load_lookup_maps(self.db, plan_level = False),
+            "plan_metric_value": load_lookup_maps(self.db)
+        }
+
+        for path in ready:
+            if self.buffered() >= self.flush_size and not self.flush():
+                return
+
+            digest = content_hash(path)
+
+            if digest in self.ingested or any(checkpoint["content_hash"] == digest for checkpoint in self.checkpoints):
+                logger.info("Skipping %s: already ingested", os.path.basename(path))
+                self.known[path] = stats[path]
+                self.archive(path)
+                continue
+
+            if not self.read_file(path, digest, lookups):
+                return
+
+            self.known[path] = stats[path]
+
+    def read_file(self, path, digest, lookups):
+
+        """
+        Buffers the valid rows of one file and queues its checkpoint.
+
+        Returns
+        -------
+        bool
+            False if reading stopped because a mid-file flush failed; the
+            file's checkpoint is not queued.
+
+        """
+
+        name = os.path.basename(path)
+
+        checkpoint = {"content_hash": digest, "file_name": name[:255], "target_table": None, "row_count": 0, "rejected_count": 0, "path": path}
+
+        rejects = []
+
+        # The file's rows are held apart from the buffer until the file has
+        # been read, so a read error discards them.
+
+        rows = []
+
+        try:
+            with open(path, newline = "", encoding = "utf-8-sig") as csv_file:
+                reader = csv.reader(csv_file)
+
+                header = {column.strip(): i for i, column in enumerate(next(reader, []))}
+
+                table = "plan_metric_value" if "plan_name" in header or "plan_id" in header else "global_metric_value"
+
+                missing = [
+                    col for col, alternative in (("metric_name", "metric_id"), ("metric_date", None), ("actual_value", None))
+                    if col not in header and alternative not in header
+                ]
+
+                if missing:
+                    logger.error("Skipping %s: missing columns: %s", name, ", ".join(missing))
+                    self.queue(checkpoint)
+                    return True
+
+                checkpoint["target_table"] = table
+
+                width = max(header.values()) + 1
+
+                for line, record in enumerate(reader, start = 2):
+                    if not record:
+                        continue
+
+                    record = record + [""] * (width - len(record))
+
+                    row, reason = convert_row(record, header, lookups[table], self.date_formats)
+
+                    if reason is not None:
+                        checkpoint["rejected_count"] += 1
+
+                        if len(rejects) < 10:
+                            rejects.append(f"line {line}: {reason}")
+
+                        continue
+
+                    checkpoint["row_count"] += 1
+
+                    rows.append(row)
+
+                    # Flush mid-file to bound memory; the checkpoint follows the last rows.
+                    # If the flush fails, the rows read so far stay buffered and
+                    # reading stops rather than growing the buffer.
+
+                    if self.buffered() + len(rows) >= self.flush_size:
+                        self.buffer_rows(table, rows)
+                        rows = []
+
+                        if not self.flush():
+                            logger.warning("Stopped reading %s until the buffer can be flushed", name)
+                            return False
+
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            # The rows read since the last flush are dropped. Rows flushed
+            # mid-file stay loaded, but without a checkpoint the file is read
+            # again once it changes or the service restarts; poll() still
+            # records its stat, so an unchanged file is not retried.
+
+            logger.error("Could not read %s: %s", name, e)
+            return True
+
+        self.buffer_rows(table, rows)
+
+        if rejects:
+            logger.warning("%s: %d rows rejected; %s", name, checkpoint["rejected_count"], "; ".join(rejects))
+
+        logger.info("Read %s: %d rows for %s", name, checkpoint["row_count"], checkpoint["target_table"])
+
+        self.queue(checkpoint)
+
+        return True
+
+    def buffer_rows(self, table, rows):
+
+        if not rows:
+            return
+
+        self.buffer[table].extend(rows)
+
+        if self.first_buffered is None:
+            self.first_buffered = time.monotonic()
+
+    def queue(self, checkpoint):
+
+        self.checkpoints.append(checkpoint)
+
+        if self.first_buffered is None:
+            self.first_buffered = time.monotonic()
+
+    def flush(self):
+
+        """
+        Upserts the buffered rows and records the queued checkpoints in one transaction.
+
+        On failure everything stays buffered and is retried at the next flush.
+
+        Returns
+        -------
+        bool
+            True if the flush was committed.
+
+        """
+
+        checkpoints = self.checkpoints
+
+        try:
+            with self.db.transaction():
+                for table, rows in self.buffer.items():
+                    if rows:
+                        self.db.upsert_many(table, rows, KEY_COLUMNS[table], batch_size = self.flush_size)
+
+                for checkpoint in checkpoints:
+                    self.db.insert("ingested_file", {key: value for key, value in checkpoint.items() if key != "path"})
+
+        except Exception as e:
+            logger.error("Flush of %d rows failed, will retry: %s", self.buffered(), e)
+            self.first_buffered = time.monotonic()
+            return False
+
+        logger.info("Flushed %d rows and %d files", self.buffered(), len(checkpoints))
+
+        self.buffer = {table: [] for table in KEY_COLUMNS}
+
+        self.checkpoints = []
+
+        self.first_buffered = None
+
+        for checkpoint in checkpoints:
+            self.ingested.add(checkpoint["content_hash"])
+            self.archive(checkpoint["path"])
+
+        return True
+
+    def archive(self, path):
+
+        """
+        Moves an ingested file to archive_dir, if one is configured.
+
+        """
+
+        if not self.archive_dir:
+            return
+
+        try:
+            shutil.move(path, os.path.join(self.archive_dir, os.path.basename(path)))
+        except OSError as e:
+            logger.warning("Could not archive %s: %s", os.path.basename(path), e)
+
+def main(config_file_path = None):
+
+    from backend import open_database
+
+    ingest_config = load_ingest_config(config_file_path)
+
+    logging.basicConfig(
+        filename = ingest_config["log_file"],
+        level = logging.INFO,
+        format = "%(asctime)s %(levelname)s %(message)s"
+    )
+
+    stop_event = threading.Event()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop_event.set())
+
+    db = open_database(config_file_path)
+
+    try:
+        IngestDaemon(
+            db,
+            ingest_config["drop_dir"],
+            archive_dir = ingest_config["archive_dir"],
+            poll_interval = ingest_config["poll_interval"],
+            flush_size = ingest_config["flush_size"],
+            flush_interval = ingest_config["flush_interval"]
+        ).run(stop_event)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+
+    # Usage: python ingest_daemon.py [config.ini]
+
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,537 @@
+import argparse
+import configparser
+import sys
+from datetime import date, datetime
+
+from backend import default_config_path
+
+# Metric value tables that may be partitioned by month of metric_date
+# (see sql/partition_metric_values.sql), and whether their values are per plan.
+
+TABLES = {
+    "global_metric_value": False,
+    "plan_metric_value": True
+}
+
+def load_partition_config(config_file_path = None):
+
+    """
+    Reads the [partitions] section of the config file.
+
+    Parameters
+    ----------
+    config_file_path : str, optional
+        Path to the config file (default is backend.default_config_path()).
+
+    Returns
+    -------
+    dict
+        months_ahead, retention_months (0 keeps every month) and
+        expire_action ("archive" or "drop").
+
+    Raises
+    ------
+    ValueError
+        If a setting is out of range.
+
+    """
+
+    config = configparser.ConfigParser()
+
+    config.read(config_file_path or default_config_path())
+
+    section = config["partitions"] if config.has_section("partitions") else config[config.default_section]
+
+    partition_config = {
+        "months_ahead": section.getint("months_ahead", fallback = 3),
+        "retention_months": section.getint("retention_months", fallback = 0),
+        "expire_action": section.get("expire_action", fallback = "archive").strip().lower()
+    }
+
+    if partition_config["months_ahead"] < 1:
+        raise ValueError("months_ahead must be positive.")
+
+    if partition_config["retention_months"] < 0:
+        raise ValueError("retention_months must not be negative.")
+
+    if partition_config["expire_action"] not in ("archive", "drop"):
+        raise ValueError("expire_action must be 'archive' or 'drop'.")
+
+    return partition_config
+
+def date_bounds(rows, column = "metric_date"):
+
+    """
+    Returns the earliest and latest date in rows, for a range predicate that prunes partitions.
+
+    Parameters
+    ----------
+    rows : list of dict
+        The rows.
+
+    column : str, optional
+        The date column (default is "metric_date").
+
+    Returns
+    -------
+    tuple or None
+        (earliest, latest), or None unless every row holds a date.
+
+    """
+
+    days = [row[column] for row in rows]
+
+    if not days or not all(isinstance(day, date) and not isinstance(day, datetime) for day in days):
+        return None
+
+    return min(days), max(days)
+
+def add_months(day, months):
+
+    """
+    Returns the first day of the month months after the month of day.
+
+    """
+
+    index = day.year * 12 + day.month - 1 + months
+
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+
+    """
+    Returns the name of the partition holding the values of a month.
+
+    """
+
+    return f"p{month:%Y%m}"
+
+class PartitionManager:
+
+    """
+    Maintains monthly RANGE COLUMNS (metric_date) partitions of the metric value tables.
+
+    Tables converted by sql/partition_metric_values.sql hold one partition
+    per month, named p<YYYY><MM>, and a catch-all pmax partition. extend()
+    pre-creates the partitions of the coming months by splitting pmax, which
+    is empty or nearly so, so values never pile up in it. expire() removes the
+    partitions of months older than the retention period, either by
+    exchanging each with an empty table that keeps its rows as an archive or
+    by dropping it. Either way a retention run touches only the expired
+    partitions instead of deleting rows across the table.
+
+    Running statistics and rollups of the removed values are recomputed from
+    the values that remain.
+
+    Attributes
+    ----------
+    db : Database
+        The MySQL database holding the metric value tables.
+
+    months_ahead : int
+        Months after the current one that have their own partition.
+
+    retention_months : int
+        Whole months kept before the current one; 0 keeps every month.
+
+    expire_action : str
+        "archive" to keep expired partitions as <table>_p<YYYY><MM> tables, or "drop".
+
+    Methods
+    -------
+    partitions(table):
+        Returns the partitions of a table.
+
+    extend(table, today=None):
+        Creates the monthly partitions up to months_ahead.
+
+    expired(table, today=None):
+        Returns the partitions older than the retention period.
+
+    expire(table, today=None):
+        Archives or drops the expired partitions.
+
+    maintain(today=None):
+        Extends and expires every partitioned metric value table.
+
+    """
+
+    PARTITIONS_SQL = """
+        SELECT
+            PARTITION_NAME AS partition_name,
+            PARTITION_DESCRIPTION AS bound,
+            TABLE_ROWS AS row_estimate
+        FROM
+            information_schema.PARTITIONS
+        WHERE
+            TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = %s
+            AND PARTITION_NAME IS NOT NULL
+        ORDER BY
+            PARTITION_ORDINAL_POSITION
+    """
+
+    def __init__(self, db, months_ahead = 3, retention_months = 0, expire_action = "archive"):
+
+        """
+        Initialize the manager.
+
+        Parameters
+        ----------
+        db : Database
+            The MySQL database holding the metric value tables.
+
+        months_ahead : int, optional
+            Months after the current one given their own partition (default is 3).
+
+        retention_months : int, optional
+            Whole months kept before the current one (default is 0, keep every month).
+
+        expire_action : str, optional
+            "archive" (default) or "drop".
+
+        Raises
+        ------
+        ValueError
+            If the database is not MySQL.
+
+        """
+
+        if db.dialect != "mysql":
+            raise ValueError("Partitioning is only supported on the MySQL backend.")
+
+        self.db = db
+
+        self.months_ahead = months_ahead
+
+        self.retention_months = retention_months
+
+        self.expire_action = expire_action
+
+    def partitions(self, table):
+
+        """
+        Returns the partitions of a table, in order.
+
+        Parameters
+        ----------
+        table : str
+            The table name.
+
+        Returns
+        -------
+        list of dict
+            name, bound (the date the partition's values are before, or None
+            for MAXVALUE) and row_estimate; empty if the table is not partitioned.
+
+        """
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(self.PARTITIONS_SQL, (table,))
+            rows = cursor.fetchall()
+
+        partitions = []
+
+        for row in rows:
+            bound = (row["bound"] or "").strip("'")
+
+            partitions.append({
+                "name": row["partition_name"],
+                "bound": None if bound.upper() == "MAXVALUE" else date.fromisoformat(bound[:10]),
+                "row_estimate": row["row_estimate"]
+            })
+
+        return partitions
+
+    def extend(self, table, today = None):
+
+        """
+        Creates monthly partitions through months_ahead months after the current one.
+
+        The first run on a table converted by partition_metric_values.sql
+        splits its single pmax partition into a partition per month from the
+        earliest stored value on.
+
+        Parameters
+        ----------
+        table : str
+            A partitioned metric value table.
+
+        today : date, optional
+            The current date (default is date.today()).
+
+        Returns
+        -------
+        list of str
+            The partitions created.
+
+        Raises
+        ------
+        Exception
+            If the table is not partitioned or the partitions cannot be changed.
+
+        """
+
+        partitions = self.partitions(table)
+
+        if not partitions:
+            raise Exception(f"value_db: extend: error: {table} is not partitioned; run partition_metric_values.sql first")
+
+        today = today or date.today()
+
+        through = add_months(today, self.months_ahead)
+
+        bounds = [partition["bound"] for partition in partitions if partition["bound"]]
+
+        if bounds:
+            month = max(bounds)
+        else:
+            with self.db.connection() as (conn, cursor):
+                cursor.execute(f"SELECT MIN(metric_date) AS first_date FROM {table}")
+                first_date = cursor.fetchone()["first_date"]
+
+            month = add_months(min(first_date, today) if first_date else today, 0)
+
+        months = []
+
+        while month <= through:
+            months.append(month)
+            month = add_months(month, 1)
+
+        if not months:
+            return []
+
+        definitions = ", ".join(f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1).isoformat()}')" for month in months)
+
+        last = partitions[-1]
+
+        if last["bound"] is None:
+            sql = f"ALTER TABLE {table} REORGANIZE PARTITION {last['name']} INTO ({definitions}, PARTITION {last['name']} VALUES LESS THAN (MAXVALUE))"
+        else:
+            sql = f"ALTER TABLE {table} ADD PARTITION ({definitions})"
+
+        try:
+            with self.db.connection() as (conn, cursor):
+                cursor.execute(sql)
+        except Exception as e:
+            raise Exception(f"value_db: extend: error: {e}")
+
+        return [partition_name(month) for month in months]
+
+    def expired(self, table, today = None):
+
+        """
+        Returns the partitions whose values are all older than the retention period.
+
+        Parameters
+        ----------
+        table : str
+            A partitioned metric value table.
+
+        today : date, optional
+            The current date (default is date.today()).
+
+        Returns
+        -------
+        list of dict
+            Partitions as returned by partitions(); empty when retention_months is 0.
+
+        """
+
+        if not self.retention_months:
+            return []
+
+        cutoff = add_months(today or date.today(), -self.retention_months)
+
+        return [partition for partition in self.partitions(table) if partition["bound"] and partition["bound"] <= cutoff]
+
+    def expire(self, table, today = None):
+
+        """
+        Archives or drops the partitions older than the retention period.
+
+        With expire_action "archive", each expired partition is exchanged
+        with a new empty table named <table>_<partition>, which keeps its rows
+        without copying them, and the emptied partition is dropped. With
+        "drop" the partitions and their rows are dropped.
+
+        Partitions are handled one at a time, and an archive table left by an
+        interrupted run is reused: an already emptied partition is only
+        dropped, and a partition is never exchanged into an archive that
+        holds rows.
+
+        Parameters
+        ----------
+        table : str
+            A partitioned metric value table.
+
+        today : date, optional
+            The current date (default is date.today()).
+
+        Returns
+        -------
+        list of str
+            The partitions removed, or the archive tables created.
+
+        Raises
+        ------
+        Exception
+            If a partition cannot be archived or dropped.
+
+        """
+
+        expired = [partition["name"] for partition in self.expired(table, today)]
+
+        if not expired:
+            return []
+
+        plan_column = "plan_id" if TABLES[table] else "0 AS plan_id"
+
+        keys = []
+
+        removed = []
+
+        try:
+            with self.db.connection() as (conn, cursor):
+                for name in expired:
+                    archive = f"{table}_{name}"
+
+                    # Each step is checked first, so a run that stopped partway
+                    # (e.g. after the exchange but before the drop) can be repeated.
+
+                    archived = self.expire_action == "archive" and self._exists(cursor, archive)
+
+                    sources = [f"{table} PARTITION ({name})"] + ([archive] if archived else [])
+
+                    # Every week and month bucket of the expired values starts on
+                    # one of their week_start or month_start dates.
+
+                    for source in sources:
+                        cursor.execute(
+                            f"SELECT DISTINCT metric_id, {plan_column}, week_start AS metric_date FROM {source} WHERE metric_id IS NOT NULL "
+                            f"UNION SELECT DISTINCT metric_id, {plan_column}, month_start AS metric_date FROM {source} WHERE metric_id IS NOT NULL"
+                        )
+
+                        keys.extend(cursor.fetchall())
+
+                    if self.expire_action == "archive":
+                        if not archived:
+                            cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+
+                        cursor.execute(self.PARTITIONS_SQL, (archive,))
+
+                        if cursor.fetchall():
+                            cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+
+                        # Exchanging a partition emptied by an earlier run would
+                        # swap the archived rows back into the table.
+
+                        pending = self._count(cursor, f"{table} PARTITION ({name})")
+
+                        if pending and self._count(cursor, archive):
+                            raise Exception(f"{archive} already holds rows and partition {name} is not empty")
+
+                        if pending:
+                            cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+
+                    cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+
+                    removed.append(archive if self.expire_action == "archive" else name)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+
+        # The trackers are refreshed for the partitions removed before an error too.
+
+        if removed:
+            self.db.table_changed(table)
+
+            if keys and self.db.value_trackers:
+                with self.db.transaction():
+                    with self.db.connection() as (conn, cursor):
+                        for tracker in self.db.value_trackers:
+                            tracker.refresh(cursor, table, tracker.keys(table, keys))
+
+        if error is not None:
+            raise Exception(f"value_db: expire: error: {error}")
+
+        return removed
+
+    def _exists(self, cursor, table):
+
+        cursor.execute("SELECT COUNT(*) AS n FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+
+        return cursor.fetchone()["n"] > 0
+
+    def _count(self, cursor, source):
+
+        cursor.execute(f"SELECT COUNT(*) AS n FROM {source}")
+
+        return cursor.fetchone()["n"]
+
+    def maintain(self, today = None):
+
+        """
+        Extends and expires the partitions of every partitioned metric value table.
+
+        Returns
+        -------
+        dict
+            Table names mapped to the "created" and "expired" lists from extend() and expire().
+
+        """
+
+        report = {}
+
+        for table in TABLES:
+            if not self.partitions(table):
+                continue
+
+            report[table] = {
+                "created": self.extend(table, today),
+                "expired": self.expire(table, today)
+            }
+
+        return report
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Maintain the monthly partitions of the metric value tables.")
+
+    parser.add_argument("command", choices = ("maintain", "list"), help = "maintain: create coming and expire old partitions; list: show partitions")
+    parser.add_argument("--config", help = "path to config.ini")
+
+    args = parser.parse_args(argv)
+
+    from backend import open_database
+
+    partition_config = load_partition_config(args.config)
+
+    db = open_database(args.config)
+
+    try:
+        manager = PartitionManager(db, **partition_config)
+
+        if args.command == "list":
+            for table in TABLES:
+                partitions = manager.partitions(table)
+
+                if not partitions:
+                    print(f"{table}: not partitioned")
+
+                for partition in partitions:
+                    bound = partition["bound"].isoformat() if partition["bound"] else "MAXVALUE"
+                    print(f"{table} {partition['name']}: before {bound}, about {partition['row_estimate']} rows")
+        else:
+            for table, result in manager.maintain().items():
+                print(f"{table}: {len(result['created'])} partitions created, {len(result['expired'])} expired"
+                      f"{' (' + ', '.join(result['expired']) + ')' if result['expired'] else ''}")
+
+    finally:
+        db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+import re
+import threading
+import time
+
+# Quoted literals and identifiers, kept as written, or a run of whitespace (group 1).
+
+LITERAL_OR_SPACE = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`|(\s+)""", re.S)
+
+class QueryCache:
+
+    """
+    A size- and time-bounded cache of SELECT query results.
+
+    Results are keyed by normalized query text and remember which tables the
+    query reads. Writes through the Database CRUD helpers call
+    invalidate_table(), which drops every entry that reads the written table.
+    Entries that read a view, whose base tables are not known, are dropped on
+    any write. The least recently used entry is evicted when the cache is full,
+    and entries older than the time to live are treated as missing.
+
+    Attributes
+    ----------
+    max_entries : int
+        Maximum number of cached results; 0 disables the cache.
+
+    ttl : float
+        Seconds a result stays valid; 0 or less disables expiry.
+
+    Methods
+    -------
+    normalize(query_str):
+        Returns the cache key for a query.
+
+    tables_read(query_str, table_names):
+        Returns the known table names referenced by a query.
+
+    get(query_str):
+        Returns a cached result, or None.
+
+    put(query_str, result, tables, version):
+        Stores a result unless a write happened since version was taken.
+
+    invalidate_table(table):
+        Drops every entry that reads the given table.
+
+    clear():
+        Drops every entry.
+
+    """
+
+    # Wildcard dependency for queries reading views or unknown objects.
+
+    ANY_TABLE = "*"
+
+    def __init__(self, max_entries = 64, ttl = 600):
+
+        """
+        Initialize an empty cache.
+
+        Parameters
+        ----------
+        max_entries : int, optional
+            Maximum number of cached results (default is 64).
+
+        ttl : float, optional
+            Seconds a result stays valid (default is 600).
+
+        """
+
+        self.max_entries = max_entries
+
+        self.ttl = ttl
+
+        self.entries = OrderedDict()
+
+        self.version = 0
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query_str):
+
+        """
+        Returns the cache key for a query: whitespace collapsed outside quoted literals, trailing semicolons removed.
+
+        Parameters
+        ----------
+        query_str : str
+            The query text.
+
+        Returns
+        -------
+        str
+            The normalized query text.
+
+        """
+
+        text = LITERAL_OR_SPACE.sub(lambda match: " " if match.group(1) else match.group(0), query_str)
+
+        return text.strip().rstrip(";").strip()
+
+    @staticmethod
+    def tables_read(query_str, table_names):
+
+        """
+        Returns the known table names referenced anywhere in a query.
+
+        Matching on identifiers rather than parsing FROM clauses errs on the
+        side of invalidating too often, never too rarely.
+
+        Parameters
+        ----------
+        query_str : str
+            The query text.
+
+        table_names : iterable of str
+            The table and view names in the schema.
+
+        Returns
+        -------
+        set
+            The referenced table names.
+
+        """
+
+        identifiers = set(re.findall(r"[a-z_][a-z0-9_$]*", query_str.lower()))
+
+        return identifiers & {name.lower() for name in table_names}
+
+    def get(self, query_str):
+
+        """
+        Returns the cached result for a query, or None if absent or expired.
+
+        Parameters
+        ----------
+        query_str : str
+            The query text.
+
+        Returns
+        -------
+        list or None
+            A copy of the cached row list.
+
+        """
+
+        key = self.normalize(query_str)
+
+        with self._lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            result, tables, stored_at = entry
+
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return list(result)
+
+    def put(self, query_str, result, tables, version):
+
+        """
+        Stores a query result.
+
+        Parameters
+        ----------
+        query_str : str
+            The query text.
+
+        result : list
+            The rows returned by the query.
+
+        tables : iterable of str
+            The tables the query reads; may include ANY_TABLE.
+
+        version : int
+            The cache version read before the query ran; if any table was
+            invalidated since, the result may be stale and is not stored.
+
+        """
+
+        if self.max_entries <= 0:
+            return
+
+        key = self.normalize(query_str)
+
+        with self._lock:
+            if version != self.version:
+                return
+
+            self.entries[key] = (list(result), frozenset(tables), time.monotonic())
+
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+    def invalidate_table(self, table):
+
+        """
+        Drops every cached result that reads the given table.
+
+        Parameters
+        ----------
+        table : str
+            The table that was written.
+
+        """
+
+        table = table.lower()
+
+        with self._lock:
+            self.version += 1
+
+            stale = [key for key, (_, tables, _) in self.entries.items() if table in tables or self.ANY_TABLE in tables]
+
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+
+        """
+        Drops every cached result.
+
+        """
+
+        with self._lock:
+            self.version += 1
+
+            self.entries.clear()
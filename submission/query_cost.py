@@ -0,0 +1,102 @@
+class QueryCostError(Exception):
+
+    """
+    Raised when a query's EXPLAIN estimate is over the configured budget.
+
+    Attributes
+    ----------
+    estimate : dict
+        The plan summary returned by summarize_plan().
+
+    reasons : list of str
+        Human-readable reasons the query was stopped.
+
+    confirmable : bool
+        True if the user may confirm and run the query anyway; False if the
+        query is rejected outright.
+
+    """
+
+    def __init__(self, estimate, reasons, confirmable = True):
+
+        self.estimate = estimate
+
+        self.reasons = reasons
+
+        self.confirmable = confirmable
+
+        super().__init__("Query exceeds the cost budget:\n\n" + "\n".join(f"- {reason}" for reason in reasons))
+
+def summarize_plan(plan):
+
+    """
+    Summarizes a MySQL EXPLAIN FORMAT=JSON plan.
+
+    Rows examined are estimated by walking every query block: tables joined in
+    a nested loop examine rows_examined_per_scan once for each row produced by
+    the tables before them, and standalone table accesses (subqueries, derived
+    tables, union members) add their own scans.
+
+    Parameters
+    ----------
+    plan : dict
+        The decoded JSON document returned by EXPLAIN FORMAT=JSON.
+
+    Returns
+    -------
+    dict
+        A summary with keys "query_cost" (float), "rows_examined" (int),
+        "full_scans" (list of table names accessed with type ALL),
+        "filesort" (bool) and "temporary" (bool).
+
+    """
+
+    summary = {
+        "query_cost": 0.0,
+        "rows_examined": 0,
+        "full_scans": [],
+        "filesort": False,
+        "temporary": False
+    }
+
+    cost_info = plan.get("query_block", {}).get("cost_info", {})
+
+    summary["query_cost"] = float(cost_info.get("query_cost", 0) or 0)
+
+    def scan(table):
+        if table.get("access_type") == "ALL":
+            summary["full_scans"].append(table.get("table_name", "?"))
+        return float(table.get("rows_examined_per_scan", 0) or 0)
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+
+        if not isinstance(node, dict):
+            return
+
+        if node.get("using_filesort"):
+            summary["filesort"] = True
+
+        if node.get("using_temporary_table"):
+            summary["temporary"] = True
+
+        for key, value in node.items():
+            if key == "nested_loop":
+                produced = 1.0
+                for step in value:
+                    table = step.get("table", {})
+                    summary["rows_examined"] += int(produced * scan(table))
+                    produced = float(table.get("rows_produced_per_join", produced) or 0)
+                    walk(table)
+            elif key == "table":
+                summary["rows_examined"] += int(scan(value))
+                walk(value)
+            else:
+                walk(value)
+
+    walk(plan)
+
+    return summary
@@ -0,0 +1,589 @@
+import math
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from anomaly import PLAN_LEVEL
+
+# Bucket grains and the generated column holding each row's bucket.
+
+GRAINS = {
+    "week": "week_start",
+    "month": "month_start"
+}
+
+COLUMNS = (
+    "metric_id", "plan_id", "grain", "bucket", "value_count", "value_sum", "value_squares",
+    "min_value", "max_value", "first_date", "first_value", "last_date", "last_value"
+)
+
+# Functions and new-row references used by the delta upsert, and the prefix of
+# a row-value IN list.
+
+DIALECTS = {
+    "mysql": {
+        "least": "LEAST",
+        "greatest": "GREATEST",
+        "new": "VALUES({col})",
+        "conflict": "ON DUPLICATE KEY UPDATE",
+        "rows": ""
+    },
+    "sqlite": {
+        "least": "MIN",
+        "greatest": "MAX",
+        "new": "excluded.{col}",
+        "conflict": "ON CONFLICT (metric_id, plan_id, grain, bucket) DO UPDATE SET",
+        "rows": "VALUES "
+    }
+}
+
+KEY_BATCH = 500
+
+def bucket(grain, day):
+
+    """
+    Returns the first day of the week (Monday) or month holding day.
+
+    Parameters
+    ----------
+    grain : str
+        "week" or "month".
+
+    day : date or str
+        The metric date; ISO strings are accepted.
+
+    Returns
+    -------
+    date
+        The bucket start, matching the week_start and month_start columns.
+
+    """
+
+    day = _to_date(day)
+
+    if grain == "week":
+        return day - timedelta(days = day.weekday())
+
+    return day.replace(day = 1)
+
+def bucket_end(grain, start):
+
+    """
+    Returns the first day after the week or month bucket starting on start.
+
+    """
+
+    if grain == "week":
+        return start + timedelta(days = 7)
+
+    return (start.replace(day = 28) + timedelta(days = 4)).replace(day = 1)
+
+class MetricRollup:
+
+    """
+    Weekly and monthly rollups of metric values, maintained as values are written.
+
+    The metric_rollup table holds one row per metric, plan (0 for global
+    metric values), grain and bucket, with the count, sum, sum of squares,
+    minimum, maximum and first and last values of the bucket. Dashboards and
+    trend queries read these rows instead of re-aggregating raw values, so
+    their cost follows the number of buckets.
+
+    Inserted rows are folded into their buckets with one additive upsert per
+    batch, in the transaction of the write. Rows that are replaced, updated
+    or deleted may have been a bucket's minimum, maximum, first or last
+    value, so their buckets are recomputed from the stored values instead.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The backend whose dialect and placeholder the statements use.
+
+    Methods
+    -------
+    tracks(table, row):
+        Returns whether rows shaped like row can update the rollups directly.
+
+    keys(table, rows):
+        Returns the rollup keys of rows.
+
+    record(cursor, table, added, removed=()):
+        Folds rows written to a metric value table into their buckets.
+
+    affected(cursor, table, conditions):
+        Returns the rollup keys of the rows matching conditions.
+
+    refresh(cursor, table, keys=None):
+        Recomputes buckets from the stored values.
+
+    series(metric_id, grain="month", plan_id=0, start=None, end=None):
+        Returns a metric's buckets with averages and standard deviations.
+
+    summary(metric_id, plan_id=0, start=None, end=None):
+        Returns a metric's count, mean, deviation and range from its monthly buckets.
+
+    """
+
+    def __init__(self, db):
+
+        """
+        Initialize the rollups.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The backend that owns the metric_rollup table.
+
+        """
+
+        self.db = db
+
+        dialect = DIALECTS[db.dialect]
+
+        new = lambda col: dialect["new"].format(col = col)
+
+        updates = [
+            f"value_count = value_count + {new('value_count')}",
+            f"value_sum = value_sum + {new('value_sum')}",
+            f"value_squares = value_squares + {new('value_squares')}",
+            f"min_value = {dialect['least']}(min_value, {new('min_value')})",
+            f"max_value = {dialect['greatest']}(max_value, {new('max_value')})",
+
+            # MySQL assigns left to right, so each value is set before its date.
+
+            f"first_value = CASE WHEN {new('first_date')} < first_date THEN {new('first_value')} ELSE first_value END",
+            f"first_date = {dialect['least']}(first_date, {new('first_date')})",
+            f"last_value = CASE WHEN {new('last_date')} > last_date THEN {new('last_value')} ELSE last_value END",
+            f"last_date = {dialect['greatest']}(last_date, {new('last_date')})"
+        ]
+
+        insert = f"INSERT INTO metric_rollup ({', '.join(COLUMNS)}) VALUES ({', '.join([db.placeholder] * len(COLUMNS))})"
+
+        self.insert_sql = insert
+
+        self.upsert_sql = f"{insert} {dialect['conflict']} {', '.join(updates)}"
+
+    def tracks(self, table, row):
+
+        """
+        Returns whether rows shaped like row can update the rollups directly.
+
+        """
+
+        if table not in PLAN_LEVEL:
+            return False
+
+        return all(col in row for col in ("metric_id", "metric_date", "actual_value") + (("plan_id",) if PLAN_LEVEL[table] else ()))
+
+    def keys(self, table, rows):
+
+        """
+        Returns the rollup keys of rows of a metric value table.
+
+        Parameters
+        ----------
+        table : str
+            The metric value table.
+
+        rows : iterable of dict
+            Rows with metric_id, metric_date and, for plan values, plan_id.
+
+        Returns
+        -------
+        set of tuple
+            (metric_id, plan_id, grain, bucket) keys, for every grain.
+
+        """
+
+        keys = set()
+
+        for row in rows:
+            metric_id = row["metric_id"]
+
+            plan_id = row["plan_id"] if PLAN_LEVEL[table] else 0
+
+            if metric_id is None or plan_id is None or row["metric_date"] in (None, ""):
+                continue
+
+            for grain in GRAINS:
+                keys.add((metric_id, plan_id, grain, bucket(grain, row["metric_date"])))
+
+        return keys
+
+    def record(self, cursor, table, added, removed = ()):
+
+        """
+        Folds rows written to a metric value table into their buckets.
+
+        Parameters
+        ----------
+        cursor : cursor
+            The dictionary cursor that wrote the rows, inside their transaction.
+
+        table : str
+            The table written; other tables are ignored.
+
+        added : list of dict
+            The rows written.
+
+        removed : list of dict, optional
+            The stored rows that added rows replaced, for upserts.
+
+        """
+
+        if not added or not self.tracks(table, added[0]):
+            return
+
+        stale = self.keys(table, removed)
+
+        totals = _aggregate(
+            (key, row["metric_date"], row["actual_value"])
+            for row in added
+            for key in self.keys(table, [row])
+            if key not in stale
+        )
+
+        if totals:
+            cursor.executemany(self.upsert_sql, [key + tuple(values) for key, values in totals.items()])
+
+        self.refresh(cursor, table, stale)
+
+    def affected(self, cursor, table, conditions):
+
+        """
+        Returns the rollup keys of the rows of a metric value table matching conditions.
+
+        Parameters
+        ----------
+        cursor : cursor
+            A dictionary cursor.
+
+        table : str
+            The table about to be updated or deleted from.
+
+        conditions : dict
+            Column names and values selecting the rows.
+
+        Returns
+        -------
+        set of tuple
+            (metric_id, plan_id, grain, bucket) keys; empty for other tables.
+
+        """
+
+        if table not in PLAN_LEVEL:
+            return set()
+
+        plan_column = "plan_id" if PLAN_LEVEL[table] else "0 AS plan_id"
+
+        where = " AND ".join(f"{col} = {self.db.placeholder}" for col in conditions)
+
+        cursor.execute(f"SELECT metric_id, {plan_column}, metric_date FROM {table} WHERE {where}", tuple(conditions.values()))
+
+        return self.keys(table, cursor.fetchall())
+
+    def refresh(self, cursor, table, keys = None):
+
+        """
+        Recomputes buckets of a metric value table from its stored values.
+
+        Parameters
+        ----------
+        cursor : cursor
+            A dictionary cursor, inside the transaction that changed the values.
+
+        table : str
+            The metric value table.
+
+        keys : iterable of tuple, optional
+            (metric_id, plan_id, grain, bucket) keys to recompute (default is
+            None, every bucket of the table).
+
+        """
+
+        if table not in PLAN_LEVEL or keys is not None and not keys:
+            return
+
+        plan_level = PLAN_LEVEL[table]
+
+        plan_column = "plan_id" if plan_level else "0 AS plan_id"
+
+        ph = self.db.placeholder
+
+        if keys is None:
+            cursor.execute(f"DELETE FROM metric_rollup WHERE plan_id {'<>' if plan_level else '='} 0")
+
+            cursor.execute(f"SELECT metric_id, {plan_column}, metric_date, actual_value FROM {table} WHERE metric_id IS NOT NULL")
+
+            totals = {}
+
+            while True:
+                rows = cursor.fetchmany(10000)
+
+                if not rows:
+                    break
+
+                _aggregate(((key, row["metric_date"], row["actual_value"]) for row in rows for key in self.keys(table, [row])), totals)
+
+            self._insert(cursor, totals)
+
+            return
+
+        keys = sorted(keys, key = repr)
+
+        totals = {}
+
+        for grain, column in GRAINS.items():
+            grain_keys = [key for key in keys if key[2] == grain]
+
+            for start in range(0, len(grain_keys), KEY_BATCH):
+                batch = grain_keys[start:start + KEY_BATCH]
+
+                if plan_level:
+                    match = f"(metric_id, plan_id, {column})"
+                    params = tuple(value for key in batch for value in (key[0], key[1], key[3]))
+                    width = 3
+                else:
+                    match = f"(metric_id, {column})"
+                    params = tuple(value for key in batch for value in (key[0], key[3]))
+                    width = 2
+
+                rows_list = DIALECTS[self.db.dialect]["rows"] + ", ".join(["(" + ", ".join([ph] * width) + ")"] * len(batch))
+
+                # The date range lets a table partitioned by metric_date read
+                # only the partitions holding the buckets.
+
+                buckets = [_to_date(key[3]) for key in batch]
+
+                cursor.execute(
+                    f"SELECT metric_id, {plan_column}, metric_date, actual_value FROM {table} "
+                    f"WHERE {match} IN ({rows_list}) AND metric_date >= {ph} AND metric_date < {ph}",
+                    params + (min(buckets), bucket_end(grain, max(buckets)))
+                )
+
+                _aggregate(
+                    (((row["metric_id"], row["plan_id"], grain, bucket(grain, row["metric_date"])), row["metric_date"], row["actual_value"]) for row in cursor.fetchall()),
+                    totals
+                )
+
+            # Buckets without values left are removed.
+
+            for start in range(0, len(grain_keys), KEY_BATCH):
+                batch = grain_keys[start:start + KEY_BATCH]
+
+                rows_list = DIALECTS[self.db.dialect]["rows"] + ", ".join([f"({ph}, {ph}, {ph}, {ph})"] * len(batch))
+
+                cursor.execute(
+                    f"DELETE FROM metric_rollup WHERE (metric_id, plan_id, grain, bucket) IN ({rows_list})",
+                    tuple(value for key in batch for value in key)
+                )
+
+        self._insert(cursor, totals)
+
+    def _insert(self, cursor, totals):
+
+        rows = [key + tuple(values) for key, values in totals.items()]
+
+        for start in range(0, len(rows), KEY_BATCH):
+            cursor.executemany(self.insert_sql, rows[start:start + KEY_BATCH])
+
+    def _buckets(self, metric_id, grain, plan_id, start, end):
+
+        if grain not in GRAINS:
+            raise ValueError("grain must be 'week' or 'month'.")
+
+        ph = self.db.placeholder
+
+        sql = f"SELECT * FROM metric_rollup WHERE metric_id = {ph} AND plan_id = {ph} AND grain = {ph}"
+
+        params = [metric_id, plan_id, grain]
+
+        if start is not None:
+            sql += f" AND bucket >= {ph}"
+            params.append(bucket(grain, start))
+
+        if end is not None:
+            sql += f" AND bucket <= {ph}"
+            params.append(bucket(grain, end))
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(sql + " ORDER BY bucket", tuple(params))
+            return cursor.fetchall()
+
+    def series(self, metric_id, grain = "month", plan_id = 0, start = None, end = None):
+
+        """
+        Returns a metric's buckets with their averages and standard deviations.
+
+        Parameters
+        ----------
+        metric_id : int
+            The metric.
+
+        grain : str, optional
+            "week" or "month" (default is "month").
+
+        plan_id : int, optional
+            The plan, or 0 for global metric values (default is 0).
+
+        start : date, optional
+            Include buckets from the one holding start (default is None, no lower bound).
+
+        end : date, optional
+            Include buckets up to the one holding end (default is None, no upper bound).
+
+        Returns
+        -------
+        list of dict
+            One dictionary per bucket, in date order, with bucket, value_count,
+            avg_value, stddev_value (sample; None for a single value),
+            min_value, max_value, first_value and last_value.
+
+        Raises
+        ------
+        ValueError
+            If grain is not "week" or "month".
+
+        """
+
+        return [
+            {
+                "bucket": row["bucket"],
+                "value_count": row["value_count"],
+                "avg_value": _mean(row["value_sum"], row["value_count"]),
+                "stddev_value": _stddev(row["value_count"], row["value_sum"], row["value_squares"]),
+                "min_value": row["min_value"],
+                "max_value": row["max_value"],
+                "first_value": row["first_value"],
+                "last_value": row["last_value"]
+            }
+            for row in self._buckets(metric_id, grain, plan_id, start, end)
+        ]
+
+    def summary(self, metric_id, plan_id = 0, start = None, end = None):
+
+        """
+        Returns a metric's count, mean, sample deviation and range from its monthly buckets.
+
+        Parameters
+        ----------
+        metric_id : int
+            The metric.
+
+        plan_id : int, optional
+            The plan, or 0 for global metric values (default is 0).
+
+        start : date, optional
+            Include months from the one holding start (default is None, no lower bound).
+
+        end : date, optional
+            Include months up to the one holding end (default is None, no upper bound).
+
+        Returns
+        -------
+        dict
+            value_count, avg_value, stddev_value, min_value, max_value,
+            first_value and last_value; all None but value_count when there
+            are no values.
+
+        """
+
+        buckets = self._buckets(metric_id, "month", plan_id, start, end)
+
+        count = sum(row["value_count"] for row in buckets)
+
+        if not count:
+            return {"value_count": 0, "avg_value": None, "stddev_value": None, "min_value": None, "max_value": None, "first_value": None, "last_value": None}
+
+        total = sum(Decimal(str(row["value_sum"])) for row in buckets)
+
+        squares = sum(Decimal(str(row["value_squares"])) for row in buckets)
+
+        return {
+            "value_count": count,
+            "avg_value": _mean(total, count),
+            "stddev_value": _stddev(count, total, squares),
+            "min_value": min(row["min_value"] for row in buckets),
+            "max_value": max(row["max_value"] for row in buckets),
+            "first_value": buckets[0]["first_value"],
+            "last_value": buckets[-1]["last_value"]
+        }
+
+def _to_date(day):
+
+    if isinstance(day, datetime):
+        return day.date()
+
+    if isinstance(day, date):
+        return day
+
+    return date.fromisoformat(str(day)[:10])
+
+def _aggregate(values, totals = None):
+
+    """
+    Folds (key, metric_date, actual_value) triples into per-key bucket totals.
+
+    """
+
+    totals = {} if totals is None else totals
+
+    for key, day, value in values:
+        day = _to_date(day)
+
+        value = Decimal(str(value))
+
+        current = totals.get(key)
+
+        if current is None:
+            totals[key] = [1, value, float(value * value), value, value, day, value, day, value]
+            continue
+
+        current[0] += 1
+        current[1] += value
+        current[2] += float(value * value)
+        current[3] = min(current[3], value)
+        current[4] = max(current[4], value)
+
+        if day < current[5]:
+            current[5], current[6] = day, value
+
+        if day > current[7]:
+            current[7], current[8] = day, value
+
+    return totals
+
+def _mean(total, count):
+
+    return float(Decimal(str(total)) / count) if count else None
+
+def _stddev(count, total, squares):
+
+    if count < 2:
+        return None
+
+    total = float(total)
+
+    return math.sqrt(max(float(squares) - total * total / count, 0.0) / (count - 1))
+
+if __name__ == "__main__":
+
+    # Usage: python rollup.py rebuild
+    # Recomputes metric_rollup from all stored metric values, e.g. after upgrading a database.
+
+    from backend import open_database
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python rollup.py rebuild")
+
+    db = open_database()
+
+    try:
+        with db.transaction():
+            with db.connection() as (conn, cursor):
+                for table in PLAN_LEVEL:
+                    db.metric_rollup.refresh(cursor, table)
+    finally:
+        db.close()
+
+    print("metric_rollup rebuilt")
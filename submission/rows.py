@@ -0,0 +1,153 @@
+from functools import lru_cache
+
+class Row(tuple):
+
+    """
+    A compact, read-only result row: a tuple with access by column name.
+
+    Every row of a result shares one generated subclass that holds the column
+    header and a name-to-index map, so a row costs no more than a plain tuple
+    and no per-row dictionary or key strings are built. Use row_class() to
+    get the subclass for a header and fetch_rows() to read a cursor into rows.
+
+    Values are read by position (row[0]), by name (row["metric_id"]) or as
+    attributes (row.metric_id) when the name is a valid identifier that does
+    not clash with a tuple or dict method.
+
+    For existing callers written against dictionary rows, keys(), values(),
+    items() and get() behave like their dict counterparts, so dict(row) and
+    csv.DictWriter also work, and "in" tests the column names. Note that, as
+    for any tuple, iterating a row yields its values, not the column names.
+
+    Rows pickle like the dictionaries they replace: each is rebuilt through
+    row_class() from its column names and values.
+
+    Methods
+    -------
+    keys():
+        Returns the column names.
+
+    values():
+        Returns the values.
+
+    items():
+        Returns (column, value) pairs.
+
+    get(column, default=None):
+        Returns a value by name, or default if the column is absent.
+
+    _asdict():
+        Returns the row as a dictionary.
+
+    """
+
+    __slots__ = ()
+
+    _fields = ()
+
+    _index = {}
+
+    _keys = {}.keys()
+
+    def __getitem__(self, key):
+
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, column):
+
+        return column in self._index
+
+    def __reduce__(self):
+
+        return _rebuild, (self._fields, tuple(self))
+
+    def __repr__(self):
+
+        return "Row(" + ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self)) + ")"
+
+    def keys(self):
+
+        return self._keys
+
+    def values(self):
+
+        return tuple(self)
+
+    def items(self):
+
+        return list(zip(self._fields, self))
+
+    def get(self, column, default = None):
+
+        index = self._index.get(column)
+
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def _asdict(self):
+
+        return dict(zip(self._fields, self))
+
+@lru_cache(maxsize = 256)
+def row_class(columns):
+
+    """
+    Returns the shared Row subclass for a column header.
+
+    Parameters
+    ----------
+    columns : tuple of str
+        The column names in select-list order.
+
+    Returns
+    -------
+    type
+        A Row subclass whose instances take one value per column.
+
+    """
+
+    columns = tuple(columns)
+
+    return type("Row", (Row,), {
+        "__slots__": (),
+        "_fields": columns,
+        "_index": {name: i for i, name in enumerate(columns)},
+        "_keys": dict.fromkeys(columns).keys()
+    })
+
+def _rebuild(columns, values):
+
+    return row_class(columns)(values)
+
+def fetch_rows(cursor):
+
+    """
+    Reads every remaining row of an executed tuple cursor as Row objects.
+
+    Parameters
+    ----------
+    cursor : cursor
+        A DB-API cursor that returns tuples and has run a statement.
+
+    Returns
+    -------
+    list
+        A list of Row objects sharing one column header.
+
+    """
+
+    if cursor.description is None:
+        return []
+
+    cls = row_class(tuple(d[0] for d in cursor.description))
+
+    return [cls(row) for row in cursor.fetchall()]
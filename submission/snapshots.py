@@ -0,0 +1,698 @@
+import argparse
+import configparser
+import hashlib
+import json
+import sys
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from backend import default_config_path
+from query_cache import QueryCache
+from rows import row_class
+
+# Rows inserted per executemany when a snapshot is written.
+
+WRITE_BATCH = 1000
+
+def open_snapshots(db, config_file_path = None):
+
+    """
+    Creates the snapshot manager, unless the schema has no query_snapshot table.
+
+    Parameters
+    ----------
+    db : StorageBackend
+        The database holding user_query and the snapshot tables.
+
+    config_file_path : str, optional
+        Path to the config file (default is backend.default_config_path()).
+
+    Returns
+    -------
+    SnapshotManager or None
+        The manager with its snapshot definitions loaded, or None when the
+        snapshot tables are missing.
+
+    """
+
+    config = configparser.ConfigParser()
+
+    config.read(config_file_path or default_config_path())
+
+    section = config["value"] if config.has_section("value") else config[config.default_section]
+
+    manager = SnapshotManager(db,
+                              default_interval = section.getint("snapshot_interval", fallback = 3600),
+                              check_interval = section.getint("snapshot_check_interval", fallback = 60))
+
+    try:
+        manager.load()
+    except Exception:
+        return None
+
+    return manager
+
+def _encode(value):
+
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors = "replace")
+
+    return str(value)
+
+def _decode(obj):
+
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+
+    return obj
+
+def _timestamp(value):
+
+    # SQLite returns DATETIME columns as text.
+
+    if value is None or isinstance(value, datetime):
+        return value
+
+    return datetime.fromisoformat(str(value))
+
+class SnapshotManager:
+
+    """
+    Materialized snapshots of saved queries, served instead of running the query live.
+
+    A saved query from user_query is materialized by adding a row to
+    query_snapshot. Its result is stored in query_snapshot_row, one row per
+    result row, with the values as JSON and the row's position. Reading a
+    snapshot is a single indexed read, whatever the query costs to run, so
+    the ROLLUP/CUBE reports and set membership queries, which are read far
+    more often than their data changes, open instantly.
+
+    Each snapshot is refreshed in one of two modes:
+
+    - full: the stored rows are replaced in one transaction, so readers see
+      the old result until the new one is committed.
+    - incremental: the new result is compared with the stored rows by key
+      (the key_columns, or the whole row when none are set) and only added,
+      changed and removed rows are written.
+
+    A snapshot is due for a refresh once refresh_interval seconds have
+    passed since its last refresh, or, with refresh_on_change, once a table
+    the query reads has been written. The manager registers table_changed()
+    with the backend's change_listeners, so it hears of every CRUD write made
+    in this process (at commit inside transaction()) and of writes reported
+    to db.table_changed(), such as the importers' and partition
+    maintenance's. Writes made by other processes are picked up by the
+    interval.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database holding the saved queries and snapshots.
+
+    default_interval : int
+        Refresh interval in seconds for snapshots created without one.
+
+    check_interval : int
+        Seconds between checks for due snapshots by the application.
+
+    Methods
+    -------
+    load():
+        Reads the snapshot definitions.
+
+    is_materialized(title):
+        Returns whether a saved query has a snapshot.
+
+    materialize(title, mode="full", key_columns=(), interval=None, on_change=True):
+        Creates or changes a snapshot and fills it.
+
+    drop(title):
+        Removes a snapshot; the query runs live again.
+
+    table_changed(table):
+        Marks snapshots reading a table as stale.
+
+    refresh(title, mode=None):
+        Re-runs a saved query and stores its result.
+
+    due():
+        Returns the titles of snapshots that need a refresh.
+
+    refresh_due():
+        Refreshes every snapshot that needs it.
+
+    read(title):
+        Returns a snapshot's rows and its freshness.
+
+    status(title):
+        Returns when a snapshot was refreshed and whether it is stale.
+
+    """
+
+    def __init__(self, db, default_interval = 3600, check_interval = 60):
+
+        """
+        Initialize the manager.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database holding the saved queries and snapshots.
+
+        default_interval : int, optional
+            Refresh interval in seconds for new snapshots (default is 3600).
+
+        check_interval : int, optional
+            Seconds between checks for due snapshots (default is 60).
+
+        """
+
+        self.db = db
+
+        self.default_interval = default_interval
+
+        self.check_interval = check_interval
+
+        self.snapshots = {}
+
+        # Titles whose source tables were written since their last refresh.
+
+        self.dirty = set()
+
+        self._lock = threading.RLock()
+
+        db.change_listeners.append(self.table_changed)
+
+    def load(self):
+
+        """
+        Reads the snapshot definitions, by query title.
+
+        """
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(
+                "SELECT s.query_id, q.query_title, q.query_string, s.refresh_mode, s.key_columns, "
+                "s.refresh_interval, s.refresh_on_change, s.column_names, s.row_count, s.refreshed_at, s.refresh_seconds "
+                "FROM query_snapshot s JOIN user_query q ON q.query_id = s.query_id"
+            )
+            rows = cursor.fetchall()
+
+        snapshots = {}
+
+        for row in rows:
+            snapshots[row["query_title"]] = {
+                "query_id": row["query_id"],
+                "query": row["query_string"],
+                "tables": self._tables(row["query_string"]),
+                "mode": row["refresh_mode"],
+                "key_columns": [col.strip() for col in (row["key_columns"] or "").split(",") if col.strip()],
+                "interval": row["refresh_interval"],
+                "on_change": bool(row["refresh_on_change"]),
+                "columns": json.loads(row["column_names"]) if row["column_names"] else [],
+                "row_count": row["row_count"],
+                "refreshed_at": _timestamp(row["refreshed_at"]),
+                "refresh_seconds": row["refresh_seconds"]
+            }
+
+        with self._lock:
+            self.snapshots = snapshots
+
+    def _tables(self, query):
+
+        # Backends with a schema catalog know which names are views; a query
+        # reading a view is marked stale by any write.
+
+        tables_read = getattr(self.db, "tables_read", None)
+
+        if tables_read is None:
+            return None
+
+        try:
+            return tables_read(query)
+        except Exception:
+            return None
+
+    def is_materialized(self, title):
+
+        with self._lock:
+            return title in self.snapshots
+
+    def materialize(self, title, mode = "full", key_columns = (), interval = None, on_change = True):
+
+        """
+        Creates or changes the snapshot of a saved query and fills it.
+
+        Parameters
+        ----------
+        title : str
+            The query_title of the saved query.
+
+        mode : str, optional
+            "full" or "incremental" (default is "full").
+
+        key_columns : sequence of str, optional
+            Result columns identifying a row for incremental refreshes
+            (default is empty, the whole row).
+
+        interval : int, optional
+            Seconds between scheduled refreshes (default is default_interval;
+            0 refreshes only on change or on request).
+
+        on_change : bool, optional
+            Whether writes to the query's tables make the snapshot due (default is True).
+
+        Returns
+        -------
+        int
+            The number of rows stored.
+
+        Raises
+        ------
+        ValueError
+            If the mode is unknown or no saved query has the title.
+
+        """
+
+        if mode not in ("full", "incremental"):
+            raise ValueError("mode must be 'full' or 'incremental'.")
+
+        ph = self.db.placeholder
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(f"SELECT query_id FROM user_query WHERE query_title = {ph}", (title,))
+            queries = cursor.fetchall()
+
+        if not queries:
+            raise ValueError(f"No saved query is titled {title!r}.")
+
+        query_id = queries[0]["query_id"]
+
+        interval = self.default_interval if interval is None else interval
+
+        settings = (mode, ",".join(key_columns) or None, interval or None, bool(on_change))
+
+        with self.db.transaction():
+            with self.db.connection() as (conn, cursor):
+                cursor.execute(f"SELECT query_id FROM query_snapshot WHERE query_id = {ph}", (query_id,))
+
+                if cursor.fetchall():
+                    cursor.execute(
+                        f"UPDATE query_snapshot SET refresh_mode = {ph}, key_columns = {ph}, refresh_interval = {ph}, refresh_on_change = {ph} WHERE query_id = {ph}",
+                        settings + (query_id,)
+                    )
+                else:
+                    cursor.execute(
+                        f"INSERT INTO query_snapshot (query_id, refresh_mode, key_columns, refresh_interval, refresh_on_change) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
+                        (query_id,) + settings
+                    )
+
+        self.db.table_changed("query_snapshot")
+
+        self.load()
+
+        return self.refresh(title, mode = "full")
+
+    def drop(self, title):
+
+        """
+        Removes the snapshot of a saved query, which then runs live again.
+
+        """
+
+        with self._lock:
+            snapshot = self.snapshots.pop(title, None)
+            self.dirty.discard(title)
+
+        if snapshot is None:
+            return
+
+        ph = self.db.placeholder
+
+        with self.db.transaction():
+            with self.db.connection() as (conn, cursor):
+                cursor.execute(f"DELETE FROM query_snapshot_row WHERE query_id = {ph}", (snapshot["query_id"],))
+                cursor.execute(f"DELETE FROM query_snapshot WHERE query_id = {ph}", (snapshot["query_id"],))
+
+        self.db.table_changed("query_snapshot")
+
+    def table_changed(self, table):
+
+        """
+        Marks the snapshots whose query reads a table as stale.
+
+        Parameters
+        ----------
+        table : str or None
+            The table that was written, or None when any table may have been
+            (e.g. by a stored procedure).
+
+        """
+
+        with self._lock:
+            for title, snapshot in self.snapshots.items():
+                if not snapshot["on_change"]:
+                    continue
+
+                tables = snapshot["tables"]
+
+                if table is None:
+                    reads = True
+                elif tables is None:
+                    reads = QueryCache.tables_read(snapshot["query"], [table])
+                else:
+                    reads = table.lower() in tables or QueryCache.ANY_TABLE in tables
+
+                if reads:
+                    self.dirty.add(title)
+
+    def refresh(self, title, mode = None):
+
+        """
+        Re-runs a saved query and stores its result as the snapshot.
+
+        Parameters
+        ----------
+        title : str
+            The query_title of a materialized query.
+
+        mode : str, optional
+            "full" or "incremental" (default is the snapshot's refresh_mode).
+
+        Returns
+        -------
+        int
+            The number of rows stored.
+
+        Raises
+        ------
+        KeyError
+            If the query is not materialized.
+
+        """
+
+        with self._lock:
+            snapshot = self.snapshots[title]
+
+            # Writes from here on belong to the next refresh.
+
+            self.dirty.discard(title)
+
+        mode = mode or snapshot["mode"]
+
+        started = time.monotonic()
+
+        try:
+            result = self.db.execute_query(snapshot["query"])
+        except Exception:
+            with self._lock:
+                self.dirty.add(title)
+            raise
+
+        columns = list(result[0].keys()) if result else snapshot["columns"]
+
+        rows = [[_dumps(value) for value in row] for row in result]
+
+        keyed = self._keyed(rows, columns, snapshot["key_columns"] if mode == "incremental" else [])
+
+        ph = self.db.placeholder
+
+        query_id = snapshot["query_id"]
+
+        insert = f"INSERT INTO query_snapshot_row (query_id, row_key, row_no, row_data) VALUES ({ph}, {ph}, {ph}, {ph})"
+
+        with self.db.transaction():
+            with self.db.connection() as (conn, cursor):
+                if mode == "full":
+                    cursor.execute(f"DELETE FROM query_snapshot_row WHERE query_id = {ph}", (query_id,))
+
+                    changes = [(query_id, key, row_no, data) for key, (row_no, data) in keyed.items()]
+                else:
+                    cursor.execute(f"SELECT row_key, row_no, row_data FROM query_snapshot_row WHERE query_id = {ph}", (query_id,))
+
+                    stored = {row["row_key"]: (row["row_no"], row["row_data"]) for row in cursor.fetchall()}
+
+                    removed = [key for key in stored if key not in keyed]
+
+                    for start in range(0, len(removed), WRITE_BATCH):
+                        batch = removed[start:start + WRITE_BATCH]
+                        cursor.execute(
+                            f"DELETE FROM query_snapshot_row WHERE query_id = {ph} AND row_key IN ({', '.join([ph] * len(batch))})",
+                            (query_id, *batch)
+                        )
+
+                    # Rows kept whose position or values changed are updated in place.
+
+                    changed = [(row_no, data, query_id, key) for key, (row_no, data) in keyed.items() if key in stored and stored[key] != (row_no, data)]
+
+                    for start in range(0, len(changed), WRITE_BATCH):
+                        cursor.executemany(
+                            f"UPDATE query_snapshot_row SET row_no = {ph}, row_data = {ph} WHERE query_id = {ph} AND row_key = {ph}",
+                            changed[start:start + WRITE_BATCH]
+                        )
+
+                    changes = [(query_id, key, row_no, data) for key, (row_no, data) in keyed.items() if key not in stored]
+
+                for start in range(0, len(changes), WRITE_BATCH):
+                    cursor.executemany(insert, changes[start:start + WRITE_BATCH])
+
+                refreshed_at = datetime.now().replace(microsecond = 0)
+
+                seconds = round(time.monotonic() - started, 3)
+
+                cursor.execute(
+                    f"UPDATE query_snapshot SET column_names = {ph}, row_count = {ph}, refreshed_at = {ph}, refresh_seconds = {ph} WHERE query_id = {ph}",
+                    (json.dumps(columns), len(rows), refreshed_at, seconds, query_id)
+                )
+
+        with self._lock:
+            snapshot.update(columns = columns, row_count = len(rows), refreshed_at = refreshed_at, refresh_seconds = seconds)
+
+        return len(rows)
+
+    def _keyed(self, rows, columns, key_columns):
+
+        """
+        Maps each encoded row to a stable key: a hash of its key columns (or
+        whole row) and its occurrence number among rows with the same values.
+
+        """
+
+        positions = [columns.index(col) for col in key_columns if col in columns]
+
+        keyed = {}
+
+        seen = {}
+
+        for row_no, values in enumerate(rows):
+            key_text = "\x1f".join(values[i] for i in positions) if positions else "\x1f".join(values)
+
+            seen[key_text] = seen.get(key_text, 0) + 1
+
+            key = hashlib.sha1(f"{key_text}\x1e{seen[key_text]}".encode("utf-8")).hexdigest()
+
+            keyed[key] = (row_no, "[" + ", ".join(values) + "]")
+
+        return keyed
+
+    def due(self):
+
+        """
+        Returns the titles of snapshots that were never refreshed, whose tables
+        changed, or whose refresh interval has passed.
+
+        """
+
+        now = datetime.now()
+
+        with self._lock:
+            return [
+                title for title, snapshot in self.snapshots.items()
+                if snapshot["refreshed_at"] is None
+                or title in self.dirty
+                or snapshot["interval"] and (now - snapshot["refreshed_at"]).total_seconds() >= snapshot["interval"]
+            ]
+
+    def refresh_due(self):
+
+        """
+        Refreshes every snapshot that needs it; one failing query does not stop the others.
+
+        Returns
+        -------
+        dict
+            Rows stored by title, or the error for titles that failed.
+
+        """
+
+        results = {}
+
+        for title in self.due():
+            try:
+                results[title] = self.refresh(title)
+            except Exception as e:
+                results[title] = e
+
+        return results
+
+    def read(self, title):
+
+        """
+        Returns the stored rows of a snapshot and its freshness.
+
+        Parameters
+        ----------
+        title : str
+            The query_title of a materialized query.
+
+        Returns
+        -------
+        tuple
+            The rows, as rows.Row objects in the order the query returned
+            them, and the dictionary returned by status().
+
+        """
+
+        with self._lock:
+            snapshot = self.snapshots[title]
+
+        ph = self.db.placeholder
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(f"SELECT row_data FROM query_snapshot_row WHERE query_id = {ph} ORDER BY row_no", (snapshot["query_id"],))
+            stored = cursor.fetchall()
+
+        cls = row_class(tuple(snapshot["columns"]))
+
+        rows = [cls(json.loads(row["row_data"], object_hook = _decode)) for row in stored]
+
+        return rows, self.status(title)
+
+    def status(self, title):
+
+        """
+        Returns when a snapshot was refreshed and whether it is stale.
+
+        Returns
+        -------
+        dict
+            refreshed_at (None if never), age in seconds, row_count,
+            refresh_seconds, changed (a table it reads was written since)
+            and stale (changed or older than its interval).
+
+        """
+
+        with self._lock:
+            snapshot = dict(self.snapshots[title])
+            changed = title in self.dirty
+
+        refreshed_at = snapshot["refreshed_at"]
+
+        age = (datetime.now() - refreshed_at).total_seconds() if refreshed_at else None
+
+        overdue = refreshed_at is None or bool(snapshot["interval"]) and age >= snapshot["interval"]
+
+        return {
+            "refreshed_at": refreshed_at,
+            "age": age,
+            "row_count": snapshot["row_count"],
+            "refresh_seconds": snapshot["refresh_seconds"],
+            "changed": changed,
+            "stale": changed or overdue
+        }
+
+def _dumps(value):
+
+    return json.dumps(value, default = _encode)
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Manage materialized snapshots of saved queries.")
+
+    parser.add_argument("--config", help = "path to config.ini")
+
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    commands.add_parser("list", help = "show materialized queries and their freshness")
+
+    add = commands.add_parser("add", help = "materialize a saved query")
+    add.add_argument("title", help = "query_title of the saved query")
+    add.add_argument("--incremental", action = "store_true", help = "write only changed rows on refresh")
+    add.add_argument("--key", help = "comma-separated result columns identifying a row for incremental refreshes")
+    add.add_argument("--interval", type = int, help = "seconds between scheduled refreshes (0: on request only)")
+    add.add_argument("--no-on-change", action = "store_true", help = "do not refresh when the query's tables change")
+
+    refresh = commands.add_parser("refresh", help = "refresh one snapshot, or every due snapshot")
+    refresh.add_argument("title", nargs = "?")
+
+    drop = commands.add_parser("drop", help = "stop materializing a saved query")
+    drop.add_argument("title")
+
+    run = commands.add_parser("run", help = "refresh due snapshots until interrupted")
+    run.add_argument("--poll", type = float, help = "seconds between checks (default is snapshot_check_interval)")
+
+    args = parser.parse_args(argv)
+
+    from backend import open_database
+
+    db = open_database(args.config)
+
+    try:
+        manager = open_snapshots(db, args.config)
+
+        if manager is None:
+            print("The database has no query_snapshot table; run add_query_snapshot.sql first.")
+            return 1
+
+        if args.command == "list":
+            for title in sorted(manager.snapshots):
+                status = manager.status(title)
+                refreshed = status["refreshed_at"].isoformat(" ") if status["refreshed_at"] else "never"
+                print(f"{title}: {status['row_count'] or 0} rows, refreshed {refreshed}{' (stale)' if status['stale'] else ''}")
+
+        elif args.command == "add":
+            keys = [col.strip() for col in (args.key or "").split(",") if col.strip()]
+            rows = manager.materialize(args.title, "incremental" if args.incremental else "full", keys, args.interval, not args.no_on_change)
+            print(f"{args.title}: {rows} rows")
+
+        elif args.command == "refresh":
+            results = {args.title: manager.refresh(args.title)} if args.title else manager.refresh_due()
+            for title, result in results.items():
+                print(f"{title}: {'error: ' + str(result) if isinstance(result, Exception) else str(result) + ' rows'}")
+
+        elif args.command == "drop":
+            manager.drop(args.title)
+
+        elif args.command == "run":
+            try:
+                while True:
+                    for title, result in manager.refresh_due().items():
+                        print(f"{title}: {'error: ' + str(result) if isinstance(result, Exception) else str(result) + ' rows'}", flush = True)
+                    time.sleep(args.poll or manager.check_interval)
+            except KeyboardInterrupt:
+                pass
+
+    finally:
+        db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
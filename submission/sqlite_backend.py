@@ -0,0 +1,1522 @@
+from anomaly import MetricStats
+from backend import DEFAULT_QUERY_TIMEOUTS, QueryInterruptedError, StorageBackend, classify_upserts, group_upserts, key_text
+from columnar import ColumnarResult
+from id_allocator import IdAllocator
+from rollup import MetricRollup
+from rows import fetch_rows
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Store dates as ISO text and DECIMAL(10,2) values as numbers, and read them
+# back as the same Python types mysql.connector returns.
+
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+sqlite3.register_adapter(Decimal, str)
+
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+
+sqlite3.register_converter("DECIMAL", lambda raw: Decimal(raw.decode()).quantize(Decimal("0.01")))
+
+def default_schema_path():
+
+    """
+    Returns the path of the MySQL schema script translated for SQLite.
+
+    Returns
+    -------
+    str
+        Path to create_value_database.sql next to this module.
+
+    """
+
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "create_value_database.sql")
+
+def _strip_comments(sql_text):
+
+    sql_text = re.sub(r"/\*.*?\*/", "", sql_text, flags = re.DOTALL)
+
+    return re.sub(r"--[^\n]*", "", sql_text)
+
+def _balanced(text, start):
+
+    """
+    Returns the index just past the parenthesis that closes the one at start.
+
+    """
+
+    depth = 0
+
+    quote = None
+
+    for i in range(start, len(text)):
+        char = text[i]
+
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+
+    raise ValueError("Unbalanced parentheses in schema script.")
+
+def _split_top_level(body):
+
+    parts = []
+
+    depth = 0
+
+    current = ""
+
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+
+    if current.strip():
+        parts.append(current.strip())
+
+    return parts
+
+def _translate_expression(expr):
+
+    """
+    Rewrites the MySQL date expressions used by generated columns and views.
+
+    """
+
+    # DATE_SUB(d, INTERVAL WEEKDAY(d) DAY): the Monday of d's week.
+
+    expr = re.sub(
+        r"DATE_SUB\(\s*(\w+)\s*,\s*INTERVAL\s+WEEKDAY\(\s*\1\s*\)\s+DAY\s*\)",
+        r"date(\1, '-' || ((CAST(strftime('%w', \1) AS INTEGER) + 6) % 7) || ' days')",
+        expr,
+        flags = re.IGNORECASE
+    )
+
+    expr = re.sub(
+        r"DATE_FORMAT\(\s*(\w+)\s*,\s*('[^']*')\s*\)",
+        r"strftime(\2, \1)",
+        expr,
+        flags = re.IGNORECASE
+    )
+
+    return re.sub(r"CURDATE\(\)", "date('now')", expr, flags = re.IGNORECASE)
+
+def _translate_column(definition):
+
+    match = re.match(r"(\w+)\s+INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY$", definition, re.IGNORECASE)
+
+    if match:
+        return f"{match.group(1)} INTEGER PRIMARY KEY AUTOINCREMENT"
+
+    match = re.match(r"(\w+)\s+ENUM\s*\((.*?)\)(.*)$", definition, re.IGNORECASE | re.DOTALL)
+
+    if match:
+        return f"{match.group(1)} TEXT{match.group(3)} CHECK ({match.group(1)} IN ({match.group(2)}))"
+
+    match = re.match(r"(UNIQUE)\s+KEY\s+\w+\s*(\(.*\))$", definition, re.IGNORECASE | re.DOTALL)
+
+    if match:
+        return f"UNIQUE {match.group(2)}"
+
+    if re.search(r"GENERATED\s+ALWAYS\s+AS", definition, re.IGNORECASE):
+        return _translate_expression(definition)
+
+    return definition
+
+def translate_schema(sql_text):
+
+    """
+    Translates the MySQL schema script into an equivalent SQLite script.
+
+    Tables, indexes and views are carried over. AUTO_INCREMENT keys become
+    INTEGER PRIMARY KEY AUTOINCREMENT, ENUM columns become TEXT with a CHECK
+    constraint, and the generated week_start/month_start columns are rewritten
+    with SQLite date functions. Triggers of the form
+    IF <condition> THEN SIGNAL ... SET MESSAGE_TEXT = '<message>' become
+    WHEN <condition> ... RAISE(ABORT, '<message>') triggers; other triggers,
+    functions, procedures and temporary tables are skipped. Index names are
+    prefixed with their table, since SQLite index names are schema-wide.
+
+    Parameters
+    ----------
+    sql_text : str
+        The contents of create_value_database.sql.
+
+    Returns
+    -------
+    str
+        A script suitable for sqlite3.Connection.executescript().
+
+    """
+
+    sql_text = _strip_comments(sql_text)
+
+    statements = []
+
+    for match in re.finditer(r"CREATE\s+TABLE\s+(\w+)\s*\(", sql_text, re.IGNORECASE):
+        table = match.group(1)
+        body_end = _balanced(sql_text, match.end() - 1)
+        body = sql_text[match.end():body_end - 1]
+        definitions = [_translate_column(d) for d in _split_top_level(body)]
+        statements.append(f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(definitions) + "\n);")
+
+    for match in re.finditer(r"CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)\s*\(([^)]*)\)\s*;", sql_text, re.IGNORECASE):
+        unique, name, table, columns = match.groups()
+        statements.append(f"CREATE {unique or ''}INDEX IF NOT EXISTS {table}_{name} ON {table} ({columns});")
+
+    trigger_pattern = (
+        r"CREATE\s+TRIGGER\s+(\w+)\s+(BEFORE|AFTER)\s+(INSERT|UPDATE|DELETE)\s+ON\s+(\w+)\s+"
+        r"FOR\s+EACH\s+ROW\s+BEGIN\s+IF\s+(.*?)\s+THEN\s+SIGNAL\s+SQLSTATE\s+'\d+'\s+"
+        r"SET\s+MESSAGE_TEXT\s*=\s*'([^']*)'\s*;\s*END\s+IF\s*;\s*END"
+    )
+
+    for match in re.finditer(trigger_pattern, sql_text, re.IGNORECASE | re.DOTALL):
+        name, timing, event, table, condition, message = match.groups()
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {name} {timing} {event} ON {table} FOR EACH ROW "
+            f"WHEN {condition} BEGIN SELECT RAISE(ABORT, '{message}'); END;"
+        )
+
+    for match in re.finditer(r"CREATE\s+VIEW\s+(\w+)\s+AS\s+(.*?);", sql_text, re.IGNORECASE | re.DOTALL):
+        name, select = match.groups()
+        statements.append(f"CREATE VIEW IF NOT EXISTS {name} AS {_translate_expression(select.strip())};")
+
+    return "\n\n".join(statements) + "\n"
+
+def _regexp(pattern, value):
+
+    return value is not None and re.search(pattern, str(value)) is not None
+
+class _StddevSamp:
+
+    # MySQL's STDDEV_SAMP as an aggregate and window function; inverse() lets
+    # SQLite slide a window frame without recomputing it.
+
+    def __init__(self):
+        self.n, self.total, self.squares = 0, 0.0, 0.0
+
+    def step(self, value):
+        if value is not None:
+            self.n, self.total, self.squares = self.n + 1, self.total + float(value), self.squares + float(value) ** 2
+
+    def inverse(self, value):
+        if value is not None:
+            self.n, self.total, self.squares = self.n - 1, self.total - float(value), self.squares - float(value) ** 2
+
+    def value(self):
+        if self.n < 2:
+            return None
+        return max(0.0, (self.squares - self.total ** 2 / self.n) / (self.n - 1)) ** 0.5
+
+    finalize = value
+
+class SQLiteDatabase(StorageBackend):
+
+    """
+    An embedded SQLite implementation of the value measurement database.
+
+    The schema is created from create_value_database.sql by translate_schema(),
+    including the generated week_start/month_start columns and the validation
+    triggers, so the application and benchmarks can run without a MySQL server.
+    The database can live in memory (the default) or in a file; a file that
+    already holds the schema is opened as is. REGEXP and STDDEV_SAMP, which
+    the saved queries use, are provided as Python functions.
+
+    Stored procedures are emulated in Python for the procedures defined in the
+    schema script. Query time limits and cancellation use SQLite's progress
+    handler, which stops only the query it is set for; the EXPLAIN cost guard is MySQL specific, so
+    check_cost is accepted and ignored.
+
+    Attributes
+    ----------
+    path : str
+        The database file path, or ":memory:".
+
+    conn : sqlite3.Connection
+        The connection, shared across threads under a lock.
+
+    Methods
+    -------
+    connection():
+        Context manager yielding the connection and a cursor.
+
+    transaction():
+        Context manager grouping CRUD calls into one commit, with savepoints when nested.
+
+    in_transaction():
+        Checks whether the calling thread is inside transaction().
+
+    get_columns(table):
+        Returns the column names of a table.
+
+    get_primary_keys(table):
+        Returns the primary key columns of a table.
+
+    insert(table, data):
+        Inserts a new record into the specified table.
+
+    insert_many(table, rows, batch_size=1000):
+        Inserts many records in batches with one commit per batch.
+
+    upsert_many(table, rows, key_columns, batch_size=1000):
+        Inserts or updates many records by natural key, reporting what changed.
+
+    key_columns(table):
+        Returns the rowid-alias and block-allocated key columns of a table.
+
+    reserve_ids(table, count):
+        Reserves a block of key values from the id_block table.
+
+    fetch_all(table):
+        Fetches all records from the specified table.
+
+    iter_table(table, chunk_size=1000):
+        Streams all records from the specified table.
+
+    fetch_page(table, after_key=None, limit=200, order_by=None, descending=False):
+        Fetches one page of records using keyset pagination.
+
+    page_order(table, order_by=None):
+        Returns the columns used to order and key pages of a table.
+
+    estimate_row_count(table):
+        Returns the number of rows in a table.
+
+    update(table, data, conditions):
+        Updates records in the specified table based on given conditions.
+
+    delete(table, conditions):
+        Deletes records from the specified table based on given conditions.
+
+    call_procedure(procedure_name, params=()):
+        Runs the Python emulation of a stored procedure.
+
+    execute_query(query_str, use_cache=False, check_cost=False, timeout=None, cancel_key=None):
+        Executes a query after validation.
+
+    query_timeout(categories=()):
+        Returns the time limit for a query flagged with the given categories.
+
+    iter_query(query_str, chunk_size=1000, params=()):
+        Streams the rows of a validated query.
+
+    query_columnar(query_str, params=(), decimal_mode="float", chunk_size=10000):
+        Runs a validated query and returns one NumPy array per column.
+
+    cancel_query(cancel_key):
+        Stops the query running under cancel_key.
+
+    close():
+        Closes the database connection.
+
+    """
+
+    dialect = "sqlite"
+
+    placeholder = "?"
+
+    def __init__(self, path = ":memory:", schema_path = None, query_timeouts = None, anomaly_settings = None):
+
+        """
+        Opens the database and creates the schema if it is missing.
+
+        Parameters
+        ----------
+        path : str, optional
+            Database file path, or ":memory:" for an in-memory database (default).
+
+        schema_path : str, optional
+            MySQL schema script to translate (default is default_schema_path()).
+
+        query_timeouts : dict, optional
+            Execution time limits in seconds by user_query category (default
+            is backend.DEFAULT_QUERY_TIMEOUTS).
+
+        anomaly_settings : dict, optional
+            threshold and min_count for anomaly.MetricStats (default is its defaults).
+
+        Raises
+        ------
+        Exception
+            If the database cannot be opened or the schema cannot be created.
+
+        """
+
+        self.path = path
+
+        self.query_timeouts = dict(query_timeouts or DEFAULT_QUERY_TIMEOUTS)
+
+        self.id_allocator = IdAllocator(self)
+
+        self._lock = threading.RLock()
+
+        self._tx_thread = None
+
+        self._depth = 0
+
+        # Tables written inside the current transaction, told to change_listeners when it ends.
+
+        self._changed = set()
+
+        # Cancel flags of cancellable queries running in execute_query, by cancel key.
+
+        self.running_queries = {}
+
+        self._cancel_lock = threading.Lock()
+
+        try:
+            self.conn = sqlite3.connect(path, detect_types = sqlite3.PARSE_DECLTYPES, check_same_thread = False)
+
+            self.conn.row_factory = lambda cursor, row: {d[0]: v for d, v in zip(cursor.description, row)}
+
+            self.conn.execute("PRAGMA foreign_keys = ON")
+
+            # SQLite parses "x REGEXP y" but leaves the function to the application.
+
+            self.conn.create_function("REGEXP", 2, _regexp, deterministic = True)
+
+            self.conn.create_window_function("STDDEV_SAMP", 1, _StddevSamp)
+
+            existing = self.conn.execute("SELECT COUNT(*) AS n FROM sqlite_master WHERE type = 'table'").fetchone()["n"]
+
+            if not existing:
+                with open(schema_path or default_schema_path(), encoding = "utf-8") as schema_file:
+                    self.conn.executescript(translate_schema(schema_file.read()))
+                self.conn.commit()
+
+            tables = {row["name"] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        except (sqlite3.Error, OSError) as e:
+            raise Exception(f"Database connection attempt failed: {e}")
+
+        self.metric_stats = MetricStats(self, **(anomaly_settings or {})) if "metric_stats" in tables else None
+
+        self.metric_rollup = MetricRollup(self) if "metric_rollup" in tables else None
+
+        # Callables told about every written table (see _invalidate), e.g. the snapshot manager.
+
+        self.change_listeners = []
+
+    @contextmanager
+    def connection(self):
+
+        """
+        Provides the connection and a fresh cursor while holding the connection lock.
+
+        Yields
+        ------
+        tuple
+            A (connection, cursor) pair.
+
+        """
+
+        with self._lock:
+            cursor = self.conn.cursor()
+
+            try:
+                yield self.conn, cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+
+        """
+        Runs the enclosed CRUD calls as one unit of work.
+
+        See database.Database.transaction. The connection lock is held for the
+        whole block, so other threads wait for the commit. Block reservations
+        made by the id allocator are part of the transaction here, so the
+        allocator's cached blocks are dropped on rollback.
+
+        Yields
+        ------
+        SQLiteDatabase
+            This database.
+
+        """
+
+        with self._lock:
+            if self.in_transaction():
+                self._depth += 1
+
+                savepoint = f"value_sp_{self._depth}"
+
+                self.conn.execute(f"SAVEPOINT {savepoint}")
+
+                try:
+                    yield self
+                except BaseException:
+                    self.conn.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    raise
+                else:
+                    self.conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+                finally:
+                    self._depth -= 1
+
+                return
+
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+
+            self._tx_thread = threading.get_ident()
+
+            try:
+                yield self
+
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                self.id_allocator.blocks.clear()
+                raise
+            finally:
+                self._tx_thread = None
+
+                changed, self._changed = self._changed, set()
+
+                for table in changed:
+                    self.table_changed(table)
+
+    def in_transaction(self):
+
+        """
+        Checks whether the calling thread is inside transaction().
+
+        """
+
+        return self._tx_thread == threading.get_ident()
+
+    def _invalidate(self, table = None):
+
+        # Tells change_listeners about a write, once the enclosing transaction
+        # ends; None stands for every table, e.g. after a stored procedure.
+
+        if self.in_transaction():
+            self._changed.add(table)
+        else:
+            self.table_changed(table)
+
+    def _commit(self, conn):
+
+        # Commits a CRUD statement unless a transaction() defers it.
+
+        if not self.in_transaction():
+            conn.commit()
+
+    def _rollback(self, conn):
+
+        if not self.in_transaction():
+            conn.rollback()
+
+    def get_columns(self, table):
+
+        """
+        Retrieves the column names of a given table, including generated columns.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            A list of column names.
+
+        Raises
+        ------
+        Exception
+            If the table does not exist.
+
+        """
+
+        return [col["name"] for col in self._table_info(table)]
+
+    def get_primary_keys(self, table):
+
+        """
+        Retrieves the primary key columns of a given table in key order.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        list
+            The primary key column names.
+
+        """
+
+        keys = [col for col in self._table_info(table) if col["pk"]]
+
+        return [col["name"] for col in sorted(keys, key = lambda col: col["pk"])]
+
+    def _table_info(self, table):
+
+        if not re.fullmatch(r"\w+", table):
+            raise Exception(f"value_db: unknown table: {table}")
+
+        with self.connection() as (conn, cursor):
+            cursor.execute(f"PRAGMA table_xinfo({table})")
+            info = cursor.fetchall()
+
+        if not info:
+            raise Exception(f"value_db: unknown table: {table}")
+
+        return info
+
+    def insert(self, table, data):
+
+        """
+        Inserts a new record into the specified table.
+
+        Key handling matches database.Database.insert: empty INTEGER PRIMARY KEY
+        values are left out so SQLite assigns them, an empty single-column INT
+        key such as plan_id is taken from the id allocator, and other key
+        columns must be supplied.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be inserted.
+
+        data : dict
+            A dictionary containing column names as keys and corresponding values.
+
+        Returns
+        -------
+        int or None
+            The new record's generated key, or None if every key value was supplied.
+
+        Raises
+        ------
+        Exception
+            If a required key value is missing or the insert fails, e.g. a
+            validation trigger rejects the row.
+
+        """
+
+        data = dict(data)
+
+        auto_keys, block_key = self.key_columns(table)
+
+        generated = None
+
+        for key in self.get_primary_keys(table):
+            if data.get(key) not in (None, ""):
+                continue
+
+            if key in auto_keys:
+                data.pop(key, None)
+            elif key == block_key:
+                generated = data[key] = self.id_allocator.next_id(table)
+            else:
+                raise Exception(f"value_db: insert: error: missing primary key value for {table}.{key}")
+
+        columns = ", ".join(data.keys())
+
+        placeholders = ", ".join(["?"] * len(data))
+
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    cursor.execute(sql, tuple(data.values()))
+
+                    if auto_keys and generated is None:
+                        generated = cursor.lastrowid
+
+                    for tracker in self.value_trackers:
+                        tracker.record(cursor, table, [data])
+
+                    self._commit(conn)
+                except sqlite3.Error:
+                    self._rollback(conn)
+                    raise
+        except sqlite3.Error as e:
+            raise Exception(f"value_db: insert: error: {e}")
+
+        self._invalidate(table)
+
+        return generated
+
+    def key_columns(self, table):
+
+        """
+        Describes how missing primary key values of a table are generated.
+
+        Returns
+        -------
+        tuple
+            The set of rowid-alias (INTEGER PRIMARY KEY) columns, and the key
+            column filled by the id allocator or None.
+
+        """
+
+        keys = [col for col in self._table_info(table) if col["pk"]]
+
+        if len(keys) != 1:
+            return set(), None
+
+        key = keys[0]
+
+        if key["type"].upper() == "INTEGER":
+            return {key["name"]}, None
+
+        if "INT" in key["type"].upper():
+            return set(), key["name"]
+
+        return set(), None
+
+    def reserve_ids(self, table, count):
+
+        """
+        Reserves count consecutive key values for a table from the id_block table.
+
+        Uses UPDATE ... RETURNING, so the block is claimed in one statement.
+        Every block starts past the table's current maximum key, so rows
+        inserted with explicit keys are never handed out again.
+
+        Parameters
+        ----------
+        table : str
+            A table whose key is filled by the id allocator.
+
+        count : int
+            Number of key values to reserve.
+
+        Returns
+        -------
+        int
+            The first reserved value; the block is [first, first + count).
+
+        """
+
+        _, key = self.key_columns(table)
+
+        if key is None:
+            raise Exception(f"value_db: reserve_ids: error: {table} has no block-allocated key")
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    cursor.execute(
+                        f"INSERT OR IGNORE INTO id_block (table_name, next_value) SELECT ?, COALESCE(MAX({key}), 0) + 1 FROM {table}",
+                        (table,)
+                    )
+
+                    cursor.execute(
+                        f"UPDATE id_block SET next_value = MAX(next_value, (SELECT COALESCE(MAX({key}), 0) + 1 FROM {table})) + ? WHERE table_name = ? RETURNING next_value",
+                        (count, table)
+                    )
+
+                    high = cursor.fetchone()["next_value"]
+
+                    self._commit(conn)
+                except sqlite3.Error:
+                    self._rollback(conn)
+                    raise
+        except sqlite3.Error as e:
+            raise Exception(f"value_db: reserve_ids: error: {e}")
+
+        return high - count
+
+    def insert_many(self, table, rows, batch_size = 1000):
+
+        """
+        Inserts many records in batches with one commit per batch.
+
+        Missing block-allocated keys are reserved for the whole load in one
+        round trip. Rows are grouped by their set of columns and each batch is sent through
+        executemany. A batch that fails, for example because a validation
+        trigger rejects a negative value, is rolled back and recorded in the
+        report while later batches still run. Inside transaction() a failed
+        batch raises instead.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be inserted.
+
+        rows : iterable of dict
+            Dictionaries mapping column names to values, one per record.
+
+        batch_size : int, optional
+            Maximum number of rows committed together (default is 1000).
+
+        Returns
+        -------
+        dict
+            A report with the number of rows "inserted", the number of "batches"
+            sent and a "failed" list describing each failed batch: its
+            columns, first_row (the position of its first row in rows), the
+            indexes of all its rows in rows, the number of rows and the error.
+
+        Raises
+        ------
+        ValueError
+            If batch_size is not a positive integer.
+
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        rows = self.fill_block_keys(table, rows)
+
+        # Each group holds the input positions of its rows, so failures can be
+        # reported against the caller's rows.
+
+        groups = {}
+
+        for i, row in enumerate(rows):
+            groups.setdefault(tuple(row.keys()), []).append(i)
+
+        report = {"inserted": 0, "batches": 0, "failed": []}
+
+        for columns, group in groups.items():
+            placeholders = ", ".join(["?"] * len(columns))
+
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+            for start in range(0, len(group), batch_size):
+                indexes = group[start:start + batch_size]
+
+                batch = [rows[i] for i in indexes]
+
+                values = [tuple(row[col] for col in columns) for row in batch]
+
+                report["batches"] += 1
+
+                try:
+                    with self.connection() as (conn, cursor):
+                        try:
+                            cursor.executemany(sql, values)
+
+                            for tracker in self.value_trackers:
+                                tracker.record(cursor, table, batch)
+
+                            self._commit(conn)
+                        except sqlite3.Error:
+                            self._rollback(conn)
+                            raise
+                    report["inserted"] += len(batch)
+                except sqlite3.Error as e:
+                    if self.in_transaction():
+                        raise Exception(f"value_db: insert_many: error: {e}")
+                    report["failed"].append({
+                        "columns": columns,
+                        "first_row": indexes[0],
+                        "indexes": indexes,
+                        "rows": len(batch),
+                        "error": str(e)
+                    })
+
+        self._invalidate(table)
+
+        return report
+
+    def upsert_many(self, table, rows, key_columns, batch_size = 1000):
+
+        """
+        Inserts or updates many records by natural key.
+
+        See database.Database.upsert_many; SQLite writes use
+        INSERT ... ON CONFLICT (key_columns) DO UPDATE.
+
+        Parameters
+        ----------
+        table : str
+            The table name where data should be upserted.
+
+        rows : iterable of dict
+            Dictionaries mapping column names to values, one per record.
+
+        key_columns : list of str
+            The natural key columns, covered by a unique constraint.
+
+        batch_size : int, optional
+            Maximum number of rows probed, sent and committed together (default is 1000).
+
+        Returns
+        -------
+        dict
+            A report with the numbers of rows "inserted", "updated" and
+            "unchanged", the number of "batches" and a "failed" list.
+
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        key_columns = list(key_columns)
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0, "batches": 0, "failed": []}
+
+        for columns, group in group_upserts(rows, key_columns).items():
+            value_columns = [col for col in columns if col not in key_columns]
+
+            action = "DO UPDATE SET " + ", ".join(f"{col} = excluded.{col}" for col in value_columns) if value_columns else "DO NOTHING"
+
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))}) ON CONFLICT ({', '.join(key_columns)}) {action}"
+
+            match = "(" + ", ".join(["?"] * len(key_columns)) + ")"
+
+            for start in range(0, len(group), batch_size):
+                indexes = [i for i, _ in group[start:start + batch_size]]
+
+                batch = [row for _, row in group[start:start + batch_size]]
+
+                probe = f"SELECT {', '.join(columns)} FROM {table} WHERE ({', '.join(key_columns)}) IN (VALUES " + ", ".join([match] * len(batch)) + ")"
+
+                report["batches"] += 1
+
+                try:
+                    with self.connection() as (conn, cursor):
+                        try:
+                            existing = self._fetch_rows(cursor, probe, tuple(row[col] for row in batch for col in key_columns))
+
+                            new, changed, unchanged = classify_upserts(batch, existing, key_columns)
+
+                            if new or changed:
+                                cursor.executemany(sql, [tuple(row[col] for col in columns) for row in new + changed])
+
+                            if self.value_trackers and (new or changed):
+                                replaced = {key_text(row, key_columns): row for row in existing}
+
+                                for tracker in self.value_trackers:
+                                    tracker.record(cursor, table, new + changed, [replaced[key_text(row, key_columns)] for row in changed])
+
+                            self._commit(conn)
+                        except sqlite3.Error:
+                            self._rollback(conn)
+                            raise
+                    report["inserted"] += len(new)
+                    report["updated"] += len(changed)
+                    report["unchanged"] += unchanged
+                except sqlite3.Error as e:
+                    if self.in_transaction():
+                        raise Exception(f"value_db: upsert_many: error: {e}")
+                    report["failed"].append({
+                        "columns": columns,
+                        "first_row": indexes[0],
+                        "indexes": indexes,
+                        "rows": len(batch),
+                        "error": str(e)
+                    })
+
+        self._invalidate(table)
+
+        return report
+
+    def fetch_all(self, table):
+
+        """
+        Fetches all records from the specified table.
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from.
+
+        Returns
+        -------
+        list
+            A list of rows.Row objects, which also support dictionary-style access.
+
+        Raises
+        ------
+        Exception
+            If an error occurs during the fetch.
+
+        """
+
+        columns = self.get_columns(table)
+
+        try:
+            with self.connection() as (conn, cursor):
+                return self._fetch_rows(cursor, f"SELECT {', '.join(columns)} FROM {table}")
+        except sqlite3.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+
+    def iter_table(self, table, chunk_size = 1000):
+
+        """
+        Streams all records from the specified table in chunks.
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from.
+
+        chunk_size : int, optional
+            Number of rows fetched at a time (default is 1000).
+
+        Yields
+        ------
+        dict
+            One dictionary per row.
+
+        """
+
+        columns = self.get_columns(table)
+
+        try:
+            yield from self._stream(f"SELECT {', '.join(columns)} FROM {table}", (), chunk_size)
+        except sqlite3.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+
+    def fetch_page(self, table, after_key = None, limit = 200, order_by = None, descending = False):
+
+        """
+        Fetches one page of records using keyset (seek) pagination.
+
+        See database.Database.fetch_page; SQLite supports the same row value
+        comparison, so the seek is written as (a, b) > (?, ?).
+
+        Parameters
+        ----------
+        table : str
+            The table name to fetch data from.
+
+        after_key : tuple or scalar, optional
+            Ordering key of the last row of the previous page (default fetches
+            the first page).
+
+        limit : int, optional
+            Maximum number of rows to return (default is 200).
+
+        order_by : list of str, optional
+            Leading ordering columns (default orders by the primary key only).
+
+        descending : bool, optional
+            Page from the highest key downward (default is False).
+
+        Returns
+        -------
+        list
+            A list of rows.Row objects, which also support dictionary-style access.
+
+        Raises
+        ------
+        ValueError
+            If an ordering column is unknown or after_key has the wrong length.
+
+        """
+
+        columns = self.get_columns(table)
+
+        order_columns = self.page_order(table, order_by)
+
+        unknown = [col for col in order_columns if col not in columns]
+
+        if unknown:
+            raise ValueError(f"Unknown order_by columns for {table}: {', '.join(unknown)}")
+
+        direction = "DESC" if descending else "ASC"
+
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+
+        params = []
+
+        if after_key is not None:
+            if not isinstance(after_key, (list, tuple)):
+                after_key = (after_key,)
+
+            if len(after_key) != len(order_columns):
+                raise ValueError(f"after_key must have {len(order_columns)} values for {table}.")
+
+            placeholders = ", ".join(["?"] * len(order_columns))
+
+            sql += f" WHERE ({', '.join(order_columns)}) {'<' if descending else '>'} ({placeholders})"
+
+            params.extend(after_key)
+
+        sql += " ORDER BY " + ", ".join(f"{col} {direction}" for col in order_columns)
+
+        sql += " LIMIT ?"
+
+        params.append(int(limit))
+
+        try:
+            with self.connection() as (conn, cursor):
+                return self._fetch_rows(cursor, sql, tuple(params))
+        except sqlite3.Error as e:
+            raise Exception(f"Error on attempted fetch from {table}: {e}")
+
+    def _fetch_rows(self, cursor, sql, params = ()):
+
+        """
+        Runs a statement with the dictionary row factory switched off and returns Row objects.
+
+        The cursor's row factory is restored afterwards, so the caller can keep
+        using it, e.g. for the metric statistics of an upsert.
+
+        """
+
+        row_factory = cursor.row_factory
+
+        cursor.row_factory = None
+
+        try:
+            cursor.execute(sql, params)
+
+            return fetch_rows(cursor)
+        finally:
+            cursor.row_factory = row_factory
+
+    def page_order(self, table, order_by = None):
+
+        """
+        Returns the order_by columns followed by any primary key columns not already listed.
+
+        """
+
+        order_columns = list(order_by or [])
+
+        for key in self.get_primary_keys(table):
+            if key not in order_columns:
+                order_columns.append(key)
+
+        return order_columns
+
+    def estimate_row_count(self, table):
+
+        """
+        Returns the number of rows in a table.
+
+        SQLite keeps no row estimate, so this counts; it is exact but scans the table.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table.
+
+        Returns
+        -------
+        int
+            The row count.
+
+        """
+
+        self._table_info(table)
+
+        try:
+            with self.connection() as (conn, cursor):
+                cursor.execute(f"SELECT COUNT(*) AS table_rows FROM {table}")
+                return cursor.fetchone()["table_rows"]
+        except sqlite3.Error as e:
+            raise Exception(f"value_db: estimate_row_count: error: {e}")
+
+    def update(self, table, data, conditions):
+
+        """
+        Updates the record identified by the primary key values in conditions.
+
+        Parameters
+        ----------
+        table : str
+            The table name where the update should occur.
+
+        data : dict
+            A dictionary of column names and values to update.
+
+        conditions : dict
+            A dictionary of primary key columns and values identifying the record.
+
+        Raises
+        ------
+        Exception
+            If there is nothing to update or the update fails.
+
+        """
+
+        primary_keys = self.get_primary_keys(table)
+
+        columns = [col for col in data.keys() if col not in primary_keys]
+
+        if not columns:
+            raise Exception(f"value_db: update: error: no columns to update in {table}")
+
+        updates = ", ".join(f"{col} = ?" for col in columns)
+
+        condition_str = " AND ".join(f"{col} = ?" for col in primary_keys)
+
+        sql = f"UPDATE {table} SET {updates} WHERE {condition_str}"
+
+        values = tuple(data[col] for col in columns) + tuple(conditions[col] for col in primary_keys)
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    record = {col: conditions[col] for col in primary_keys}
+
+                    stale = [tracker.affected(cursor, table, record) for tracker in self.value_trackers]
+
+                    cursor.execute(sql, values)
+
+                    # The update may move the row to another metric, plan or date.
+
+                    for tracker, keys in zip(self.value_trackers, stale):
+                        tracker.refresh(cursor, table, keys | tracker.affected(cursor, table, record))
+
+                    self._commit(conn)
+                except sqlite3.Error:
+                    self._rollback(conn)
+                    raise
+        except sqlite3.Error as e:
+            raise Exception(f"value_db: update: error: {e}")
+
+        self._invalidate(table)
+
+    def delete(self, table, conditions):
+
+        """
+        Deletes records from the specified table based on given conditions.
+
+        Parameters
+        ----------
+        table : str
+            The table name where deletion should occur.
+
+        conditions : dict
+            A dictionary of column names and values specifying which rows to delete.
+
+        Raises
+        ------
+        Exception
+            If the delete fails.
+
+        """
+
+        condition_str = " AND ".join(f"{col} = ?" for col in conditions.keys())
+
+        sql = f"DELETE FROM {table} WHERE {condition_str}"
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    stale = [tracker.affected(cursor, table, conditions) for tracker in self.value_trackers]
+
+                    cursor.execute(sql, tuple(conditions.values()))
+
+                    for tracker, keys in zip(self.value_trackers, stale):
+                        tracker.refresh(cursor, table, keys)
+
+                    self._commit(conn)
+                except sqlite3.Error:
+                    self._rollback(conn)
+                    raise
+        except sqlite3.Error as e:
+            raise Exception(f"value_db: delete: error: {e}")
+
+        self._invalidate(table)
+
+    # Python emulations of the stored procedures in create_value_database.sql.
+
+    PROCEDURES = {
+        "get_global_initiative_metrics": [
+            """SELECT m.metric_name, g.metric_date, g.actual_value
+               FROM metric m
+               JOIN global_metric_value g ON m.metric_id = g.metric_id
+               WHERE m.initiative_id = ?"""
+        ],
+        "get_plan_initiative_metrics": [
+            """SELECT m.metric_name, g.metric_date, g.actual_value
+               FROM metric m
+               JOIN plan_metric_value g ON m.metric_id = g.metric_id
+               WHERE m.initiative_id = ?"""
+        ],
+        "add_event": [
+            "INSERT INTO event (event_title, event_description, event_date) VALUES (?, ?, ?)",
+            "INSERT INTO initiative_event (initiative_id, event_id) VALUES (?, last_insert_rowid())"
+        ]
+    }
+
+    def call_procedure(self, procedure_name, params = ()):
+
+        """
+        Runs the Python emulation of a stored procedure.
+
+        Parameters
+        ----------
+        procedure_name : str
+            The name of the stored procedure to call.
+
+        params : tuple, optional
+            The paramaters to pass to the stored procedures (default is an empty tuple).
+
+        Returns
+        -------
+        list
+            A list of dictionaries representing the procedure's output.
+
+        Raises
+        ------
+        Exception
+            If the procedure is unknown or fails.
+
+        """
+
+        statements = self.PROCEDURES.get(procedure_name)
+
+        if statements is None:
+            raise Exception(f"Error calling procedure {procedure_name}: not available in the SQLite backend")
+
+        params = list(params)
+
+        rows = []
+
+        try:
+            with self.connection() as (conn, cursor):
+                try:
+                    for sql in statements:
+                        count = sql.count("?")
+                        cursor.execute(sql, params[:count])
+                        params = params[count:]
+                        if cursor.description:
+                            rows.extend(cursor.fetchall())
+                    self._commit(conn)
+                except sqlite3.Error:
+                    self._rollback(conn)
+                    raise
+        except sqlite3.Error as e:
+            raise Exception(f"Error calling procedure {procedure_name}: {e}")
+
+        self._invalidate()
+
+        return rows
+
+    def execute_query(self, query_str, use_cache = False, check_cost = False, timeout = None, cancel_key = None):
+
+        """
+        Executes a predefined or user-input SQL query after validation.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be executed.
+
+        use_cache : bool, optional
+            Accepted for compatibility with database.Database; results are not cached.
+
+        check_cost : bool, optional
+            Accepted for compatibility with database.Database; ignored.
+
+        timeout : float, optional
+            Execution time limit in seconds (default is no limit).
+
+        cancel_key : str, optional
+            Key cancel_query() can stop the query by (default is None, not cancellable).
+
+        Returns
+        -------
+        list
+            A list of rows.Row objects, which also support dictionary-style access.
+
+        Raises
+        ------
+        QueryInterruptedError
+            If the query hits its time limit or is cancelled.
+
+        Exception
+            If the query is unsafe or fails.
+
+        """
+
+        if not self.validate_query(query_str):
+            raise Exception(f"invalid or unsafe query.")
+
+        deadline = time.monotonic() + timeout if timeout else None
+
+        cancelled = threading.Event()
+
+        try:
+            with self.connection() as (conn, cursor):
+                if deadline or cancel_key is not None:
+                    conn.set_progress_handler(lambda: cancelled.is_set() or deadline is not None and time.monotonic() > deadline, 10000)
+
+                if cancel_key is not None:
+                    with self._cancel_lock:
+                        self.running_queries[cancel_key] = cancelled
+                try:
+                    return self._fetch_rows(cursor, query_str)
+                finally:
+                    if cancel_key is not None:
+                        with self._cancel_lock:
+                            self.running_queries.pop(cancel_key, None)
+
+                    conn.set_progress_handler(None, 0)
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                if deadline and time.monotonic() > deadline:
+                    raise QueryInterruptedError(f"Query stopped after its {timeout:g} second time limit.", timed_out = True)
+                raise QueryInterruptedError("Query cancelled.", timed_out = False)
+            raise Exception(f"Error executing query: {e}")
+        except sqlite3.Error as e:
+            raise Exception(f"Error executing query: {e}")
+
+    def iter_query(self, query_str, chunk_size = 1000, params = ()):
+
+        """
+        Streams the rows of a predefined or user-input SQL query after validation.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be executed.
+
+        chunk_size : int, optional
+            Number of rows fetched at a time (default is 1000).
+
+        params : tuple, optional
+            Values for any ? placeholders in the query (default is an empty tuple).
+
+        Yields
+        ------
+        dict
+            One dictionary per row.
+
+        Notes
+        -----
+        The connection lock is held until the generator is exhausted or closed.
+
+        """
+
+        if not self.validate_query(query_str):
+            raise Exception(f"invalid or unsafe query.")
+
+        try:
+            yield from self._stream(query_str, params, chunk_size)
+        except sqlite3.Error as e:
+            raise Exception(f"Error executing query: {e}")
+
+    def query_columnar(self, query_str, params = (), decimal_mode = "float", chunk_size = 10000):
+
+        """
+        Runs a predefined or user-input SQL query and returns its result by column.
+
+        See database.Database.query_columnar. Rows are read as tuples, bypassing
+        the dictionary row factory.
+
+        Parameters
+        ----------
+        query_str : str
+            String representing the query to be executed.
+
+        params : tuple, optional
+            Values for any ? placeholders in the query (default is an empty tuple).
+
+        decimal_mode : str, optional
+            "float" (default) or "scaled"; see columnar.ColumnarResult.
+
+        chunk_size : int, optional
+            Number of rows fetched at a time (default is 10000).
+
+        Returns
+        -------
+        ColumnarResult
+            The column header and one array per column.
+
+        """
+
+        if not self.validate_query(query_str):
+            raise Exception(f"invalid or unsafe query.")
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+
+        try:
+            with self.connection() as (conn, cursor):
+                cursor.row_factory = None
+
+                cursor.execute(query_str, params)
+
+                columns = [d[0] for d in cursor.description]
+
+                chunks = iter(lambda: cursor.fetchmany(chunk_size), [])
+
+                return ColumnarResult.from_chunks(columns, chunks, decimal_mode = decimal_mode)
+        except sqlite3.Error as e:
+            raise Exception(f"Error executing query: {e}")
+
+    def _stream(self, sql, params, chunk_size):
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+
+        with self.connection() as (conn, cursor):
+            cursor.execute(sql, params)
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                yield from rows
+
+    def cancel_query(self, cancel_key):
+
+        """
+        Stops the query running through execute_query under cancel_key, if any.
+
+        The query's progress handler sees the flag and aborts it; other
+        statements on the connection are not affected.
+
+        Parameters
+        ----------
+        cancel_key : str
+            The key the query was started with.
+
+        Returns
+        -------
+        bool
+            True if a query was signalled.
+
+        """
+
+        with self._cancel_lock:
+            cancelled = self.running_queries.get(cancel_key)
+
+            if cancelled is None:
+                return False
+
+            cancelled.set()
+
+        return True
+
+    def close(self):
+
+        """
+        Closes the database connection.
+
+        """
+
+        self.conn.close()
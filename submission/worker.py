@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+
+class Worker:
+
+    """
+    A utility class that runs database and export work off the Tkinter thread.
+
+    Work is submitted under an action key (for example "refresh:initiative").
+    It runs on a thread pool, and its result or exception is handed back to
+    a callback on the Tkinter thread by polling with root.after, so callbacks
+    can safely touch widgets. While any work is in flight, a status bar shows
+    an indeterminate progress bar and the window cursor changes to a watch.
+    An action key that is already running cannot be submitted again, which
+    protects against double clicks.
+
+    Attributes
+    ----------
+    root : tk.Tk
+        The Tkinter root window used for scheduling callbacks.
+
+    executor : concurrent.futures.ThreadPoolExecutor
+        The thread pool running submitted work.
+
+    in_flight : dict
+        Mapping of action key to its running future.
+
+    Methods
+    -------
+    build_status_bar(parent):
+        Creates the status bar used as the busy indicator.
+
+    submit(key, func, *args, on_success=None, on_error=None):
+        Runs func(*args) in the background unless key is already running.
+
+    is_busy(key):
+        Checks whether work for an action key is still running.
+
+    shutdown():
+        Stops accepting work and releases the thread pool.
+
+    """
+
+    def __init__(self, root, max_workers = 4, poll_interval = 50):
+
+        """
+        Initialize the worker.
+
+        Parameters
+        ----------
+        root : tk.Tk
+            The Tkinter root window.
+
+        max_workers : int, optional
+            Number of background threads (default is 4).
+
+        poll_interval : int, optional
+            Milliseconds between checks for finished work (default is 50).
+
+        """
+
+        self.root = root
+
+        self.executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "value_worker")
+
+        self.poll_interval = poll_interval
+
+        self.in_flight = {}
+
+        self.status_label = None
+
+        self.progress = None
+
+    def build_status_bar(self, parent):
+
+        """
+        Create the status bar shown at the bottom of the window.
+
+        Parameters
+        ----------
+        parent : tk.Widget
+            The widget that holds the status bar.
+
+        Returns
+        -------
+        ttk.Frame
+            The status bar frame, ready to be packed by the caller.
+
+        """
+
+        status_frame = ttk.Frame(parent)
+
+        self.status_label = ttk.Label(status_frame, text = "Ready")
+
+        self.status_label.pack(side = "left", padx = 10, pady = 2)
+
+        self.progress = ttk.Progressbar(status_frame, mode = "indeterminate", length = 150)
+
+        return status_frame
+
+    def submit(self, key, func, *args, on_success = None, on_error = None):
+
+        """
+        Run func(*args) in the background and deliver the outcome on the Tkinter thread.
+
+        Parameters
+        ----------
+        key : str
+            Action key; only one piece of work per key may run at a time.
+
+        func : callable
+            The blocking function to run.
+
+        *args
+            Positional arguments for func.
+
+        on_success : callable, optional
+            Called with the return value of func.
+
+        on_error : callable, optional
+            Called with the exception raised by func.
+
+        Returns
+        -------
+        bool
+            True if the work was submitted, False if the key was already running.
+
+        """
+
+        if self.is_busy(key):
+            return False
+
+        self.in_flight[key] = self.executor.submit(func, *args)
+
+        self._update_indicator()
+
+        self.root.after(self.poll_interval, self._poll, key, on_success, on_error)
+
+        return True
+
+    def is_busy(self, key):
+
+        """
+        Check whether work for an action key is still running.
+
+        Parameters
+        ----------
+        key : str
+            The action key.
+
+        Returns
+        -------
+        bool
+            True if the key has work in flight.
+
+        """
+
+        return key in self.in_flight
+
+    def shutdown(self):
+
+        """
+        Stop accepting work and release the thread pool without waiting.
+
+        """
+
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+    def _poll(self, key, on_success, on_error):
+
+        future = self.in_flight.get(key)
+
+        if future is None:
+            return
+
+        if not future.done():
+            self.root.after(self.poll_interval, self._poll, key, on_success, on_error)
+            return
+
+        del self.in_flight[key]
+
+        self._update_indicator()
+
+        error = future.exception()
+
+        if error is not None:
+            if on_error:
+                on_error(error)
+        elif on_success:
+            on_success(future.result())
+
+    def _update_indicator(self):
+
+        busy = len(self.in_flight)
+
+        if self.status_label is not None:
+            self.status_label.config(text = f"Working ({busy})..." if busy else "Ready")
+
+        if self.progress is not None:
+            if busy and not self.progress.winfo_ismapped():
+                self.progress.pack(side = "right", padx = 10, pady = 2)
+                self.progress.start(10)
+            elif not busy and self.progress.winfo_ismapped():
+                self.progress.stop()
+                self.progress.pack_forget()
+
+        self.root.config(cursor = "watch" if busy else "")
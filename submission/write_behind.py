@@ -0,0 +1,707 @@
+import configparser
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from backend import default_config_path
+
+# Errors that mean the server could not be reached or was busy, rather than
+# that the write itself was refused. Driver error classes such as
+# OperationalError also cover permanent errors (a missing column, bad SQL),
+# so those are matched by MySQL error number or by sqlite3 message; a few
+# exception types are always transient. Types are matched by name so both
+# drivers are recognized, including when re-raised by the backends.
+
+TRANSIENT_ERRORS = ("PoolError", "ConnectionError", "TimeoutError")
+
+# Too many connections, server shutdown, lock wait timeout, deadlock, can't
+# connect, unknown host, server gone away, lost connection, and a session
+# closed by the server.
+
+TRANSIENT_ERRNOS = {1040, 1053, 1205, 1213, 2002, 2003, 2005, 2006, 2013, 2055, 4031}
+
+TRANSIENT_MESSAGES = ("database is locked", "database table is locked", "unable to open database file", "disk i/o error", "connection not available")
+
+# Writes per statement when reading or recording receipts.
+
+RECEIPT_BATCH = 500
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_write (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    conditions TEXT,
+    original TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS queue_info (
+    queue_id TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS write_conflict (
+    seq INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    conditions TEXT,
+    reason TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+);
+"""
+
+def open_write_queue(db, config_file_path = None):
+
+    """
+    Creates the write-behind queue described by the [value] section of config.ini.
+
+    Parameters
+    ----------
+    db : StorageBackend
+        The database the queued writes are sent to.
+
+    config_file_path : str, optional
+        Path to the config file (default is backend.default_config_path()).
+
+    Returns
+    -------
+    WriteBehindQueue or None
+        A started queue, or None when write_behind is off (the default).
+
+    """
+
+    config_file_path = config_file_path or default_config_path()
+
+    config = configparser.ConfigParser()
+
+    config.read(config_file_path)
+
+    section = config["value"] if config.has_section("value") else config[config.default_section]
+
+    if not section.getboolean("write_behind", fallback = False):
+        return None
+
+    path = section.get("write_queue_path", fallback = "write_queue.db")
+
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(config_file_path)), path)
+
+    queue = WriteBehindQueue(
+        db,
+        path,
+        flush_interval = section.getfloat("write_flush_interval", fallback = 1),
+        batch_size = section.getint("write_batch_size", fallback = 100),
+        max_backoff = section.getfloat("write_max_backoff", fallback = 60)
+    )
+
+    queue.start()
+
+    return queue
+
+def is_transient(error):
+
+    """
+    Checks whether an error, or an error it was raised from, is a connection failure or a busy server.
+
+    """
+
+    while error is not None:
+        if type(error).__name__ in TRANSIENT_ERRORS:
+            return True
+        if not isinstance(error, OSError) and getattr(error, "errno", None) in TRANSIENT_ERRNOS:
+            return True
+        if type(error).__name__ in ("OperationalError", "InterfaceError") and any(message in str(error).lower() for message in TRANSIENT_MESSAGES):
+            return True
+        error = error.__cause__ or error.__context__
+
+    return False
+
+def _encode(value):
+
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+
+    raise TypeError(f"Cannot queue a value of type {type(value).__name__}.")
+
+def _decode(obj):
+
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+
+    return obj
+
+def _dumps(value):
+
+    return None if value is None else json.dumps(value, default = _encode)
+
+def _loads(text):
+
+    return None if text is None else json.loads(text, object_hook = _decode)
+
+def _same_as_shown(current, shown):
+
+    # Treeview values come back as text or numbers, so compare loosely: "" is
+    # NULL and 12.5 matches DECIMAL 12.50.
+
+    current = "" if current is None else current
+
+    if str(current) == str(shown):
+        return True
+
+    try:
+        return Decimal(str(current)) == Decimal(str(shown))
+    except (InvalidOperation, ValueError):
+        return False
+
+class WriteConflict(Exception):
+
+    """
+    Raised when a queued write is refused by the server or overtaken by another user's change.
+
+    """
+
+class WriteBehindQueue:
+
+    """
+    A durable local queue that saves form edits at once and sends them to the database in the background.
+
+    Each add or update is committed to an embedded SQLite file before the
+    call returns, so an edit survives a crash or a lost VPN link. A
+    background thread sends queued writes in order, in batches of up to
+    batch_size, each batch in one database transaction. Successive updates
+    of the same record in a batch are coalesced into one statement.
+
+    When the server cannot be reached the batch stays queued and is retried
+    with exponential backoff, up to max_backoff seconds between attempts.
+    A write the server refuses (e.g. a constraint violation), an update of a
+    record deleted meanwhile, or an update of a record another user changed
+    since it was shown is not retried: it is moved to the write_conflict
+    table and reported by take_conflicts(). Other writes of the batch are
+    unaffected, as each write runs under its own savepoint.
+
+    Every applied write records a receipt of its queue sequence numbers in
+    the server's write_receipt table, in the same transaction, under a
+    queue_id kept in the queue file. If the application stops between the
+    server commit and the removal of the batch from the queue file, the
+    batch is sent again at the next start and the writes already receipted
+    are skipped, so inserts into AUTO_INCREMENT tables are not duplicated.
+    Receipts below the oldest queued write are deleted as batches are sent.
+
+    Attributes
+    ----------
+    db : StorageBackend
+        The database the queued writes are sent to.
+
+    path : str
+        Path of the SQLite queue file.
+
+    flush_interval : float
+        Seconds between checks for queued writes when idle.
+
+    batch_size : int
+        Maximum number of queued writes sent in one transaction.
+
+    max_backoff : float
+        Longest wait, in seconds, between retries while the server is unreachable.
+
+    max_attempts : int
+        Failed attempts after which a write that keeps failing is set aside as a conflict.
+
+    Methods
+    -------
+    start():
+        Starts the background flush thread.
+
+    enqueue_insert(table, data):
+        Queues a new record.
+
+    enqueue_update(table, data, conditions, original=None):
+        Queues a change to an existing record.
+
+    pending_count():
+        Returns the number of writes not yet sent.
+
+    take_conflicts():
+        Returns and clears the conflicts found since the last call.
+
+    take_flushed_tables():
+        Returns and clears the tables written since the last call.
+
+    flush():
+        Sends one batch of queued writes.
+
+    close(timeout=5):
+        Stops the background thread after a last flush attempt.
+
+    """
+
+    def __init__(self, db, path, flush_interval = 1, batch_size = 100, max_backoff = 60, max_attempts = 10):
+
+        """
+        Open or create the queue file.
+
+        Parameters
+        ----------
+        db : StorageBackend
+            The database the queued writes are sent to.
+
+        path : str
+            Path of the SQLite queue file; writes left from an earlier session are sent first.
+
+        flush_interval : float, optional
+            Seconds between checks for queued writes when idle (default is 1).
+
+        batch_size : int, optional
+            Maximum number of writes per transaction (default is 100).
+
+        max_backoff : float, optional
+            Longest wait between retries, in seconds (default is 60).
+
+        max_attempts : int, optional
+            Failed attempts before a write is set aside as a conflict (default is 10).
+
+        """
+
+        self.db = db
+
+        self.path = path
+
+        self.flush_interval = flush_interval
+
+        self.batch_size = batch_size
+
+        self.max_backoff = max_backoff
+
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+
+        self._wake = threading.Event()
+
+        self._stop = threading.Event()
+
+        self._thread = None
+
+        self.conflicts = []
+
+        self.flushed_tables = set()
+
+        self.failures = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+        self.conn.execute("PRAGMA synchronous=FULL")
+
+        self.conn.executescript(QUEUE_SCHEMA)
+
+        row = self.conn.execute("SELECT queue_id FROM queue_info").fetchone()
+
+        if row is None:
+            row = (str(uuid.uuid4()),)
+            self.conn.execute("INSERT INTO queue_info (queue_id) VALUES (?)", row)
+
+        self.queue_id = row[0]
+
+    def start(self):
+
+        """
+        Starts the background flush thread.
+
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._run, name = "value_write_behind", daemon = True)
+            self._thread.start()
+
+    def enqueue_insert(self, table, data):
+
+        """
+        Queues a new record for insertion.
+
+        Parameters
+        ----------
+        table : str
+            The table to insert into.
+
+        data : dict
+            Column names and values, as passed to db.insert().
+
+        Returns
+        -------
+        int
+            The queue sequence number of the write.
+
+        """
+
+        return self._enqueue("insert", table, data)
+
+    def enqueue_update(self, table, data, conditions, original = None):
+
+        """
+        Queues a change to an existing record.
+
+        Parameters
+        ----------
+        table : str
+            The table to update.
+
+        data : dict
+            Column names and new values, as passed to db.update().
+
+        conditions : dict
+            Primary key values of the record.
+
+        original : dict, optional
+            Values of the changed columns as the user last saw them. When given,
+            the update is reported as a conflict instead of applied if another
+            user has changed any of those columns in the meantime.
+
+        Returns
+        -------
+        int
+            The queue sequence number of the write.
+
+        """
+
+        return self._enqueue("update", table, data, conditions, original)
+
+    def _enqueue(self, operation, table, data, conditions = None, original = None):
+
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO pending_write (operation, table_name, data, conditions, original, queued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (operation, table, _dumps(data), _dumps(conditions), _dumps(original), datetime.now().isoformat(timespec = "seconds"))
+            )
+
+        self._wake.set()
+
+        return cursor.lastrowid
+
+    def pending_count(self):
+
+        """
+        Returns the number of queued writes not yet sent.
+
+        """
+
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pending_write").fetchone()[0]
+
+    def take_conflicts(self):
+
+        """
+        Returns and clears the conflicts found since the last call.
+
+        Returns
+        -------
+        list of dict
+            One dictionary per conflict, with "seq", "operation", "table",
+            "data", "conditions" and "reason".
+
+        """
+
+        with self._lock:
+            conflicts, self.conflicts = self.conflicts, []
+
+        return conflicts
+
+    def take_flushed_tables(self):
+
+        """
+        Returns and clears the set of tables written since the last call.
+
+        """
+
+        with self._lock:
+            tables, self.flushed_tables = self.flushed_tables, set()
+
+        return tables
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                sent = self.flush()
+                self.failures = 0
+            except Exception:
+                self.failures += 1
+                sent = 0
+
+            if self.failures:
+                delay = min(self.max_backoff, self.flush_interval * 2 ** self.failures)
+            elif sent:
+                continue
+            else:
+                delay = self.flush_interval
+
+            self._wake.wait(delay)
+
+            self._wake.clear()
+
+    def flush(self):
+
+        """
+        Sends one batch of queued writes in a single transaction.
+
+        Returns
+        -------
+        int
+            The number of queued writes taken off the queue (sent or set aside).
+
+        Raises
+        ------
+        Exception
+            If the server could not be reached; the batch stays queued.
+
+        """
+
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT seq, operation, table_name, data, conditions, original, attempts FROM pending_write ORDER BY seq LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()
+
+        if not rows:
+            return 0
+
+        writes = self._coalesce([
+            {
+                "seqs": [seq], "operation": operation, "table": table, "data": _loads(data),
+                "conditions": _loads(conditions), "original": _loads(original), "attempts": attempts
+            }
+            for seq, operation, table, data, conditions, original, attempts in rows
+        ])
+
+        conflicts = []
+
+        current = None
+
+        try:
+            with self.db.transaction():
+                received = self._receipts([row[0] for row in rows])
+
+                for write in writes:
+                    if received.intersection(write["seqs"]):
+                        continue
+
+                    current = write
+
+                    try:
+                        with self.db.transaction():
+                            self._apply(write)
+                            self._receipt(write["seqs"])
+                    except Exception as e:
+                        if is_transient(e):
+                            raise
+                        conflicts.append((write, str(e)))
+
+                current = None
+
+        except Exception as e:
+            self._failed(current, e)
+            raise
+
+        with self._lock:
+            now = datetime.now().isoformat(timespec = "seconds")
+
+            self.conn.execute("BEGIN IMMEDIATE")
+
+            for write, reason in conflicts:
+                self._record_conflict(write, reason, now)
+
+            self.conn.execute(f"DELETE FROM pending_write WHERE seq IN ({', '.join('?' * len(rows))})", [row[0] for row in rows])
+
+            self.conn.execute("COMMIT")
+
+            self.flushed_tables.update(write["table"] for write in writes)
+
+        return len(rows)
+
+    def _receipts(self, seqs):
+
+        # Receipts of writes sent before the batch are no longer needed: those
+        # writes were removed from the queue file.
+
+        ph = self.db.placeholder
+
+        received = set()
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(f"DELETE FROM write_receipt WHERE queue_id = {ph} AND seq < {ph}", (self.queue_id, min(seqs)))
+
+            for start in range(0, len(seqs), RECEIPT_BATCH):
+                batch = seqs[start:start + RECEIPT_BATCH]
+
+                cursor.execute(
+                    f"SELECT seq FROM write_receipt WHERE queue_id = {ph} AND seq IN ({', '.join([ph] * len(batch))})",
+                    (self.queue_id, *batch)
+                )
+
+                received.update(row["seq"] for row in cursor.fetchall())
+
+        return received
+
+    def _receipt(self, seqs):
+
+        ph = self.db.placeholder
+
+        with self.db.connection() as (conn, cursor):
+            cursor.executemany(f"INSERT INTO write_receipt (queue_id, seq) VALUES ({ph}, {ph})", [(self.queue_id, seq) for seq in seqs])
+
+    def _coalesce(self, writes):
+
+        # Updates of the same record are merged into the last of them, which
+        # keeps every merged change after any write it may depend on. The
+        # earliest shown value of a column is kept for the conflict check.
+
+        merged = []
+
+        last_update = {}
+
+        for write in writes:
+            if write["operation"] == "update":
+                key = (write["table"], tuple(sorted((col, str(value)) for col, value in write["conditions"].items())))
+
+                previous = last_update.get(key)
+
+                if previous is not None:
+                    earlier = merged[previous]
+
+                    merged[previous] = None
+
+                    original = None
+
+                    if earlier["original"] is not None or write["original"] is not None:
+                        original = {**(write["original"] or {}), **(earlier["original"] or {})}
+
+                    write = {
+                        **write,
+                        "seqs": earlier["seqs"] + write["seqs"],
+                        "data": {**earlier["data"], **write["data"]},
+                        "original": original
+                    }
+
+                last_update[key] = len(merged)
+
+            merged.append(write)
+
+        return [write for write in merged if write is not None]
+
+    def _apply(self, write):
+
+        if write["operation"] == "insert":
+            self.db.insert(write["table"], write["data"])
+            return
+
+        table, data, conditions = write["table"], write["data"], write["conditions"]
+
+        columns = list(data)
+
+        where = " AND ".join(f"{col} = {self.db.placeholder}" for col in conditions)
+
+        with self.db.connection() as (conn, cursor):
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", tuple(conditions.values()))
+
+            current = cursor.fetchone()
+
+        if current is None:
+            raise WriteConflict(f"The {table} record {conditions} no longer exists.")
+
+        changed = [
+            col for col, shown in (write["original"] or {}).items()
+            if col in current and not _same_as_shown(current[col], shown) and not _same_as_shown(current[col], data.get(col))
+        ]
+
+        if changed:
+            raise WriteConflict(f"The {table} record {conditions} was changed by another user ({', '.join(changed)}).")
+
+        self.db.update(table, data, conditions)
+
+    def _failed(self, write, error):
+
+        # A write that keeps failing, e.g. on an error that only looks like a
+        # connection problem, is set aside so it cannot block the queue forever.
+
+        try:
+            self.db.reconnect()
+        except Exception:
+            pass
+
+        if write is None:
+            return
+
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE pending_write SET attempts = attempts + 1 WHERE seq IN ({', '.join('?' * len(write['seqs']))})",
+                write["seqs"]
+            )
+
+            if write["attempts"] + 1 >= self.max_attempts:
+                now = datetime.now().isoformat(timespec = "seconds")
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._record_conflict(write, f"Gave up after {self.max_attempts} attempts: {error}", now)
+                self.conn.execute(f"DELETE FROM pending_write WHERE seq IN ({', '.join('?' * len(write['seqs']))})", write["seqs"])
+                self.conn.execute("COMMIT")
+
+    def _record_conflict(self, write, reason, now):
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO write_conflict (seq, operation, table_name, data, conditions, reason, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (write["seqs"][-1], write["operation"], write["table"], _dumps(write["data"]), _dumps(write["conditions"]), reason, now)
+        )
+
+        self.conflicts.append({
+            "seq": write["seqs"][-1],
+            "operation": write["operation"],
+            "table": write["table"],
+            "data": write["data"],
+            "conditions": write["conditions"],
+            "reason": reason
+        })
+
+    def close(self, timeout = 5):
+
+        """
+        Stops the background thread, giving it up to timeout seconds to send what is queued.
+
+        Writes still queued stay in the queue file and are sent at the next start.
+
+        """
+
+        deadline = time.monotonic() + timeout
+
+        while self._thread is not None and self.failures == 0 and time.monotonic() < deadline and self.pending_count():
+            self._wake.set()
+            time.sleep(0.05)
+
+        self._stop.set()
+
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join(max(0, deadline - time.monotonic()))
+
+        with self._lock:
+            self.conn.close()